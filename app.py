@@ -1,16 +1,57 @@
+import csv
+import datetime
+import io
+import math
 import os
 
 from flask import (
     Flask,
+    Response,
+    jsonify,
     redirect,
     render_template,
     request,
     session,
+    stream_template,
+    stream_with_context,
 )
-from werkzeug.security import check_password_hash, generate_password_hash
 
-from helpers import apology, login_required, lookup, usd
+from helpers import (
+    HTTP_TIMEOUT,
+    alookup,
+    alookup_many,
+    apology,
+    fetch_quote,
+    http_session,
+    lookup_latency,
+    login_required,
+    lookup,
+    price_bars,
+    quote_cache,
+    quote_view,
+    set_async_quotes,
+    set_coalesce_processes,
+    set_price_listener,
+    set_price_history,
+    set_record_prices,
+    set_quote_provider,
+    set_quote_store,
+    stream_csv,
+    stream_jsonl,
+    usd,
+)
+import helpers
+import metrics
+from circuit_breaker import CircuitBreaker, GuardedProvider, TokenBucket
 from db_module import Database
+from orders import ORDER_COLUMNS, OrderEngine
+from portfolio import load_positions, value_portfolio
+from price_history import PriceHistory
+from quote_providers import UpstreamError, create_provider
+from quote_store import PriceRefresher, QuoteStore
+from snapshots import performance as performance_series, update_snapshots
+from trading import TradeError, execute_batch, execute_trade
+from users import PasswordHasher, PasswordHasherBusy, UserCache
 
 
 # Configure application
@@ -21,9 +62,158 @@ app.jinja_env.filters["usd"] = usd
 
 app.config["SECRET_KEY"] = "default_secret_key"
 
+# Configure quote provider: "yahoo", "local" or "local:<prices.csv|prices.db>"
+app.config["QUOTE_PROVIDER"] = os.environ.get("QUOTE_PROVIDER", "yahoo")
+app.config["QUOTE_PROVIDER_LATENCY"] = float(os.environ.get("QUOTE_PROVIDER_LATENCY", 0))
+
+# Stop calling the upstream when most recent calls fail, probing again after
+# a cool-down, and optionally cap outbound calls per second (0 = no limit).
+# Meanwhile lookups fall back to last known prices.
+app.config["QUOTE_BREAKER_FAILURE_RATE"] = float(os.environ.get("QUOTE_BREAKER_FAILURE_RATE", 0.5))
+app.config["QUOTE_BREAKER_MIN_CALLS"] = int(os.environ.get("QUOTE_BREAKER_MIN_CALLS", 10))
+app.config["QUOTE_BREAKER_WINDOW"] = float(os.environ.get("QUOTE_BREAKER_WINDOW", 30))
+app.config["QUOTE_BREAKER_RESET_TIMEOUT"] = float(os.environ.get("QUOTE_BREAKER_RESET_TIMEOUT", 30))
+app.config["QUOTE_RATE_LIMIT"] = float(os.environ.get("QUOTE_RATE_LIMIT", 0))
+app.config["QUOTE_RATE_BURST"] = float(os.environ.get("QUOTE_RATE_BURST", 0))
+quote_breaker = CircuitBreaker(
+    failure_rate=app.config["QUOTE_BREAKER_FAILURE_RATE"],
+    min_calls=app.config["QUOTE_BREAKER_MIN_CALLS"],
+    window=app.config["QUOTE_BREAKER_WINDOW"],
+    reset_timeout=app.config["QUOTE_BREAKER_RESET_TIMEOUT"],
+)
+quote_bucket = None
+if app.config["QUOTE_RATE_LIMIT"] > 0:
+    quote_bucket = TokenBucket(
+        app.config["QUOTE_RATE_LIMIT"], burst=app.config["QUOTE_RATE_BURST"] or None
+    )
+set_quote_provider(
+    GuardedProvider(
+        create_provider(
+            app.config["QUOTE_PROVIDER"],
+            session=http_session,
+            timeout=HTTP_TIMEOUT,
+            latency=app.config["QUOTE_PROVIDER_LATENCY"],
+        ),
+        quote_breaker,
+        quote_bucket,
+    )
+)
+
+# Let /, /quote, /buy and the order routes await upstream quotes on an
+# event loop rather than blocking on the lookup thread pool. Off, those
+# views run synchronously and never start a loop
+app.config["ASYNC_QUOTES"] = os.environ.get("ASYNC_QUOTES", "") == "1"
+set_async_quotes(app.config["ASYNC_QUOTES"])
+
+# Orders per /orders/batch request
+app.config["ORDERS_BATCH_MAX"] = int(os.environ.get("ORDERS_BATCH_MAX", 100))
+
+# Rows per /history page
+app.config["HISTORY_PAGE_SIZE"] = 50
+app.config["HISTORY_MAX_PAGE_SIZE"] = 500
+
 # Configure SQLite database
-db_path = os.path.join(os.path.dirname(__file__), "finance.db")
-db = Database(db_path)
+db_path = os.environ.get(
+    "DATABASE_PATH", os.path.join(os.path.dirname(__file__), "finance.db")
+)
+db = Database(db_path, pool_size=int(os.environ.get("DATABASE_POOL_SIZE", 5)))
+
+# Cache user records (cash) per process; see UserCache for invalidation
+app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 60))
+user_cache = UserCache(db, ttl=app.config["USER_CACHE_TTL"])
+
+# Password hashing parameters (any werkzeug method, e.g. "pbkdf2:sha256:600000"
+# or "scrypt:32768:8:1"). Existing hashes are upgraded at the next login.
+# Checks run on a pool of PASSWORD_WORKERS threads (default: one per CPU),
+# and logins beyond PASSWORD_MAX_PENDING queued checks are turned away.
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2")
+app.config["PASSWORD_WORKERS"] = int(os.environ.get("PASSWORD_WORKERS", 0))
+app.config["PASSWORD_MAX_PENDING"] = int(os.environ.get("PASSWORD_MAX_PENDING", 64))
+password_hasher = PasswordHasher(
+    app.config["PASSWORD_HASH_METHOD"],
+    workers=app.config["PASSWORD_WORKERS"] or None,
+    max_pending=app.config["PASSWORD_MAX_PENDING"],
+)
+
+# Daily bars for /api/prices. With RECORD_PRICE_HISTORY=1 each fetched quote
+# is also kept as that day's close for /performance; off by default since
+# it turns every upstream quote into a database write.
+app.config["RECORD_PRICE_HISTORY"] = os.environ.get("RECORD_PRICE_HISTORY", "") == "1"
+price_history = PriceHistory(db)
+set_price_history(price_history)
+set_record_prices(app.config["RECORD_PRICE_HISTORY"])
+
+# Match resting limit and stop orders on a background thread, against every
+# quote fetched from the upstream and, every ORDER_POLL_INTERVAL seconds
+# (0 = never), the current price of each symbol with open orders
+app.config["ORDER_POLL_INTERVAL"] = float(os.environ.get("ORDER_POLL_INTERVAL", 60))
+
+
+def order_filled(order):
+    user_cache.invalidate(order["user_id"])
+
+
+def queue_price_tick(symbol, price):
+    order_engine.submit(symbol, price)
+
+
+order_engine = OrderEngine(
+    db, lookup=lookup, poll_interval=app.config["ORDER_POLL_INTERVAL"], on_fill=order_filled
+)
+order_engine.start()
+set_price_listener(queue_price_tick)
+
+# Refresh held symbols in the background and serve them from the database.
+# Disabled unless PRICE_REFRESH_INTERVAL is set.
+app.config["PRICE_REFRESH_INTERVAL"] = float(os.environ.get("PRICE_REFRESH_INTERVAL", 0))
+app.config["PRICE_REFRESH_RATE"] = float(os.environ.get("PRICE_REFRESH_RATE", 5))
+if app.config["PRICE_REFRESH_INTERVAL"] > 0:
+    quote_store = QuoteStore(db, max_age=app.config["PRICE_REFRESH_INTERVAL"] * 2)
+    set_quote_store(quote_store)
+    price_refresher = PriceRefresher(
+        db,
+        quote_store,
+        fetch_quote,
+        interval=app.config["PRICE_REFRESH_INTERVAL"],
+        rate=app.config["PRICE_REFRESH_RATE"],
+    )
+    price_refresher.start()
+
+# Let worker processes share upstream quote fetches through a lease per
+# symbol in the database. Uses the refresher's quote store if there is one.
+app.config["QUOTE_COALESCE_PROCESSES"] = os.environ.get("QUOTE_COALESCE_PROCESSES", "") == "1"
+if app.config["QUOTE_COALESCE_PROCESSES"]:
+    if app.config["PRICE_REFRESH_INTERVAL"] <= 0:
+        quote_store = QuoteStore(db, max_age=quote_cache.ttl)
+        set_quote_store(quote_store)
+    set_coalesce_processes(True)
+
+
+def metrics_gauges():
+    """Quote cache and upstream counters exported on /metrics."""
+    gauges = {f"finance_quote_cache_{key}": value for key, value in quote_cache.stats().items()}
+    latency = lookup_latency.snapshot()
+    gauges["finance_quote_upstream_calls"] = latency["calls"]
+    gauges["finance_quote_upstream_errors"] = latency["errors"]
+    gauges["finance_quote_upstream_seconds_sum"] = latency["total"]
+    gauges["finance_quote_upstream_seconds_max"] = latency["max"]
+    if app.config["QUOTE_COALESCE_PROCESSES"]:
+        gauges["finance_quote_coalesced_processes"] = quote_store.coalesced
+    for key, value in quote_breaker.stats().items():
+        gauges[f"finance_quote_breaker_{key}"] = value
+    if quote_bucket is not None:
+        gauges["finance_quote_rate_limit"] = quote_bucket.rate
+    gauges["finance_quote_stale_served"] = helpers.stale_quotes
+    for key, value in user_cache.stats().items():
+        gauges[f"finance_user_cache_{key}"] = value
+    gauges["finance_password_checks_pending"] = password_hasher.pending()
+    return gauges
+
+
+# Opt-in request timing, Server-Timing headers and a Prometheus /metrics route
+app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "") == "1"
+if app.config["METRICS_ENABLED"]:
+    metrics.init_app(app, gauges=metrics_gauges)
 
 
 @app.after_request
@@ -37,64 +227,43 @@ def after_request(response):
 
 @app.route("/")
 @login_required
-def index():
+@quote_view
+async def index():
     """Show portfolio of stocks"""
-    user_id = session.get("user_id")
+    portfolio = await get_portfolio(session.get("user_id"))
 
-    # Get user's cash
-    query = "SELECT cash FROM users WHERE id = ?"
-    rows = db.execute_query(query, user_id)
-
-    if not rows:
+    if portfolio is None:
         return apology("Failed to retrieve user ID", 500)
 
-    cash = round(rows[0]["cash"], 2)
+    return render_template("index.html", portfolio=portfolio)
 
-    # Calculate total asset
-    total = cash
 
-    # Get the user's transaction records
-    query = "SELECT symbol, price, shares FROM transactions WHERE user_id = ?"
-    rows = db.execute_query(query, user_id)
+@app.route("/api/portfolio")
+@login_required
+@quote_view
+async def api_portfolio():
+    """Return portfolio valuation as JSON"""
+    portfolio = await get_portfolio(session.get("user_id"))
 
-    if not rows:
-        return render_template(
-            "index.html",
-            cash="{:.2f}".format(cash),
-            total="{:.2f}".format(total),
-        )
+    if portfolio is None:
+        return jsonify({"error": "Failed to retrieve user ID"}), 500
 
-    # Calculate shares, holding, and current price
-    shares = {}
-    holding = {}
-    current_price = {}
+    return jsonify(portfolio)
 
-    # Collect unique symbols
-    unique_symbols = set(row["symbol"] for row in rows)
 
-    # Retrieve current prices for unique symbols
-    for symbol in unique_symbols:
-        current_price[symbol] = "{:.2f}".format(lookup(symbol)["price"])
+async def get_portfolio(user_id):
+    """Value a user's holdings at current prices, or None if no such user."""
+    user = user_cache.get(user_id, session.get("user_version"))
 
-    for row in rows:
-        symbol = row["symbol"]
-        total_price = round(float(row["price"] * row["shares"]), 2)
+    if user is None:
+        return None
 
-        shares.setdefault(symbol, 0)
-        holding.setdefault(symbol, 0)
+    holdings = load_positions(db, user_id)
 
-        shares[symbol] += row["shares"]
-        holding[symbol] += total_price
-        total += total_price
+    # Retrieve current prices for open positions concurrently
+    quotes = await alookup_many(row["symbol"] for row in holdings if row["shares"] > 0)
 
-    return render_template(
-        "index.html",
-        shares=shares,
-        current_price=current_price,
-        holding={symbol: "{:.2f}".format(value) for symbol, value in holding.items()},
-        cash="{:.2f}".format(cash),
-        total="{:.2f}".format(total),
-    )
+    return value_portfolio(user["cash"], holdings, quotes)
 
 
 def validate_symbol(symbol):
@@ -128,7 +297,8 @@ def validate_shares(shares):
 
 @app.route("/buy", methods=["GET", "POST"])
 @login_required
-def buy():
+@quote_view
+async def buy():
     """Buy shares of stock"""
     # User reached route via POST
     if request.method == "POST":
@@ -146,35 +316,26 @@ def buy():
             return apology(error_message, error_code)
 
         symbol = symbol.upper()
-        quote = lookup(symbol)
+        try:
+            quote = await alookup(symbol)
+        except UpstreamError:
+            return apology("quotes unavailable, try again later", 503)
 
         if not quote:
             return apology("invalid symbol", 400)
 
-        # Get the user cash
-        query = "SELECT cash FROM users WHERE id = ?"
-        args = session.get("user_id")
-        rows = db.execute_query(query, args)
-
-        if not rows:
-            return apology("Failed to retrieve user ID", 500)
-
-        cash = rows[0]["cash"]
-
-        shares = int(shares)
-        buy = float(quote["price"]) * shares
-        if buy > cash:
-            return apology("can't afford", 400)
-
-        # Update transaction
-        query = "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (?, ?, ?, ?)"
-        args = (session.get("user_id"), symbol, float(quote["price"]), shares)
-        db.execute_query(query, *args)
+        # Never trade at a last known price
+        if quote.get("stale"):
+            return apology("quotes unavailable, try again later", 503)
 
-        # Update user cash
-        query = "UPDATE users SET cash = ? WHERE id = ?"
-        args = (cash - buy, session.get("user_id"))
-        db.execute_query(query, *args)
+        # Check cash, record the purchase and update cash atomically
+        try:
+            execute_trade(
+                db, session.get("user_id"), symbol, float(quote["price"]), int(shares)
+            )
+        except TradeError as e:
+            return apology(e.message, e.code)
+        session["user_version"] = user_cache.invalidate(session.get("user_id"))
 
         # Redirect user to home page
         return redirect("/")
@@ -184,19 +345,189 @@ def buy():
         return render_template("buy.html")
 
 
+def parse_history_cursor(cursor):
+    """Split a "timestamp,id" history cursor, or return None if malformed."""
+    try:
+        timestamp, row_id = cursor.rsplit(",", 1)
+        return timestamp, int(row_id)
+    except ValueError:
+        return None
+
+
+def history_cursor(row):
+    return f"{row['timestamp']},{row['id']}"
+
+
 @app.route("/history")
 @login_required
 def history():
     """Show history of transactions"""
     user_id = session.get("user_id")
-    # Retrieve all transaction records of the user ordered by timestamp
     query = (
-        "SELECT symbol, price, shares, timestamp FROM transactions WHERE user_id = ?"
-        "ORDER BY timestamp ASC"
+        "SELECT id, symbol, price, shares, timestamp FROM transactions WHERE user_id = ? "
+    )
+
+    # Stream the full history straight from the cursor
+    if request.args.get("stream"):
+        query += "ORDER BY timestamp ASC, id ASC"
+        rows = db.fetch_iter(query, user_id)
+        response = Response(stream_template("history.html", transactions=rows))
+        # Return the connection to the pool even if the client goes away
+        response.call_on_close(rows.close)
+        return response
+
+    # Validate page size
+    try:
+        limit = int(request.args.get("limit", app.config["HISTORY_PAGE_SIZE"]))
+    except ValueError:
+        return apology("invalid page size", 400)
+    limit = min(max(limit, 1), app.config["HISTORY_MAX_PAGE_SIZE"])
+
+    after = request.args.get("after")
+    before = request.args.get("before")
+    if before or after:
+        cursor = parse_history_cursor(before or after)
+        if not cursor:
+            return apology("invalid cursor", 400)
+
+    # Keyset pagination on (timestamp, id); fetch one extra row to tell
+    # whether another page exists in that direction
+    if before:
+        query += "AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?"
+        rows = db.fetch_all(query, user_id, *cursor, limit + 1)
+        has_prev, has_next = len(rows) > limit, True
+        transactions = rows[:limit][::-1]
+    elif after:
+        query += "AND (timestamp, id) > (?, ?) ORDER BY timestamp ASC, id ASC LIMIT ?"
+        rows = db.fetch_all(query, user_id, *cursor, limit + 1)
+        has_prev, has_next = True, len(rows) > limit
+        transactions = rows[:limit]
+    else:
+        query += "ORDER BY timestamp ASC, id ASC LIMIT ?"
+        rows = db.fetch_all(query, user_id, limit + 1)
+        has_prev, has_next = False, len(rows) > limit
+        transactions = rows[:limit]
+
+    return render_template(
+        "history.html",
+        transactions=transactions,
+        limit=limit,
+        prev_cursor=history_cursor(transactions[0]) if has_prev and transactions else None,
+        next_cursor=history_cursor(transactions[-1]) if has_next and transactions else None,
+    )
+
+
+@app.route("/history/export")
+@login_required
+def history_export():
+    """Export history of transactions as CSV or JSON lines"""
+    user_id = session.get("user_id")
+    export_format = request.args.get("format", "csv")
+    start = request.args.get("start")
+    end = request.args.get("end")
+    symbol = request.args.get("symbol")
+
+    if export_format not in ("csv", "jsonl"):
+        return apology("invalid format", 400)
+
+    query = "SELECT id, symbol, price, shares, timestamp FROM transactions WHERE user_id = ?"
+    args = [user_id]
+
+    # Optional date range, both ends inclusive
+    try:
+        if start:
+            query += " AND timestamp >= ?"
+            args.append(datetime.date.fromisoformat(start).isoformat())
+        if end:
+            query += " AND timestamp < date(?, '+1 day')"
+            args.append(datetime.date.fromisoformat(end).isoformat())
+    except ValueError:
+        return apology("invalid date", 400)
+
+    # Optional symbol filter
+    if symbol:
+        error_message, error_code = validate_symbol(symbol)
+        if error_message:
+            return apology(error_message, error_code)
+        query += " AND symbol = ?"
+        args.append(symbol.upper())
+
+    query += " ORDER BY timestamp ASC, id ASC"
+
+    # Stream rows straight from the cursor without a Content-Length, so the
+    # response goes out chunked
+    columns = ("id", "symbol", "price", "shares", "timestamp")
+    rows = db.fetch_iter(query, *args)
+    if export_format == "csv":
+        body, mimetype = stream_csv(rows, columns), "text/csv"
+    else:
+        body, mimetype = stream_jsonl(rows, columns), "application/x-ndjson"
+
+    response = Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename=history.{export_format}"
+        },
+    )
+    # Return the connection to the pool even if the download is cut short
+    response.call_on_close(rows.close)
+    return response
+
+
+@app.route("/performance")
+@login_required
+def performance():
+    """Return daily account value as JSON"""
+    user_id = session.get("user_id")
+
+    try:
+        start = request.args.get("start")
+        end = request.args.get("end")
+        start = datetime.date.fromisoformat(start) if start else None
+        end = datetime.date.fromisoformat(end) if end else None
+    except ValueError:
+        return jsonify({"error": "invalid date"}), 400
+
+    # Snapshots are brought up to date by `flask update-snapshots`
+    return jsonify({"series": performance_series(db, user_id, start, end)})
+
+
+@app.route("/api/prices/<symbol>")
+@login_required
+def api_prices(symbol):
+    """Return daily OHLCV bars for a symbol as JSON columns"""
+    error_message, error_code = validate_symbol(symbol)
+    if error_message:
+        return jsonify({"error": error_message}), error_code
+
+    # Default to the last year
+    try:
+        end = request.args.get("end")
+        end = datetime.date.fromisoformat(end) if end else price_history.today()
+        start = request.args.get("start")
+        start = datetime.date.fromisoformat(start) if start else end - datetime.timedelta(days=365)
+    except ValueError:
+        return jsonify({"error": "invalid date"}), 400
+
+    bars = price_bars(symbol, start, end)
+
+    # JSON has no NaN; missing values become null
+    return jsonify(
+        {
+            column: [None if value != value else value for value in values]
+            for column, values in bars.items()
+        }
     )
-    transactions = db.execute_query(query, user_id)
 
-    return render_template("history.html", transactions=transactions)
+
+@app.cli.command("update-snapshots")
+def update_snapshots_command():
+    """Precompute daily account value snapshots for every user."""
+    written = update_snapshots(
+        db, history=price_history, fetch_history=helpers.quote_provider.history
+    )
+    print(f"{written} snapshots written")
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -217,18 +548,28 @@ def login():
             return apology("must provide password", 403)
 
         # Query database for username
-        rows = db.execute_query(
-            "SELECT * FROM users WHERE username = ?", request.form.get("username")
+        row = db.fetch_one(
+            "SELECT id, username, hash, cash FROM users WHERE username = ?",
+            request.form.get("username"),
         )
+        if not row:
+            return apology("invalid username and/or password", 403)
 
-        # Ensure username exists and password is correct
-        if len(rows) != 1 or not check_password_hash(
-            rows[0]["hash"], request.form.get("password")
-        ):
+        # Ensure password is correct
+        try:
+            matched, new_hash = password_hasher.verify(row["hash"], request.form.get("password"))
+        except PasswordHasherBusy:
+            return apology("too many login attempts, try again later", 503)
+        if not matched:
             return apology("invalid username and/or password", 403)
 
+        # Upgrade hashes made with old parameters
+        if new_hash is not None:
+            db.execute_query("UPDATE users SET hash = ? WHERE id = ?", new_hash, row["id"])
+
         # Remember which user has logged in
-        session["user_id"] = rows[0]["id"]
+        session["user_id"] = row["id"]
+        user_cache.put({"id": row["id"], "username": row["username"], "cash": row["cash"]})
 
         # Redirect user to home page
         return redirect("/")
@@ -251,7 +592,8 @@ def logout():
 
 @app.route("/quote", methods=["GET", "POST"])
 @login_required
-def quote():
+@quote_view
+async def quote():
     """Get stock quote."""
     # User reached route via POST
     if request.method == "POST":
@@ -261,7 +603,10 @@ def quote():
         if not symbol:
             return apology("must provide symbol", 400)
 
-        quote = lookup(symbol)
+        try:
+            quote = await alookup(symbol)
+        except UpstreamError:
+            return apology("quotes unavailable, try again later", 503)
 
         if quote:
             quote["price"] = "{:.2f}".format(quote["price"])
@@ -306,10 +651,14 @@ def register():
         if password != confirmation:
             return apology("password doesn't match", 400)
 
+        try:
+            password_hash = password_hasher.hash(password)
+        except PasswordHasherBusy:
+            return apology("too many registrations, try again later", 503)
+
         # Insert new user into database
         query = "INSERT INTO users (username, hash) VALUES (?, ?)"
-        args = (username, generate_password_hash(password, method="pbkdf2"))
-        db.execute_query(query, *args)
+        db.execute_query(query, username, password_hash)
 
         # Get the user ID for the newly registered user
         query = "SELECT id FROM users WHERE username = ?"
@@ -351,40 +700,30 @@ def sell():
 
         symbol = symbol.upper()
         # Look up for the symbol
-        quote = lookup(symbol)
+        try:
+            quote = lookup(symbol)
+        except UpstreamError:
+            return apology("quotes unavailable, try again later", 503)
 
         if not quote:
             return apology("invalid symbol", 400)
 
-        # Check if the user owns enough shares of stock
-        user_id = session.get("user_id")
-        query = "SELECT shares FROM transactions WHERE user_id = ? AND symbol = ?"
-        args = (user_id, symbol)
-        rows = db.execute_query(query, *args)
-
-        shares_hold = 0
-        shares_sell = int(shares_sell)
-        for row in rows:
-            shares_hold += row["shares"]
-
-        if shares_hold < shares_sell:
-            return apology("too many shares", 400)
-
-        # Get selling price
-        price_sell = round(float(quote["price"] * shares_sell), 2)
-
-        # Update user's cash by adding the selling price
-        query = "UPDATE users SET cash = cash + ? WHERE id = ?"
-        args = (
-            price_sell,
-            user_id,
-        )
-        db.execute_query(query, *args)
-
-        # Update transaction record
-        query = "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (?, ?, ?, ?)"
-        args = (user_id, symbol, quote["price"], -shares_sell)
-        db.execute_query(query, *args)
+        # Never trade at a last known price
+        if quote.get("stale"):
+            return apology("quotes unavailable, try again later", 503)
+
+        # Check holdings, record the sale and update cash atomically
+        try:
+            execute_trade(
+                db,
+                session.get("user_id"),
+                symbol,
+                float(quote["price"]),
+                -int(shares_sell),
+            )
+        except TradeError as e:
+            return apology(e.message, e.code)
+        session["user_version"] = user_cache.invalidate(session.get("user_id"))
 
         # Redirect user to home page
         return redirect("/")
@@ -393,12 +732,230 @@ def sell():
     else:
         user_id = session.get("user_id")
         # Fetch the symbols of stocks the user currently holds
-        query = "SELECT DISTINCT symbol FROM transactions WHERE user_id = ?"
-        rows = db.execute_query(query, user_id)
+        query = "SELECT symbol FROM holdings WHERE user_id = ? AND shares > 0"
+        rows = db.fetch_all(query, user_id)
         symbols = [item["symbol"] for item in rows]
 
         return render_template("sell.html", symbols=symbols)
 
 
+def parse_batch():
+    """
+    Read a basket of orders from a JSON body or an uploaded CSV file.
+
+    JSON is {"mode": ..., "orders": [{"symbol", "side", "shares"}]}; a CSV
+    upload ("file") has a symbol,side,shares header and takes the mode from
+    the form. Returns (orders, mode), or (None, error message).
+    """
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get("orders"), list):
+            return None, "expected an orders list"
+        orders = body["orders"]
+        if not all(isinstance(order, dict) for order in orders):
+            return None, "expected an orders list"
+        return orders, body.get("mode", "atomic")
+
+    upload = request.files.get("file")
+    if upload is None:
+        return None, "expected JSON or a CSV file"
+    try:
+        text = upload.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return None, "invalid CSV file"
+    orders = [
+        {key.strip().lower(): value for key, value in row.items() if key is not None}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+    return orders, request.form.get("mode", "atomic")
+
+
+@app.route("/orders/batch", methods=["POST"])
+@login_required
+@quote_view
+async def orders_batch():
+    """
+    Place a basket of buys and sells at current prices.
+
+    All quotes are fetched concurrently and the trades are applied in one
+    transaction. In "atomic" mode nothing is traded unless every order can
+    be filled; in "best_effort" mode every order that can be is. Returns a
+    result per order, in the order given.
+    """
+    user_id = session.get("user_id")
+    orders, mode = parse_batch()
+    if orders is None:
+        return jsonify({"error": mode}), 400
+    if mode not in ("atomic", "best_effort"):
+        return jsonify({"error": "mode must be atomic or best_effort"}), 400
+    if not orders:
+        return jsonify({"error": "no orders"}), 400
+    if len(orders) > app.config["ORDERS_BATCH_MAX"]:
+        return jsonify({"error": f"at most {app.config['ORDERS_BATCH_MAX']} orders"}), 400
+
+    # Validate every order before fetching anything
+    results = []
+    for order in orders:
+        symbol, side, shares = order.get("symbol"), order.get("side"), order.get("shares")
+        result = {"symbol": symbol, "side": side, "shares": shares, "status": "rejected"}
+        results.append(result)
+
+        if not isinstance(symbol, str):
+            symbol = None
+        error_message, _ = validate_symbol(symbol)
+        if not error_message and side not in ("buy", "sell"):
+            error_message = "side must be buy or sell"
+        if not error_message and (
+            isinstance(shares, bool) or not isinstance(shares, (int, str))
+        ):
+            error_message = "invalid shares"
+        if not error_message:
+            error_message, _ = validate_shares(shares)
+        if error_message:
+            result["error"] = error_message
+            continue
+
+        result.update(symbol=symbol.upper(), shares=int(shares), status=None)
+
+    # Retrieve current prices for the whole basket concurrently
+    quotes = await alookup_many(
+        result["symbol"] for result in results if result["status"] is None
+    )
+
+    trades, pending = [], []
+    for result in results:
+        if result["status"] is not None:
+            continue
+        quote = quotes.get(result["symbol"])
+        if not quote:
+            result.update(status="rejected", error="invalid symbol")
+        elif quote.get("stale"):
+            # Never trade at a last known price
+            result.update(status="rejected", error="quotes unavailable, try again later")
+        else:
+            result["price"] = float(quote["price"])
+            sign = 1 if result["side"] == "buy" else -1
+            trades.append((result["symbol"], result["price"], sign * result["shares"]))
+            pending.append(result)
+
+    atomic = mode == "atomic"
+    if atomic and len(pending) < len(results):
+        errors = [None] * len(trades)
+    else:
+        # Check cash and holdings, record the trades and update cash atomically
+        try:
+            errors = execute_batch(db, user_id, trades, atomic=atomic)
+        except TradeError as e:
+            return jsonify({"error": e.message}), e.code
+
+    for result, error in zip(pending, errors):
+        if error is not None:
+            result.update(status="rejected", error=error.message)
+    filled = not atomic or not any(result["status"] == "rejected" for result in results)
+    for result in pending:
+        if result["status"] is None:
+            result["status"] = "filled" if filled else "cancelled"
+
+    if any(result["status"] == "filled" for result in results):
+        session["user_version"] = user_cache.invalidate(user_id)
+
+    status = 200 if filled else 400
+    return jsonify({"mode": mode, "results": results}), status
+
+
+def validate_trigger_price(price):
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return "invalid price", 400
+    if not math.isfinite(price) or price <= 0:
+        return "price must be positive", 400
+
+    return None, None  # No validation errors
+
+
+@app.route("/orders", methods=["GET"])
+@login_required
+def list_orders():
+    """Return the user's limit and stop orders as JSON, newest first"""
+    status = request.args.get("status")
+    limit = request.args.get("limit", 100, type=int)
+
+    query = f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders WHERE user_id = ?"
+    args = [session.get("user_id")]
+    if status:
+        query += " AND status = ?"
+        args.append(status)
+    query += " ORDER BY id DESC LIMIT ?"
+    args.append(max(1, min(limit, app.config["HISTORY_MAX_PAGE_SIZE"])))
+
+    return jsonify([dict(row) for row in db.fetch_all(query, *args)])
+
+
+@app.route("/orders", methods=["POST"])
+@login_required
+@quote_view
+async def place_order():
+    """
+    Place a limit or stop order, filled when a later price update crosses
+    its trigger price.
+
+    A buy limit fills at or below its price and a sell limit at or above
+    it; a buy stop fills at or above its price and a sell stop at or below
+    it. Cash and holdings are checked when the order fills.
+    """
+    form = request.get_json(silent=True) if request.is_json else request.form
+    if not isinstance(form, dict):
+        return jsonify({"error": "expected an order"}), 400
+    symbol, side, order_type = form.get("symbol"), form.get("side"), form.get("type")
+    shares, price = form.get("shares"), form.get("price")
+
+    if not isinstance(symbol, str):
+        symbol = None
+    error_message, error_code = validate_symbol(symbol)
+    if not error_message and side not in ("buy", "sell"):
+        error_message, error_code = "side must be buy or sell", 400
+    if not error_message and order_type not in ("limit", "stop"):
+        error_message, error_code = "type must be limit or stop", 400
+    if not error_message and (
+        isinstance(shares, bool) or not isinstance(shares, (int, str))
+    ):
+        error_message, error_code = "invalid shares", 400
+    if not error_message:
+        error_message, error_code = validate_shares(shares)
+    if not error_message:
+        error_message, error_code = validate_trigger_price(price)
+    if error_message:
+        return jsonify({"error": error_message}), error_code
+
+    symbol = symbol.upper()
+    try:
+        quote = await alookup(symbol)
+    except UpstreamError:
+        return jsonify({"error": "quotes unavailable, try again later"}), 503
+    if not quote:
+        return jsonify({"error": "invalid symbol"}), 400
+
+    user_id = session.get("user_id")
+    order_id = order_engine.place(user_id, symbol, side, order_type, int(shares), float(price))
+    # Match it against the quote just fetched, so a marketable order fills
+    # without waiting for the next price update. Never at a last known price
+    if not quote.get("stale"):
+        order_engine.submit(symbol, float(quote["price"]))
+
+    query = f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders WHERE id = ?"
+    return jsonify(dict(db.fetch_one(query, order_id))), 201
+
+
+@app.route("/orders/<int:order_id>/cancel", methods=["POST"])
+@login_required
+def cancel_order(order_id):
+    """Cancel one of the user's open orders"""
+    if not order_engine.cancel(session.get("user_id"), order_id):
+        return jsonify({"error": "no such open order"}), 404
+
+    return jsonify({"id": order_id, "status": "cancelled"})
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,217 @@
+import threading
+import time
+from collections import deque
+
+from quote_providers import QuoteProvider, UpstreamError
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit is open, so the upstream wasn't called."""
+
+
+class RateLimitedError(UpstreamError):
+    """The outbound rate limit is exhausted, so the upstream wasn't called."""
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` calls per second with bursts of `burst`.
+
+    `rate` may be changed at any time; tokens accrue at the current rate.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token if one is available; never blocks."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker.
+
+    Closed, calls flow and their outcomes are kept for `window` seconds.
+    Once at least `min_calls` were made and `failure_rate` of them failed,
+    the circuit opens and calls are refused for `reset_timeout` seconds.
+    It then goes half-open and lets `half_open_calls` probes through: a
+    successful probe closes it, a failed one opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_rate=0.5, min_calls=10, window=30.0, reset_timeout=30.0,
+                 half_open_calls=1, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self._calls = deque()  # (time, failed)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probed_at = 0.0
+        self._lock = threading.Lock()
+
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """Return True if a call may go ahead now."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probes = 0
+                self._probed_at = self.clock()
+
+            if self.state == self.HALF_OPEN:
+                # Probes that never report back (cancelled, say) free their
+                # slots after another reset_timeout
+                if self.clock() - self._probed_at >= self.reset_timeout:
+                    self._probes = 0
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    return False
+                if not self._probes:
+                    self._probed_at = self.clock()
+                self._probes += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._close()
+            else:
+                self._record(failed=False)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+                return
+            self._record(failed=True)
+            if len(self._calls) >= self.min_calls and (
+                self._failures / len(self._calls) >= self.failure_rate
+            ):
+                self._open()
+
+    def _record(self, failed):
+        # Called with the lock held
+        now = self.clock()
+        self._calls.append((now, failed))
+        self._failures += failed
+        while self._calls and now - self._calls[0][0] > self.window:
+            _, expired = self._calls.popleft()
+            self._failures -= expired
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = self.clock()
+        self.opened += 1
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._calls.clear()
+        self._failures = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": int(self.state != self.CLOSED),
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class GuardedProvider(QuoteProvider):
+    """
+    Quote provider wrapped in a circuit breaker and an optional outbound
+    rate limit (a TokenBucket).
+
+    Refused calls raise CircuitOpenError or RateLimitedError right away, so
+    callers fall back without waiting on the upstream. The rate adapts:
+    it is halved whenever the upstream throttles us and grows back by
+    `recovery` calls per second with each success, up to `max_rate`.
+    """
+
+    def __init__(self, provider, breaker, bucket=None, min_rate=0.5, recovery=0.1):
+        self.provider = provider
+        self.breaker = breaker
+        self.bucket = bucket
+        self.max_rate = bucket.rate if bucket is not None else None
+        self.min_rate = min_rate
+        self.recovery = recovery
+
+    def _admit(self):
+        # Rate limit first, so a refused call never takes a half-open probe
+        if self.bucket is not None and not self.bucket.try_acquire():
+            raise RateLimitedError("quote upstream rate limit exceeded")
+        if not self.breaker.allow():
+            raise CircuitOpenError("quote upstream circuit is open")
+
+    def _failed(self, error):
+        self.breaker.record_failure()
+        if error.throttled and self.bucket is not None:
+            self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+
+    def _succeeded(self):
+        self.breaker.record_success()
+        if self.bucket is not None:
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.recovery)
+
+    def fetch(self, symbol):
+        self._admit()
+        try:
+            quote = self.provider.fetch(symbol)
+        except UpstreamError as error:
+            self._failed(error)
+            raise
+        self._succeeded()
+        return quote
+
+    async def afetch(self, symbol):
+        self._admit()
+        try:
+            quote = await self.provider.afetch(symbol)
+        except UpstreamError as error:
+            self._failed(error)
+            raise
+        self._succeeded()
+        return quote
+
+    def history(self, symbol, start, end):
+        # Providers return None when a download fails
+        try:
+            self._admit()
+        except UpstreamError:
+            return None
+        try:
+            bars = self.provider.history(symbol, start, end)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        if bars is None:
+            self.breaker.record_failure()
+        else:
+            self._succeeded()
+        return bars
@@ -1,22 +1,300 @@
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+
+from lots import create_lots, rebuild_lots
+from metrics import timed
+from orders import create_orders
+from price_history import add_bars_to_price_history, create_price_history
+from quote_store import add_previous_close_to_quotes
+from snapshots import create_snapshots
+
+
+# Keep 'holdings' in step with every insert into 'transactions'. The trigger
+# runs inside the inserting statement's transaction. Sells reduce the cost
+# basis at average cost and add the difference to realized P&L. Closed
+# positions keep their row (with zero shares) so realized P&L survives.
+# NUMERIC columns store whole numbers as INTEGER, so the average-cost
+# ratios cast to REAL to avoid integer division.
+HOLDINGS_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS transactions_update_holdings
+    AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO holdings (user_id, symbol, shares, cost_basis)
+        VALUES (NEW.user_id, NEW.symbol, 0, 0)
+        ON CONFLICT(user_id, symbol) DO NOTHING;
+
+        UPDATE holdings SET
+            realized = CASE
+                WHEN NEW.shares >= 0 THEN realized
+                WHEN shares + NEW.shares <= 0 THEN realized - NEW.price * NEW.shares - cost_basis
+                ELSE realized - NEW.price * NEW.shares + CAST(cost_basis AS REAL) * NEW.shares / shares
+            END,
+            cost_basis = CASE
+                WHEN NEW.shares >= 0 THEN cost_basis + NEW.price * NEW.shares
+                WHEN shares + NEW.shares <= 0 THEN 0
+                ELSE CAST(cost_basis AS REAL) * (shares + NEW.shares) / shares
+            END,
+            shares = shares + NEW.shares
+        WHERE user_id = NEW.user_id AND symbol = NEW.symbol;
+    END;
+"""
+
+
+def rebuild_holdings(connection):
+    """Rebuild 'holdings' by replaying 'transactions' in insertion order."""
+    holdings = {}
+    rows = connection.execute(
+        "SELECT user_id, symbol, price, shares FROM transactions ORDER BY id"
+    )
+    for user_id, symbol, price, shares in rows:
+        held, cost_basis, realized = holdings.get((user_id, symbol), (0, 0, 0))
+        if shares >= 0:
+            cost_basis += price * shares
+        elif held + shares <= 0:
+            realized += -price * shares - cost_basis
+            cost_basis = 0
+        else:
+            realized += -price * shares + cost_basis * shares / held
+            cost_basis = cost_basis * (held + shares) / held
+        holdings[(user_id, symbol)] = (held + shares, cost_basis, realized)
+
+    connection.execute("DELETE FROM holdings")
+    connection.executemany(
+        "INSERT INTO holdings (user_id, symbol, shares, cost_basis, realized) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (
+            (user_id, symbol, max(shares, 0), cost_basis, realized)
+            for (user_id, symbol), (shares, cost_basis, realized) in holdings.items()
+        ),
+    )
+
+
+def add_realized_to_holdings(connection):
+    """Add realized P&L to 'holdings' and keep closed positions."""
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(holdings)")]
+    if "realized" not in columns:
+        connection.execute(
+            "ALTER TABLE holdings ADD COLUMN realized NUMERIC NOT NULL DEFAULT 0"
+        )
+    replace_holdings_trigger(connection)
+
+
+def replace_holdings_trigger(connection):
+    """Install the current holdings trigger and recompute 'holdings' with it."""
+    connection.execute("DROP TRIGGER IF EXISTS transactions_update_holdings")
+    connection.execute(HOLDINGS_TRIGGER)
+    rebuild_holdings(connection)
+
+
+# Schema migrations applied on top of create_tables, in order. PRAGMA
+# user_version records how many have already run against the database, so
+# new steps must only ever be appended. A step is a SQL string or a callable
+# taking the connection.
+MIGRATIONS = [
+    # 1: covering indexes for per-user history and per-symbol lookups
+    (
+        """
+        CREATE INDEX IF NOT EXISTS transactions_user_timestamp
+        ON transactions (user_id, timestamp, symbol, price, shares);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS transactions_user_symbol
+        ON transactions (user_id, symbol, shares, price);
+        """,
+    ),
+    # 2: shared quote store written by the background price refresher, and
+    # leases so only one process runs it
+    (
+        """
+        CREATE TABLE IF NOT EXISTS quotes (
+            symbol TEXT PRIMARY KEY NOT NULL,
+            price NUMERIC NOT NULL,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY NOT NULL,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID;
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS holdings_symbol ON holdings (symbol);
+        """,
+    ),
+    # 3: realized P&L per holding
+    (add_realized_to_holdings,),
+    # 4: per-lot index for FIFO cost accounting
+    (create_lots,),
+    # 5: cached daily closes and precomputed daily account value snapshots
+    (create_price_history, create_snapshots),
+    # 6: full daily OHLCV bars and the ranges already downloaded
+    (add_bars_to_price_history,),
+    # 7: resting limit and stop orders
+    (create_orders,),
+    # 8: average-cost trigger without integer division, and holdings it got wrong
+    (replace_holdings_trigger,),
+    # 9: previous close alongside each shared quote
+    (add_previous_close_to_quotes,),
+]
 
 
 class Database:
-    def __init__(self, db_path, check_same_thread=False):
-        self.connection = sqlite3.connect(db_path, check_same_thread=check_same_thread)
-        self.cursor = self.connection.cursor()
+    def __init__(self, db_path, check_same_thread=False, pool_size=5, timeout=5.0):
+        self.db_path = db_path
+        self.check_same_thread = check_same_thread
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        # Connections are checked out per request and returned afterwards, so
+        # concurrent threads never share a cursor
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._local = threading.local()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
         self.create_tables()
+        self.migrate()
 
-    def execute_query(self, query, *args):
-        self.cursor.execute(query, args)
-        self.connection.commit()  # Commit changes to the database
-        columns = (
-            [column[0] for column in self.cursor.description]
-            if self.cursor.description
-            else []
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=self.check_same_thread,
         )
-        result = [dict(zip(columns, row)) for row in self.cursor.fetchall()]
-        return result
+        # WAL lets readers run in parallel with a single writer
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """Check out a pooled connection for the current thread."""
+        # Reuse the connection already held by this thread, if any
+        held = getattr(self._local, "connection", None)
+        if held is not None:
+            yield held
+            return
+
+        try:
+            connection = self._pool.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("database connection pool exhausted")
+
+        self._local.connection = connection
+        try:
+            yield connection
+        finally:
+            self._local.connection = None
+            # A write that failed before its commit leaves the implicit
+            # transaction open and the write lock held; roll it back
+            if connection.in_transaction:
+                connection.rollback()
+            self._pool.put(connection)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run the enclosed queries as one atomic unit.
+
+        BEGIN IMMEDIATE takes the write lock up front, so concurrent
+        read-modify-write sequences are serialized instead of interleaved.
+        Queries inside the block share one connection and one commit.
+        """
+        with self.connection() as connection:
+            # Nested blocks join the outer transaction
+            if getattr(self._local, "transaction", False):
+                yield connection
+                return
+
+            connection.execute("BEGIN IMMEDIATE")
+            self._local.transaction = True
+            try:
+                yield connection
+            except BaseException:
+                connection.rollback()
+                raise
+            else:
+                connection.commit()
+            finally:
+                self._local.transaction = False
+
+    def execute_query(self, query, *args):
+        with timed("db"), self.connection() as connection:
+            # Plain tuples are cheaper to turn into dicts than sqlite3.Row
+            cursor = connection.cursor()
+            cursor.row_factory = None
+            rows = cursor.execute(query, args).fetchall()
+            # Commit writes to the database unless a transaction is open.
+            # Plain SELECTs never open an implicit transaction, so reads
+            # skip the commit entirely.
+            if connection.in_transaction and not getattr(
+                self._local, "transaction", False
+            ):
+                connection.commit()
+            if not cursor.description:
+                return []
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in rows]
+
+    def fetch_one(self, query, *args):
+        """Return the first row of a read query as a sqlite3.Row, or None."""
+        with timed("db"), self.connection() as connection:
+            return connection.execute(query, args).fetchone()
+
+    def fetch_all(self, query, *args):
+        """Return every row of a read query as a list of sqlite3.Row."""
+        with timed("db"), self.connection() as connection:
+            return connection.execute(query, args).fetchall()
+
+    def fetch_iter(self, query, *args, size=500):
+        """
+        Yield rows of a read query without materializing the result set.
+
+        The connection stays checked out until the generator is exhausted or
+        closed. Callers that may stop early must close it, e.g. with
+        contextlib.closing or Response.call_on_close; an abandoned generator
+        holds its connection until it is garbage collected.
+        """
+        with self.connection() as connection:
+            with timed("db"):
+                cursor = connection.execute(query, args)
+            try:
+                while True:
+                    # One query, however many batches it takes
+                    with timed("db", count=False):
+                        rows = cursor.fetchmany(size)
+                    if not rows:
+                        break
+                    yield from rows
+            finally:
+                cursor.close()
+
+    def close(self):
+        """Close every pooled connection."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def migrate(self):
+        """Apply pending schema migrations and return the schema version."""
+        with self.transaction() as connection:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in statements:
+                    if callable(statement):
+                        statement(connection)
+                    else:
+                        connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {number}")
+                version = number
+        return version
 
     def create_tables(self):
         # Create 'users' table if not exists
@@ -49,3 +327,37 @@ class Database:
             );
         """
         self.execute_query(create_transactions_table_query)
+
+        # Remember whether 'holdings' needs a backfill from existing history
+        query = "SELECT name FROM sqlite_master WHERE type='table' AND name='holdings';"
+        holdings_exists = bool(self.execute_query(query))
+
+        # Create 'holdings' table if not exists
+        create_holdings_table_query = """
+            CREATE TABLE IF NOT EXISTS holdings (
+                user_id INTEGER NOT NULL,
+                symbol TEXT NOT NULL,
+                shares NUMERIC NOT NULL,
+                cost_basis NUMERIC NOT NULL,
+                realized NUMERIC NOT NULL DEFAULT 0,
+                PRIMARY KEY(user_id, symbol),
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            ) WITHOUT ROWID;
+        """
+        self.execute_query(create_holdings_table_query)
+
+        # Keep 'holdings' in step with 'transactions'
+        self.execute_query(HOLDINGS_TRIGGER)
+
+        if not holdings_exists:
+            self.backfill_holdings()
+
+    def backfill_holdings(self):
+        """Rebuild 'holdings' by replaying 'transactions' in insertion order."""
+        with self.transaction() as connection:
+            rebuild_holdings(connection)
+
+    def backfill_lots(self):
+        """Rebuild the lot index by replaying 'transactions' in insertion order."""
+        with self.transaction() as connection:
+            rebuild_lots(connection)
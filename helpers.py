@@ -1,13 +1,27 @@
+import asyncio
 import csv
-import datetime
-import pytz
+import io
+import json
+import logging
+import os
 import requests
+import sqlite3
 import subprocess
-import urllib
+import threading
+import time
 import uuid
 
-from flask import redirect, render_template, session
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import current_app, redirect, render_template, session
 from functools import wraps
+from requests.adapters import HTTPAdapter
+
+from metrics import timed
+from quote_cache import QuoteCache
+from quote_providers import UpstreamError, YahooProvider
+
+
+logger = logging.getLogger(__name__)
 
 
 def apology(message, code=400):
@@ -31,6 +45,14 @@ def login_required(f):
 
     http://flask.pocoo.org/docs/0.12/patterns/viewdecorators/
     """
+    if asyncio.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_coroutine(*args, **kwargs):
+            if session.get("user_id") is None:
+                return redirect("/login")
+            return await f(*args, **kwargs)
+        return decorated_coroutine
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if session.get("user_id") is None:
@@ -39,38 +61,449 @@ def login_required(f):
     return decorated_function
 
 
+class LatencyStats:
+    """Thread-safe latency counters for upstream calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.total = 0.0
+            self.max = 0.0
+            self.last = 0.0
+
+    def record(self, elapsed, error=False):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(error)
+            self.total += elapsed
+            self.max = max(self.max, elapsed)
+            self.last = elapsed
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "total": self.total,
+                "mean": self.total / self.calls if self.calls else 0.0,
+                "max": self.max,
+                "last": self.last,
+            }
+
+
+# Connect and read timeouts for upstream quote requests, in seconds
+HTTP_TIMEOUT = (
+    float(os.environ.get("HTTP_CONNECT_TIMEOUT", 3.05)),
+    float(os.environ.get("HTTP_READ_TIMEOUT", 5)),
+)
+
+# Shared keep-alive session so lookups reuse pooled TCP/TLS connections
+http_session = requests.Session()
+http_adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=int(os.environ.get("HTTP_POOL_SIZE", 10)),
+    pool_block=False,
+)
+http_session.mount("https://", http_adapter)
+http_session.cookies.set("session", str(uuid.uuid4()))
+http_session.headers.update({"User-Agent": "python-requests", "Accept": "*/*"})
+
+# Latency of each upstream quote request
+lookup_latency = LatencyStats()
+
+# Where quotes come from; app.py may swap this according to its config
+quote_provider = YahooProvider(session=http_session, timeout=HTTP_TIMEOUT)
+
+# Optional QuoteStore filled by a background PriceRefresher
+quote_store = None
+
+# Optional PriceHistory behind /api/prices and last known prices
+price_history = None
+
+# Whether each fetched quote is also written to it as the day's close
+record_prices = False
+
+# Optional callback(symbol, price) for every quote fetched from the upstream
+price_listener = None
+
+# Lookups answered with a last known price while the upstream was down
+stale_quotes = 0
+stale_lock = threading.Lock()
+
+# Whether concurrent lookups in different worker processes share one
+# upstream fetch through a lease in the quote store
+coalesce_processes = False
+COALESCE_TIMEOUT = float(os.environ.get("QUOTE_COALESCE_TIMEOUT", 5))
+LEASE_TOKEN = uuid.uuid4().hex
+
+# Bounded pool used by lookup_many
+lookup_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("LOOKUP_WORKERS", 8)),
+    thread_name_prefix="lookup",
+)
+
+
 def lookup(symbol):
-    """Look up quote for symbol."""
+    """
+    Look up quote for symbol, served from the in-process quote cache.
+
+    While the upstream is unavailable, the last known price is returned
+    instead, marked "stale" (and never cached); with no price known,
+    UpstreamError is raised.
+    """
+    symbol = symbol.upper()
+    with timed("quote"):
+        try:
+            return quote_cache.get(symbol)
+        except UpstreamError:
+            quote = last_known_quote(symbol)
+            if quote is None:
+                raise
+            return quote
+
+
+def provider_failed(symbol, error):
+    """
+    Turn an unexpected provider exception into an UpstreamError, so a
+    provider bug falls back like an outage instead of failing the request.
+    """
+    logger.error("quote provider failed for %s", symbol, exc_info=error)
+    return UpstreamError(f"quote provider failed: {error!r}")
+
+
+def fetch_quote(symbol):
+    """Fetch quote for symbol from the configured quote provider."""
+    started = time.perf_counter()
+    quote = None
+    try:
+        quote = quote_provider.fetch(symbol)
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise provider_failed(symbol, e) from e
+    finally:
+        lookup_latency.record(time.perf_counter() - started, error=quote is None)
+    return record_history(symbol, quote)
+
+
+async def afetch_quote(symbol):
+    """Fetch quote for symbol, awaiting the provider instead of blocking."""
+    started = time.perf_counter()
+    quote = None
+    try:
+        quote = await quote_provider.afetch(symbol)
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise provider_failed(symbol, e) from e
+    finally:
+        lookup_latency.record(time.perf_counter() - started, error=quote is None)
+    if record_prices:
+        # Recording the close is a database write
+        return await asyncio.to_thread(record_history, symbol, quote)
+    return record_history(symbol, quote)
+
+
+def record_history(symbol, quote):
+    """Record a fetched quote as the day's close and pass its price on."""
+    if quote is not None and record_prices and price_history is not None:
+        try:
+            price_history.record_quote(quote)
+        except sqlite3.Error:
+            logger.exception("failed to record close for %s", symbol)
+    if quote is not None and price_listener is not None:
+        try:
+            price_listener(quote["symbol"], quote["price"])
+        except Exception:
+            logger.exception("price listener failed for %s", symbol)
+    return quote
+
 
-    # Prepare API request
+def price_bars(symbol, start, end):
+    """
+    Return daily bars for symbol from the price history store as columns,
+    downloading only the parts of the range not fetched before.
+    """
     symbol = symbol.upper()
-    end = datetime.datetime.now(pytz.timezone("US/Eastern"))
-    start = end - datetime.timedelta(days=7)
-
-    # Yahoo Finance API
-    url = (
-        f"https://query1.finance.yahoo.com/v7/finance/download/{urllib.parse.quote_plus(symbol)}"
-        f"?period1={int(start.timestamp())}"
-        f"&period2={int(end.timestamp())}"
-        f"&interval=1d&events=history&includeAdjustedClose=true"
+    price_history.fill(symbol, start, end, quote_provider.history)
+    return price_history.bars(symbol, start, end)
+
+
+def last_known_quote(symbol):
+    """Return the last price seen for symbol marked stale, or None."""
+    global stale_quotes
+    quote = quote_cache.last_known(symbol)
+    if quote is None and price_history is not None:
+        latest = price_history.latest(symbol)
+        if latest is not None:
+            quote = {"name": symbol, "price": latest[1], "symbol": symbol}
+    if quote is None:
+        return None
+    quote["stale"] = True
+    with stale_lock:
+        stale_quotes += 1
+    return quote
+
+
+def load_quote(symbol):
+    """
+    Load quote for symbol from the shared quote store, else the provider.
+
+    Raises UpstreamError while the upstream is unavailable.
+    """
+    if quote_store is not None:
+        quote = quote_store.get(symbol)
+        if quote is not None:
+            return quote
+
+    if not coalesce_processes:
+        return fetch_quote(symbol)
+
+    # Only the process holding the symbol's lease goes upstream; the others
+    # wait for it to publish the quote to the store
+    lease = f"quote:{symbol}"
+    if not quote_store.acquire_lease(lease, lease_owner(), COALESCE_TIMEOUT):
+        try:
+            return quote_store.wait(symbol, lease, COALESCE_TIMEOUT)
+        except TimeoutError:
+            # The lease holder is slow or gone; fetch it ourselves
+            pass
+    try:
+        quote = fetch_quote(symbol)
+    except BaseException:
+        quote_store.release_lease(lease, lease_owner())
+        raise
+    # Unknown symbols are published too, so waiters don't sit out the timeout
+    quote_store.publish(lease, lease_owner(), quote, quote_cache.negative_ttl)
+    return quote
+
+
+async def aload_quote(symbol):
+    """
+    Awaitable load_quote. Quote store calls are SQLite queries, so they
+    run in worker threads rather than on the event loop.
+    """
+    if quote_store is not None:
+        quote = await asyncio.to_thread(quote_store.get, symbol)
+        if quote is not None:
+            return quote
+
+    if not coalesce_processes:
+        return await afetch_quote(symbol)
+
+    lease = f"quote:{symbol}"
+    acquired = await asyncio.to_thread(
+        quote_store.acquire_lease, lease, lease_owner(), COALESCE_TIMEOUT
+    )
+    if not acquired:
+        try:
+            return await asyncio.to_thread(quote_store.wait, symbol, lease, COALESCE_TIMEOUT)
+        except TimeoutError:
+            pass
+    try:
+        quote = await afetch_quote(symbol)
+    except BaseException:
+        await asyncio.to_thread(quote_store.release_lease, lease, lease_owner())
+        raise
+    await asyncio.to_thread(
+        quote_store.publish, lease, lease_owner(), quote, quote_cache.negative_ttl
     )
+    return quote
+
+
+def set_quote_store(store):
+    """Serve quotes from a shared QuoteStore before asking the provider."""
+    global quote_store
+    quote_store = store
+    quote_cache.clear()
+
+
+def set_price_history(history):
+    """Serve price bars and last known prices from a PriceHistory."""
+    global price_history
+    price_history = history
+
+
+def set_record_prices(enabled):
+    """Record every fetched quote as the day's close in the price history."""
+    global record_prices
+    record_prices = enabled
+
+
+def set_price_listener(listener):
+    """Call listener(symbol, price) with every quote fetched from the upstream."""
+    global price_listener
+    price_listener = listener
+
+
+def lease_owner():
+    """Lease owner name for this process; the pid keeps forked workers apart."""
+    return f"{os.getpid()}-{LEASE_TOKEN}"
+
+
+def set_coalesce_processes(enabled):
+    """
+    Share upstream fetches between worker processes through the quote
+    store's lease rows. Needs a quote store.
+    """
+    global coalesce_processes
+    if enabled and quote_store is None:
+        raise ValueError("coalescing across processes needs a quote store")
+    coalesce_processes = enabled
+
+
+def set_quote_provider(provider):
+    """Switch the quote provider and drop quotes cached from the old one."""
+    global quote_provider
+    quote_provider = provider
+    quote_cache.clear()
+
+
+quote_cache = QuoteCache(
+    load_quote,
+    ttl=float(os.environ.get("QUOTE_CACHE_TTL", 60)),
+    stale_ttl=float(os.environ.get("QUOTE_CACHE_STALE_TTL", 300)),
+    negative_ttl=float(os.environ.get("QUOTE_CACHE_NEGATIVE_TTL", 30)),
+    maxsize=int(os.environ.get("QUOTE_CACHE_SIZE", 1024)),
+    afetch=aload_quote,
+)
+
+# Whether quote views await quotes on an event loop. Off, they call the
+# blocking lookups directly and run without one (see quote_view).
+async_quotes = False
+
+
+def set_async_quotes(enabled):
+    global async_quotes
+    async_quotes = enabled
+
+
+def quote_view(f):
+    """
+    Decorate async views that look up quotes so they only pay for an event
+    loop when async quotes are on.
 
-    # Query API
+    Off, alookup and alookup_many call the blocking lookups without ever
+    suspending, so the view's coroutine is run to completion in the request
+    thread instead of on a fresh asgiref loop.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if async_quotes:
+            return current_app.async_to_sync(f)(*args, **kwargs)
+
+        coroutine = f(*args, **kwargs)
+        try:
+            coroutine.send(None)
+        except StopIteration as stop:
+            return stop.value
+        coroutine.close()
+        raise RuntimeError(f"{f.__name__} suspended with async quotes off")
+    return decorated_function
+
+
+def lookup_many(symbols, deadline=None):
+    """
+    Look up quotes for several symbols concurrently.
+
+    Returns a dict mapping each symbol to its quote. Symbols that fail or
+    don't answer within `deadline` seconds map to None instead of holding
+    up the others.
+    """
+    if deadline is None:
+        deadline = float(os.environ.get("LOOKUP_DEADLINE", 5))
+
+    with timed("quote"):
+        futures = {symbol: lookup_executor.submit(lookup, symbol) for symbol in set(symbols)}
+        wait(futures.values(), timeout=deadline)
+
+    quotes = {}
+    for symbol, future in futures.items():
+        if future.done() and future.exception() is None:
+            quotes[symbol] = future.result()
+        else:
+            quotes[symbol] = None
+    return quotes
+
+
+async def alookup(symbol):
+    """Awaitable lookup for async views."""
+    if not async_quotes:
+        return lookup(symbol)
+    with timed("quote"):
+        return await _aget(symbol.upper())
+
+
+async def _aget(symbol):
     try:
-        response = requests.get(url, cookies={"session": str(uuid.uuid4())}, headers={"User-Agent": "python-requests", "Accept": "*/*"})
-        response.raise_for_status()
-
-        # CSV header: Date,Open,High,Low,Close,Adj Close,Volume
-        quotes = list(csv.DictReader(response.content.decode("utf-8").splitlines()))
-        quotes.reverse()
-        price = round(float(quotes[0]["Adj Close"]), 2)
-        return {
-            "name": symbol,
-            "price": price,
-            "symbol": symbol
+        return await quote_cache.aget(symbol)
+    except UpstreamError:
+        quote = last_known_quote(symbol)
+        if quote is None:
+            raise
+        return quote
+
+
+async def alookup_many(symbols, deadline=None):
+    """
+    Awaitable lookup_many for async views.
+
+    In async mode every symbol is fetched concurrently on the event loop,
+    so the fan-out isn't bounded by the lookup thread pool.
+    """
+    if not async_quotes:
+        return lookup_many(symbols, deadline)
+    if deadline is None:
+        deadline = float(os.environ.get("LOOKUP_DEADLINE", 5))
+
+    with timed("quote"):
+        tasks = {
+            symbol: asyncio.ensure_future(_aget(symbol.upper()))
+            for symbol in set(symbols)
         }
-    except (requests.RequestException, ValueError, KeyError, IndexError):
-        return None
+        if tasks:
+            _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+            for task in pending:
+                task.cancel()
+
+    quotes = {}
+    for symbol, task in tasks.items():
+        if task.done() and not task.cancelled() and task.exception() is None:
+            quotes[symbol] = task.result()
+        else:
+            quotes[symbol] = None
+    return quotes
+
+
+def stream_csv(rows, columns, chunk_size=500):
+    """Yield rows as CSV text, a chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([row[column] for column in columns])
+        if i % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_jsonl(rows, columns, chunk_size=500):
+    """Yield rows as JSON lines, a chunk of rows at a time."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({column: row[column] for column in columns}))
+        if len(lines) == chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
 
 
 def usd(value):
@@ -0,0 +1,194 @@
+from collections import deque
+
+
+# Every buy opens a lot; sells consume open lots oldest first (FIFO) and
+# record which lots they drew from in 'lot_sales'
+CREATE_LOTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS lots (
+        transaction_id INTEGER PRIMARY KEY NOT NULL,
+        user_id INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        price NUMERIC NOT NULL,
+        shares NUMERIC NOT NULL,
+        remaining NUMERIC NOT NULL,
+        acquired_at TIMESTAMP,
+        FOREIGN KEY(transaction_id) REFERENCES transactions(id)
+    );
+"""
+
+CREATE_LOTS_INDEX = """
+    CREATE INDEX IF NOT EXISTS lots_open
+    ON lots (user_id, symbol, transaction_id) WHERE remaining > 0;
+"""
+
+CREATE_LOT_SALES_TABLE = """
+    CREATE TABLE IF NOT EXISTS lot_sales (
+        sale_id INTEGER NOT NULL,
+        lot_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        shares NUMERIC NOT NULL,
+        cost NUMERIC NOT NULL,
+        proceeds NUMERIC NOT NULL,
+        PRIMARY KEY(sale_id, lot_id),
+        FOREIGN KEY(sale_id) REFERENCES transactions(id),
+        FOREIGN KEY(lot_id) REFERENCES lots(transaction_id)
+    ) WITHOUT ROWID;
+"""
+
+CREATE_LOT_SALES_INDEX = """
+    CREATE INDEX IF NOT EXISTS lot_sales_user_symbol
+    ON lot_sales (user_id, symbol, proceeds, cost);
+"""
+
+# Update the lot index incrementally, inside the inserting statement's
+# transaction. A running total over the open lots picks exactly the lots a
+# sell crosses, so only those rows are touched.
+LOTS_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS transactions_update_lots
+    AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO lots (transaction_id, user_id, symbol, price, shares, remaining, acquired_at)
+        SELECT NEW.id, NEW.user_id, NEW.symbol, NEW.price, NEW.shares, NEW.shares, NEW.timestamp
+        WHERE NEW.shares > 0;
+
+        INSERT INTO lot_sales (sale_id, lot_id, user_id, symbol, shares, cost, proceeds)
+        SELECT
+            NEW.id, transaction_id, NEW.user_id, NEW.symbol, sold,
+            price * sold, NEW.price * sold
+        FROM (
+            SELECT
+                transaction_id,
+                price,
+                MIN(remaining, -NEW.shares - consumed_before) AS sold,
+                consumed_before
+            FROM (
+                SELECT
+                    transaction_id,
+                    price,
+                    remaining,
+                    SUM(remaining) OVER (ORDER BY transaction_id) - remaining AS consumed_before
+                FROM lots
+                WHERE user_id = NEW.user_id AND symbol = NEW.symbol AND remaining > 0
+            )
+        )
+        WHERE NEW.shares < 0 AND consumed_before < -NEW.shares;
+
+        UPDATE lots SET remaining = remaining - (
+            SELECT shares FROM lot_sales
+            WHERE sale_id = NEW.id AND lot_id = lots.transaction_id
+        )
+        WHERE transaction_id IN (SELECT lot_id FROM lot_sales WHERE sale_id = NEW.id);
+    END;
+"""
+
+
+def create_lots(connection):
+    """Create the lot index and fill it from existing transactions."""
+    for statement in (
+        CREATE_LOTS_TABLE,
+        CREATE_LOTS_INDEX,
+        CREATE_LOT_SALES_TABLE,
+        CREATE_LOT_SALES_INDEX,
+        LOTS_TRIGGER,
+    ):
+        connection.execute(statement)
+    rebuild_lots(connection)
+
+
+def rebuild_lots(connection, batch_size=1000):
+    """
+    Rebuild 'lots' and 'lot_sales' from 'transactions' in one streaming pass.
+
+    Only the currently open lots are held in memory; rows are written in
+    batches as the history is replayed.
+    """
+    connection.execute("DELETE FROM lot_sales")
+    connection.execute("DELETE FROM lots")
+
+    open_lots = {}  # (user_id, symbol) -> deque of [lot_id, price, remaining]
+    new_lots, sales, updates = [], [], []
+
+    def flush():
+        # Lots must exist before their sales and remaining updates
+        connection.executemany(
+            "INSERT INTO lots (transaction_id, user_id, symbol, price, shares, remaining, acquired_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            new_lots,
+        )
+        connection.executemany(
+            "INSERT INTO lot_sales (sale_id, lot_id, user_id, symbol, shares, cost, proceeds) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            sales,
+        )
+        connection.executemany(
+            "UPDATE lots SET remaining = ? WHERE transaction_id = ?", updates
+        )
+        new_lots.clear()
+        sales.clear()
+        updates.clear()
+
+    cursor = connection.execute(
+        "SELECT id, user_id, symbol, price, shares, timestamp FROM transactions ORDER BY id"
+    )
+    for row_id, user_id, symbol, price, shares, timestamp in cursor:
+        queue = open_lots.setdefault((user_id, symbol), deque())
+        if shares > 0:
+            queue.append([row_id, price, shares])
+            new_lots.append((row_id, user_id, symbol, price, shares, shares, timestamp))
+        else:
+            to_sell = -shares
+            while to_sell > 0 and queue:
+                lot = queue[0]
+                sold = min(lot[2], to_sell)
+                lot[2] -= sold
+                to_sell -= sold
+                sales.append((row_id, lot[0], user_id, symbol, sold, lot[1] * sold, price * sold))
+                updates.append((lot[2], lot[0]))
+                if lot[2] == 0:
+                    queue.popleft()
+
+        if len(new_lots) + len(sales) >= batch_size:
+            flush()
+    flush()
+
+
+def open_lots(db, user_id, symbol):
+    """Return the user's open lots in a symbol, oldest first."""
+    query = (
+        "SELECT transaction_id, price, shares, remaining, acquired_at FROM lots "
+        "WHERE user_id = ? AND symbol = ? AND remaining > 0 ORDER BY transaction_id"
+    )
+    return db.fetch_all(query, user_id, symbol)
+
+
+def realized_gains(db, user_id, method="fifo"):
+    """Return {symbol: realized gain} under the FIFO or average cost method."""
+    if method == "fifo":
+        query = (
+            "SELECT symbol, SUM(proceeds - cost) AS realized FROM lot_sales "
+            "WHERE user_id = ? GROUP BY symbol"
+        )
+    elif method == "average":
+        query = "SELECT symbol, realized FROM holdings WHERE user_id = ?"
+    else:
+        raise ValueError(f"unknown cost method: {method}")
+    return {row["symbol"]: row["realized"] for row in db.fetch_all(query, user_id)}
+
+
+def realized_lots(db, user_id):
+    """
+    Yield one FIFO tax-lot row per (sale, lot) pair, oldest sale first.
+
+    The rows come from Database.fetch_iter: close the iterator if you stop
+    before the end.
+    """
+    query = (
+        "SELECT s.symbol, s.shares, l.acquired_at, t.timestamp AS sold_at, "
+        "s.cost, s.proceeds, s.proceeds - s.cost AS gain "
+        "FROM lot_sales s "
+        "JOIN lots l ON l.transaction_id = s.lot_id "
+        "JOIN transactions t ON t.id = s.sale_id "
+        "WHERE s.user_id = ? ORDER BY s.sale_id, s.lot_id"
+    )
+    return db.fetch_iter(query, user_id)
@@ -0,0 +1,173 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, request, template_rendered, before_render_template
+
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Components a request's time is split into
+COMPONENTS = ("total", "db", "quote", "render")
+
+# Timings of the request being handled in the current context, if any
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {"db": 0.0, "quote": 0.0, "render": 0.0}
+        self.counts = {"db": 0, "quote": 0, "render": 0}
+        self.render_started = None
+
+
+@contextmanager
+def timed(component, count=True):
+    """
+    Add the enclosed block's duration to `component` of the current request.
+    With count=False the block adds time only, e.g. fetching more rows of a
+    query that was already counted.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.durations[component] += time.perf_counter() - started
+        if count:
+            timings.counts[component] += 1
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Registry:
+    """Per-route latency histograms and query counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}  # (route, component) -> Histogram
+        self.queries = {}  # route -> number of database queries
+        self.requests = {}  # route -> number of requests
+
+    def observe(self, route, timings, total):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.queries[route] = self.queries.get(route, 0) + timings.counts["db"]
+            values = dict(timings.durations, total=total)
+            for component in COMPONENTS:
+                histogram = self.histograms.setdefault((route, component), Histogram())
+                histogram.observe(values[component])
+
+    def render(self, gauges=None):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP finance_request_duration_seconds Request latency by route and component.",
+            "# TYPE finance_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (route, component), histogram in sorted(self.histograms.items()):
+                labels = f'route="{route}",component="{component}"'
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(
+                        f'finance_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'finance_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}'
+                )
+                lines.append(f"finance_request_duration_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"finance_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+            lines.append("# HELP finance_requests_total Requests handled by route.")
+            lines.append("# TYPE finance_requests_total counter")
+            for route, count in sorted(self.requests.items()):
+                lines.append(f'finance_requests_total{{route="{route}"}} {count}')
+
+            lines.append("# HELP finance_db_queries_total Database queries issued by route.")
+            lines.append("# TYPE finance_db_queries_total counter")
+            for route, count in sorted(self.queries.items()):
+                lines.append(f'finance_db_queries_total{{route="{route}"}} {count}')
+
+        for name, value in (gauges() if gauges else {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def init_app(app, registry=None, gauges=None):
+    """
+    Instrument `app`: time each request, add a Server-Timing header and serve
+    /metrics. `gauges` is an optional callable returning extra {name: value}
+    gauges to export.
+    """
+    registry = registry or Registry()
+
+    @app.before_request
+    def start_timing():
+        _current.set(RequestTimings())
+
+    @app.after_request
+    def record_timing(response):
+        timings = _current.get()
+        if timings is None:
+            return response
+
+        total = time.perf_counter() - timings.started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        registry.observe(route, timings, total)
+
+        response.headers["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={timings.durations["db"] * 1000:.2f};desc="{timings.counts["db"]} queries"',
+                f'quote;dur={timings.durations["quote"] * 1000:.2f}',
+                f'render;dur={timings.durations["render"] * 1000:.2f}',
+                f"total;dur={total * 1000:.2f}",
+            ]
+        )
+        return response
+
+    @app.teardown_request
+    def stop_timing(exception=None):
+        _current.set(None)
+
+    def render_started(sender, template, context, **extra):
+        timings = _current.get()
+        if timings is not None:
+            timings.render_started = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        timings = _current.get()
+        if timings is not None and timings.render_started is not None:
+            timings.durations["render"] += time.perf_counter() - timings.render_started
+            timings.counts["render"] += 1
+            timings.render_started = None
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+    @app.route("/metrics")
+    def metrics():
+        """Expose metrics in Prometheus text format"""
+        return Response(registry.render(gauges), mimetype="text/plain; version=0.0.4")
+
+    return registry
@@ -0,0 +1,307 @@
+import heapq
+import logging
+import queue
+import threading
+import time
+from contextlib import closing
+
+from quote_providers import UpstreamError
+from trading import TradeError, execute_trade
+
+
+logger = logging.getLogger(__name__)
+
+
+# Resting limit and stop orders. A limit buy fills once the price falls to
+# its trigger and a limit sell once it rises to it; stops are the reverse.
+CREATE_ORDERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY NOT NULL,
+        user_id INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        side TEXT NOT NULL CHECK(side IN ('buy', 'sell')),
+        type TEXT NOT NULL CHECK(type IN ('limit', 'stop')),
+        shares INTEGER NOT NULL CHECK(shares > 0),
+        trigger_price NUMERIC NOT NULL,
+        status TEXT NOT NULL DEFAULT 'open',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        filled_at TIMESTAMP,
+        fill_price NUMERIC,
+        error TEXT,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    );
+"""
+
+CREATE_ORDERS_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS orders_open ON orders (symbol) WHERE status = 'open';",
+    "CREATE INDEX IF NOT EXISTS orders_user ON orders (user_id, id);",
+)
+
+ORDER_COLUMNS = (
+    "id", "user_id", "symbol", "side", "type", "shares", "trigger_price",
+    "status", "created_at", "filled_at", "fill_price", "error",
+)
+
+
+def create_orders(connection):
+    connection.execute(CREATE_ORDERS_TABLE)
+    for query in CREATE_ORDERS_INDEXES:
+        connection.execute(query)
+
+
+def fires_on_fall(order):
+    """True if the order triggers when the price falls to its trigger."""
+    return (order["side"] == "buy") == (order["type"] == "limit")
+
+
+class OrderBook:
+    """
+    Open orders indexed by symbol and trigger price.
+
+    Per symbol, orders that trigger as the price falls (buy limits, sell
+    stops) sit in a max-heap on trigger price and those that trigger as it
+    rises (sell limits, buy stops) in a min-heap. A tick pops only the
+    orders it crosses, so it costs O(k log n) for k triggered orders
+    however many are open. Removed orders are skipped when they reach the
+    top of a heap, and the heaps are rebuilt once most entries are dead.
+    """
+
+    def __init__(self):
+        self._orders = {}  # id -> order
+        self._falling = {}  # symbol -> heap of (-trigger_price, id)
+        self._rising = {}  # symbol -> heap of (trigger_price, id)
+        self._dead = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id):
+        return order_id in self._orders
+
+    def add(self, order):
+        with self._lock:
+            if order["id"] in self._orders:
+                return
+            self._orders[order["id"]] = order
+            self._push(order)
+
+    def _push(self, order):
+        if fires_on_fall(order):
+            heap, key = self._falling.setdefault(order["symbol"], []), -order["trigger_price"]
+        else:
+            heap, key = self._rising.setdefault(order["symbol"], []), order["trigger_price"]
+        heapq.heappush(heap, (key, order["id"]))
+
+    def symbols(self):
+        """Return the symbols that have open orders."""
+        with self._lock:
+            return sorted(set(self._falling) | set(self._rising))
+
+    def remove(self, order_id):
+        """Drop an order; returns it, or None if it isn't in the book."""
+        with self._lock:
+            order = self._orders.pop(order_id, None)
+            if order is not None:
+                self._dead += 1
+                if self._dead > 1024 and self._dead > len(self._orders):
+                    self._rebuild()
+            return order
+
+    def _rebuild(self):
+        self._falling, self._rising, self._dead = {}, {}, 0
+        for order in self._orders.values():
+            self._push(order)
+
+    def cross(self, symbol, price):
+        """Remove and return the orders a trade at `price` triggers."""
+        crossed = []
+        with self._lock:
+            # Heap keys are -trigger_price (falling) or trigger_price (rising),
+            # so either heap's crossed orders have keys <= sign * price
+            for heaps, sign in ((self._falling, -1), (self._rising, 1)):
+                heap = heaps.get(symbol)
+                while heap and heap[0][0] <= sign * price:
+                    _, order_id = heapq.heappop(heap)
+                    order = self._orders.pop(order_id, None)
+                    if order is None:
+                        self._dead -= 1
+                    else:
+                        crossed.append(order)
+                if heap is not None and not heap:
+                    del heaps[symbol]
+        return crossed
+
+
+class OrderEngine:
+    """
+    Matches resting orders in the 'orders' table against price ticks.
+
+    The book holds every open order in memory. `on_price` fills the orders
+    a tick triggers at the tick's price, each in its own transaction: the
+    order is claimed with a conditional update, so an order cancelled or
+    filled by another process is skipped, and an order the user can no
+    longer afford or cover is marked rejected. An order whose fill fails
+    for any other reason goes back in the book for the next tick. Orders
+    placed by other processes are picked up at most `sync_interval`
+    seconds later.
+
+    Once started, a background thread does the matching, so requests that
+    see a price only queue it with `submit`. Every `poll_interval` seconds
+    the thread also looks up the price of each symbol with open orders
+    through `lookup`, so orders fill without anyone requesting a quote.
+    `on_fill(order)` is called for each filled order.
+    """
+
+    def __init__(self, db, book=None, sync_interval=1.0, lookup=None, poll_interval=60.0,
+                 on_fill=None, clock=time.monotonic):
+        self.db = db
+        self.book = book if book is not None else OrderBook()
+        self.sync_interval = sync_interval
+        self.lookup = lookup
+        self.poll_interval = poll_interval
+        self.on_fill = on_fill
+        self.clock = clock
+
+        self._last_id = 0
+        self._synced_at = None
+        self._sync_lock = threading.Lock()
+        self._ticks = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sync(self):
+        """Load open orders placed since the last sync."""
+        with self._sync_lock:
+            query = (
+                "SELECT id, user_id, symbol, side, type, shares, trigger_price FROM orders "
+                "WHERE id > ? AND status = 'open' ORDER BY id"
+            )
+            with closing(self.db.fetch_iter(query, self._last_id)) as rows:
+                for row in rows:
+                    self.book.add(dict(row))
+                    self._last_id = row["id"]
+            self._synced_at = self.clock()
+
+    def place(self, user_id, symbol, side, order_type, shares, trigger_price):
+        """Store a new open order and add it to the book; returns its id."""
+        query = (
+            "INSERT INTO orders (user_id, symbol, side, type, shares, trigger_price) "
+            "VALUES (?, ?, ?, ?, ?, ?)"
+        )
+        args = (user_id, symbol, side, order_type, shares, trigger_price)
+        with self.db.transaction() as connection:
+            order_id = connection.execute(query, args).lastrowid
+        self.book.add({
+            "id": order_id,
+            "user_id": user_id,
+            "symbol": symbol,
+            "side": side,
+            "type": order_type,
+            "shares": shares,
+            "trigger_price": trigger_price,
+        })
+        return order_id
+
+    def cancel(self, user_id, order_id):
+        """Cancel one of the user's open orders; returns False if there's none."""
+        query = (
+            "UPDATE orders SET status = 'cancelled' "
+            "WHERE id = ? AND user_id = ? AND status = 'open'"
+        )
+        with self.db.transaction() as connection:
+            cancelled = connection.execute(query, (order_id, user_id)).rowcount > 0
+        if cancelled:
+            self.book.remove(order_id)
+        return cancelled
+
+    def on_price(self, symbol, price):
+        """Fill the open orders for symbol a trade at price triggers; returns them."""
+        if self._synced_at is None or self.clock() - self._synced_at >= self.sync_interval:
+            self.sync()
+
+        filled = []
+        for order in self.book.cross(symbol, price):
+            try:
+                if not self._fill(order, price):
+                    continue
+            except Exception:
+                # Still open in the database; retry on a later tick
+                logger.exception("failed to fill order %s", order["id"])
+                self.book.add(order)
+                continue
+            filled.append(order)
+            if self.on_fill is not None:
+                self.on_fill(order)
+        return filled
+
+    def _fill(self, order, price):
+        shares = order["shares"] if order["side"] == "buy" else -order["shares"]
+        query = (
+            "UPDATE orders SET status = 'filled', fill_price = ?, filled_at = CURRENT_TIMESTAMP "
+            "WHERE id = ? AND status = 'open'"
+        )
+        try:
+            with self.db.transaction() as connection:
+                # Claim the order, unless it was cancelled or filled elsewhere
+                if not connection.execute(query, (price, order["id"])).rowcount:
+                    return False
+                execute_trade(self.db, order["user_id"], order["symbol"], price, shares)
+        except TradeError as e:
+            query = "UPDATE orders SET status = 'rejected', error = ? WHERE id = ? AND status = 'open'"
+            self.db.execute_query(query, e.message, order["id"])
+            return False
+        return True
+
+    def submit(self, symbol, price):
+        """Queue a price tick for the matching thread."""
+        self._ticks.put((symbol, price))
+
+    def run_pending(self):
+        """Match every queued tick in the calling thread; returns the fills."""
+        filled = []
+        while True:
+            try:
+                symbol, price = self._ticks.get_nowait()
+            except queue.Empty:
+                return filled
+            filled += self.on_price(symbol, price)
+
+    def poll(self):
+        """Match the current price of every symbol with open orders."""
+        self.sync()
+        for symbol in self.book.symbols():
+            try:
+                quote = self.lookup(symbol)
+            except UpstreamError:
+                continue
+            # Never fill at a last known price
+            if quote and not quote.get("stale"):
+                self.on_price(symbol, quote["price"])
+
+    def _run(self):
+        next_poll = self.clock()
+        while not self._stop.is_set():
+            if self.lookup is not None and self.poll_interval > 0 and self.clock() >= next_poll:
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("order price poll failed")
+                next_poll = self.clock() + self.poll_interval
+            try:
+                symbol, price = self._ticks.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self.on_price(symbol, price)
+            except Exception:
+                logger.exception("order matching failed for %s", symbol)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="order-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
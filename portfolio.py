@@ -0,0 +1,79 @@
+def load_positions(db, user_id):
+    """Return a user's holdings rows, closed positions included."""
+    query = (
+        "SELECT symbol, shares, cost_basis, realized FROM holdings "
+        "WHERE user_id = ? ORDER BY symbol"
+    )
+    return db.fetch_all(query, user_id)
+
+
+def value_portfolio(cash, holdings, quotes):
+    """
+    Value holdings against current quotes in a single pass.
+
+    `quotes` maps symbol to a quote dict (with "price" and optionally
+    "previous_close") or None when no price is available. Positions without
+    a price are carried at cost; last known prices (quotes marked "stale")
+    are flagged on their position. Returns a dict with a "positions" list of
+    open positions and portfolio totals.
+    """
+    positions = []
+    totals = {
+        "cost_basis": 0.0,
+        "market_value": 0.0,
+        "unrealized": 0.0,
+        "realized": 0.0,
+        "daily_change": 0.0,
+    }
+
+    for row in holdings:
+        totals["realized"] += row["realized"]
+        shares = row["shares"]
+        if shares <= 0:
+            continue
+
+        quote = quotes.get(row["symbol"])
+        price = quote["price"] if quote else None
+        previous_close = quote.get("previous_close") if quote else None
+        stale = bool(quote and quote.get("stale"))
+        cost_basis = row["cost_basis"]
+
+        if price is None:
+            market_value = cost_basis
+            unrealized = None
+        else:
+            market_value = shares * price
+            unrealized = market_value - cost_basis
+            totals["unrealized"] += unrealized
+
+        if price is not None and previous_close is not None:
+            daily_change = (price - previous_close) * shares
+            totals["daily_change"] += daily_change
+        else:
+            daily_change = None
+
+        totals["cost_basis"] += cost_basis
+        totals["market_value"] += market_value
+        positions.append(
+            {
+                "symbol": row["symbol"],
+                "shares": shares,
+                "price": price,
+                "stale": stale,
+                "cost_basis": cost_basis,
+                "market_value": market_value,
+                "unrealized": unrealized,
+                "realized": row["realized"],
+                "daily_change": daily_change,
+            }
+        )
+
+    # Weights are shares of the invested (non-cash) value
+    for position in positions:
+        position["weight"] = (
+            position["market_value"] / totals["market_value"] if totals["market_value"] else 0.0
+        )
+
+    totals["cash"] = cash
+    totals["total"] = cash + totals["market_value"]
+    return {"positions": positions, **totals}
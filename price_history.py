@@ -0,0 +1,180 @@
+import datetime
+from array import array
+
+
+CREATE_PRICE_HISTORY_TABLE = """
+    CREATE TABLE IF NOT EXISTS price_history (
+        symbol TEXT NOT NULL,
+        date TEXT NOT NULL,
+        close NUMERIC NOT NULL,
+        PRIMARY KEY(symbol, date)
+    ) WITHOUT ROWID;
+"""
+
+
+# Contiguous date range already downloaded per symbol, so gaps can be found
+# without guessing at trading days
+CREATE_PRICE_HISTORY_RANGES_TABLE = """
+    CREATE TABLE IF NOT EXISTS price_history_ranges (
+        symbol TEXT PRIMARY KEY NOT NULL,
+        first_date TEXT NOT NULL,
+        last_date TEXT NOT NULL
+    ) WITHOUT ROWID;
+"""
+
+# Numeric bar columns, in storage order after the date
+BAR_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+def create_price_history(connection):
+    connection.execute(CREATE_PRICE_HISTORY_TABLE)
+
+
+def add_bars_to_price_history(connection):
+    """Store full daily OHLCV bars, not just closes."""
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(price_history)")]
+    for column in ("open", "high", "low", "volume"):
+        if column not in columns:
+            connection.execute(f"ALTER TABLE price_history ADD COLUMN {column} NUMERIC")
+    connection.execute(CREATE_PRICE_HISTORY_RANGES_TABLE)
+
+
+def utc_today():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+class PriceHistory:
+    """
+    Daily bars per symbol in the SQLite 'price_history' table.
+
+    Dates are ISO strings. Rows are clustered by (symbol, date), so a range
+    read is one sequential index walk. Full OHLCV bars come from the
+    provider; when only a quote is seen, it stands in as the day's close.
+    """
+
+    def __init__(self, db, today=utc_today):
+        self.db = db
+        self.today = today
+
+    def record(self, symbol, date, close):
+        query = (
+            "INSERT INTO price_history (symbol, date, close) VALUES (?, ?, ?) "
+            "ON CONFLICT(symbol, date) DO UPDATE SET close = excluded.close "
+            "WHERE close != excluded.close"
+        )
+        self.db.execute_query(query, symbol, str(date), close)
+
+    def record_bars(self, symbol, bars):
+        """Upsert (date, open, high, low, close, volume) bars for symbol."""
+        query = (
+            "INSERT INTO price_history (symbol, date, open, high, low, close, volume) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(symbol, date) DO UPDATE SET "
+            "open = excluded.open, high = excluded.high, low = excluded.low, "
+            "close = excluded.close, volume = excluded.volume "
+            "WHERE (open, high, low, close, volume) IS NOT "
+            "(excluded.open, excluded.high, excluded.low, excluded.close, excluded.volume)"
+        )
+        with self.db.transaction() as connection:
+            connection.executemany(query, ((symbol, *bar) for bar in bars))
+
+    def record_quote(self, quote):
+        """Record a fetched quote as today's close for its symbol."""
+        self.record(quote["symbol"], self.today(), quote["price"])
+
+    def latest(self, symbol):
+        """Return (date, close) of the most recent close for symbol, or None."""
+        row = self.db.fetch_one(
+            "SELECT date, close FROM price_history WHERE symbol = ? ORDER BY date DESC LIMIT 1",
+            symbol,
+        )
+        return (row["date"], row["close"]) if row is not None else None
+
+    def closes(self, symbol, start, end):
+        """
+        Return [(date, close)] for `symbol` from `start` to `end` inclusive.
+
+        The first entry is the last close on or before `start`, if any, so
+        callers can carry prices forward over days without a close.
+        """
+        query = (
+            "SELECT date, close FROM price_history "
+            "WHERE symbol = ? AND date <= ? ORDER BY date DESC LIMIT 1"
+        )
+        rows = self.db.fetch_all(query, symbol, str(start))
+        query = (
+            "SELECT date, close FROM price_history "
+            "WHERE symbol = ? AND date > ? AND date <= ? ORDER BY date"
+        )
+        rows += self.db.fetch_all(query, symbol, str(start), str(end))
+        return [(row["date"], row["close"]) for row in rows]
+
+    def fill(self, symbol, start, end, fetch_history):
+        """
+        Download bars for the parts of [start, end] not fetched before.
+
+        `fetch_history(symbol, start, end)` returns bars, or None on failure
+        (the gap is then retried next time). Today is never marked as
+        fetched, since its bar is still changing.
+        """
+        start = datetime.date.fromisoformat(str(start))
+        end = datetime.date.fromisoformat(str(end))
+        yesterday = self.today() - datetime.timedelta(days=1)
+        day = datetime.timedelta(days=1)
+
+        row = self.db.fetch_one(
+            "SELECT first_date, last_date FROM price_history_ranges WHERE symbol = ?", symbol
+        )
+        if row is None:
+            covered_start, covered_end = None, None
+            gaps = [(start, end)] if start <= end else []
+        else:
+            covered_start = datetime.date.fromisoformat(row["first_date"])
+            covered_end = datetime.date.fromisoformat(row["last_date"])
+            gaps = []
+            if start < covered_start:
+                gaps.append((start, covered_start - day))
+            if end > covered_end:
+                gaps.append((covered_end + day, end))
+
+        for gap_start, gap_end in gaps:
+            bars = fetch_history(symbol, gap_start, gap_end)
+            if bars is None:
+                continue
+            self.record_bars(symbol, bars)
+            if covered_start is None:
+                covered_start, covered_end = gap_start, min(gap_end, yesterday)
+            else:
+                covered_start = min(covered_start, gap_start)
+                covered_end = max(covered_end, min(gap_end, yesterday))
+
+        if covered_start is not None and covered_start <= covered_end:
+            query = (
+                "INSERT INTO price_history_ranges (symbol, first_date, last_date) VALUES (?, ?, ?) "
+                "ON CONFLICT(symbol) DO UPDATE SET "
+                "first_date = excluded.first_date, last_date = excluded.last_date"
+            )
+            self.db.execute_query(
+                query, symbol, covered_start.isoformat(), covered_end.isoformat()
+            )
+
+    def bars(self, symbol, start, end):
+        """
+        Return bars for symbol from `start` to `end` inclusive as columns.
+
+        "date" is a list of ISO strings; the other columns are
+        array("d") buffers (missing values are NaN), which analytics code
+        can wrap without copying, e.g. numpy.frombuffer(bars["close"]).
+        """
+        columns = {"date": []}
+        columns.update((column, array("d")) for column in BAR_COLUMNS)
+        query = (
+            "SELECT date, open, high, low, close, volume FROM price_history "
+            "WHERE symbol = ? AND date >= ? AND date <= ? ORDER BY date"
+        )
+        nan = float("nan")
+        for date, *values in self.db.fetch_all(query, symbol, str(start), str(end)):
+            columns["date"].append(date)
+            for column, value in zip(BAR_COLUMNS, values):
+                columns[column].append(nan if value is None else value)
+        return columns
@@ -0,0 +1,210 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class _Abandoned(Exception):
+    """Set on a shared fetch whose leader was cancelled; waiters retry."""
+
+
+class QuoteCache:
+    """
+    In-process quote cache keyed by symbol.
+
+    Fresh entries are served directly. Entries older than `ttl` but younger
+    than `ttl + stale_ttl` are served as-is while a background thread refreshes
+    them. Failed lookups are remembered for `negative_ttl` seconds so invalid
+    symbols don't hit the upstream on every request. Concurrent misses for
+    the same symbol share a single fetch (single-flight). Errors raised by
+    `fetch` reach every caller sharing the fetch and are not cached. `afetch`, if given,
+    is the awaitable counterpart of `fetch` used by `aget`.
+    """
+
+    def __init__(self, fetch, ttl=60.0, stale_ttl=300.0, negative_ttl=30.0,
+                 maxsize=1024, clock=time.monotonic, afetch=None):
+        self.fetch = fetch
+        self.afetch = afetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.clock = clock
+
+        self._entries = OrderedDict()  # symbol -> (quote, fetched_at)
+        self._refreshing = set()
+        self._inflight = {}  # symbol -> Future of the fetch in progress
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, symbol):
+        found, quote = self._cached(symbol)
+        if found:
+            return quote
+
+        future, leader = self._join(symbol)
+        if leader:
+            with self._leading(symbol, future):
+                quote = self.fetch(symbol)
+                self._store(symbol, quote)
+                if not future.done():
+                    future.set_result(quote)
+        else:
+            try:
+                quote = future.result()
+            except _Abandoned:
+                return self.get(symbol)
+        return dict(quote) if quote is not None else None
+
+    async def aget(self, symbol):
+        """Like `get`, but awaits `afetch` on a miss instead of blocking."""
+        found, quote = self._cached(symbol)
+        if found:
+            return quote
+
+        future, leader = self._join(symbol)
+        if leader:
+            # The fetch is a task of its own, so cancelling this caller (say
+            # at a lookup deadline) leaves it running for the waiters
+            task = asyncio.ensure_future(self._alead(symbol, future))
+            task.add_done_callback(_retrieve)
+            quote = await asyncio.shield(task)
+        else:
+            # Shielded, so a cancelled waiter doesn't cancel the shared fetch
+            try:
+                quote = await asyncio.shield(asyncio.wrap_future(future))
+            except _Abandoned:
+                return await self.aget(symbol)
+        return dict(quote) if quote is not None else None
+
+    async def _alead(self, symbol, future):
+        with self._leading(symbol, future):
+            quote = await self.afetch(symbol)
+            self._store(symbol, quote)
+            if not future.done():
+                future.set_result(quote)
+        return quote
+
+    def _join(self, symbol):
+        """Return (future, True) to lead a fetch, or the one in flight."""
+        with self._lock:
+            future = self._inflight.get(symbol)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._inflight[symbol] = Future()
+            return future, True
+
+    @contextmanager
+    def _leading(self, symbol, future):
+        # Waiters see the leader's error; later callers start a new fetch.
+        # If the leader was cancelled (its event loop shut down, say), the
+        # waiters start a new fetch instead of failing.
+        try:
+            yield
+        except Exception as error:
+            if not future.done():
+                future.set_exception(error)
+            raise
+        except BaseException:
+            if not future.done():
+                future.set_exception(_Abandoned())
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(symbol, None)
+
+    def _cached(self, symbol):
+        """Return (True, quote) if the cache can answer, else (False, None)."""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None:
+                quote, fetched_at = entry
+                age = now - fetched_at
+
+                if quote is None and age < self.negative_ttl:
+                    self.negative_hits += 1
+                    self._entries.move_to_end(symbol)
+                    return True, None
+
+                if quote is not None and age < self.ttl:
+                    self.hits += 1
+                    self._entries.move_to_end(symbol)
+                    return True, dict(quote)
+
+                if quote is not None and age < self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    self._entries.move_to_end(symbol)
+                    self._refresh_in_background(symbol)
+                    return True, dict(quote)
+
+            self.misses += 1
+            return False, None
+
+    def _store(self, symbol, quote):
+        with self._lock:
+            self._entries[symbol] = (quote, self.clock())
+            self._entries.move_to_end(symbol)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _refresh_in_background(self, symbol):
+        # Called with the lock held
+        if symbol in self._refreshing:
+            return
+        self._refreshing.add(symbol)
+        threading.Thread(
+            target=self._refresh,
+            args=(symbol,),
+            name=f"quote-refresh-{symbol}",
+            daemon=True,
+        ).start()
+
+    def _refresh(self, symbol):
+        try:
+            quote = self.fetch(symbol)
+            # Keep serving the stale price if the refresh failed
+            if quote is not None:
+                self._store(symbol, quote)
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(symbol)
+
+    def last_known(self, symbol):
+        """Return the cached quote for symbol however old it is, or None."""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is None or entry[0] is None:
+                return None
+            return dict(entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "size": len(self._entries),
+            }
+
+
+def _retrieve(task):
+    # Mark the error of a fetch whose leader stopped waiting as seen
+    if not task.cancelled():
+        task.exception()
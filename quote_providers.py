@@ -0,0 +1,283 @@
+import abc
+import asyncio
+import csv
+import datetime
+import math
+import random
+import sqlite3
+import threading
+import time
+import urllib
+import zlib
+
+import pytz
+import requests
+
+
+def parse_latest_close(content, column=b"Adj Close", skip=0):
+    """
+    Return `column` of the last row of a CSV quote payload as a float.
+
+    Works on the raw response bytes: only the header and the final line are
+    split, no per-row dicts are built. `skip` ignores that many rows at the
+    end, e.g. skip=1 gives the previous close.
+    """
+    header_end = content.find(b"\n")
+    if header_end < 0:
+        raise IndexError("no rows in quote payload")
+    index = content[:header_end].rstrip(b"\r").split(b",").index(column)
+
+    # Skip trailing blank lines without copying the payload
+    end = len(content)
+    while end and content[end - 1] in b"\r\n":
+        end -= 1
+    line_start = content.rfind(b"\n", 0, end) + 1
+    for _ in range(skip):
+        end = line_start - 1
+        if end <= header_end:
+            raise IndexError("no rows in quote payload")
+        if content[end - 1:end] == b"\r":
+            end -= 1
+        line_start = content.rfind(b"\n", 0, end) + 1
+    if line_start <= header_end:
+        raise IndexError("no rows in quote payload")
+    return float(content[line_start:end].split(b",")[index])
+
+
+def parse_bars(content):
+    """
+    Return daily bars from a CSV quote payload as (date, open, high, low,
+    close, volume) tuples, oldest first.
+
+    `close` is the adjusted close, matching quoted prices. Rows with missing
+    values (Yahoo writes "null") are skipped.
+    """
+    lines = content.split(b"\n")
+    header = lines[0].rstrip(b"\r").split(b",")
+    columns = [header.index(name) for name in (b"Open", b"High", b"Low", b"Adj Close", b"Volume")]
+    date_index = header.index(b"Date")
+
+    bars = []
+    for line in lines[1:]:
+        fields = line.rstrip(b"\r").split(b",")
+        if len(fields) < len(header):
+            continue
+        try:
+            open_, high, low, close, volume = (float(fields[i]) for i in columns)
+        except ValueError:
+            continue
+        bars.append((fields[date_index].decode(), open_, high, low, close, volume))
+    return bars
+
+
+class UpstreamError(Exception):
+    """
+    The quote upstream couldn't answer (timeout, connection or server
+    error). `throttled` is set when it asked us to slow down.
+    """
+
+    def __init__(self, message, throttled=False):
+        super().__init__(message)
+        self.throttled = throttled
+
+
+class QuoteProvider(abc.ABC):
+    """Source of stock quotes. Subclasses implement `fetch`."""
+
+    @abc.abstractmethod
+    def fetch(self, symbol):
+        """
+        Return {"name", "price", "symbol"} for symbol, or None if the symbol
+        is unknown. Raise UpstreamError if the upstream is unavailable.
+        """
+
+    def history(self, symbol, start, end):
+        """
+        Return daily bars for symbol between two dates (inclusive), as
+        parse_bars does, or None if they can't be fetched right now.
+        Providers without history return no bars.
+        """
+        return []
+
+    async def afetch(self, symbol):
+        """
+        Awaitable fetch. The default runs `fetch` in a worker thread;
+        providers that can wait without blocking a thread override it.
+        """
+        return await asyncio.to_thread(self.fetch, symbol)
+
+
+class YahooProvider(QuoteProvider):
+    """
+    Quotes from the Yahoo Finance CSV download API.
+
+    Requests are blocking, so `afetch` keeps the default worker thread.
+    """
+
+    def __init__(self, session=None, timeout=None):
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def _download(self, symbol, start, end):
+        """Return the raw daily CSV for symbol between two datetimes."""
+        # Yahoo Finance API
+        url = (
+            f"https://query1.finance.yahoo.com/v7/finance/download/{urllib.parse.quote_plus(symbol)}"
+            f"?period1={int(start.timestamp())}"
+            f"&period2={int(end.timestamp())}"
+            f"&interval=1d&events=history&includeAdjustedClose=true"
+        )
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def fetch(self, symbol):
+        # Prepare API request
+        symbol = symbol.upper()
+        end = datetime.datetime.now(pytz.timezone("US/Eastern"))
+        start = end - datetime.timedelta(days=7)
+
+        # Query API
+        try:
+            content = self._download(symbol, start, end)
+
+            # CSV header: Date,Open,High,Low,Close,Adj Close,Volume
+            price = round(parse_latest_close(content), 2)
+            try:
+                previous_close = round(parse_latest_close(content, skip=1), 2)
+            except (ValueError, IndexError):
+                previous_close = None
+            return {
+                "name": symbol,
+                "price": price,
+                "previous_close": previous_close,
+                "symbol": symbol,
+            }
+        except requests.HTTPError as e:
+            # Unknown symbols are a 404; anything else is the upstream's fault
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and status < 500 and status != 429:
+                return None
+            raise UpstreamError(str(e), throttled=status == 429) from e
+        except requests.RequestException as e:
+            raise UpstreamError(str(e)) from e
+        except (ValueError, KeyError, IndexError):
+            return None
+
+    def history(self, symbol, start, end):
+        eastern = pytz.timezone("US/Eastern")
+        start = eastern.localize(datetime.datetime.combine(start, datetime.time()))
+        end = eastern.localize(datetime.datetime.combine(end, datetime.time.max))
+        try:
+            return parse_bars(self._download(symbol.upper(), start, end))
+        except (requests.RequestException, ValueError):
+            return None
+
+
+class LocalProvider(QuoteProvider):
+    """
+    Offline quotes for benchmarks and CI.
+
+    With `path`, prices are replayed in order from a CSV file with `symbol`
+    and `price` columns, or from a SQLite file with a `prices(symbol, price)`
+    table; each symbol cycles through its own prices and unknown symbols
+    return None. Without `path`, every alphabetic symbol follows a
+    deterministic random walk seeded by `seed`. `latency` seconds (plus up to
+    `jitter` seconds) are slept per fetch to mimic the network.
+    """
+
+    def __init__(self, path=None, seed=0, volatility=0.01, latency=0.0, jitter=0.0):
+        self.seed = seed
+        self.volatility = volatility
+        self.latency = latency
+        self.jitter = jitter
+
+        self._lock = threading.Lock()
+        self._prices = {}  # symbol -> replayed prices or current walk price
+        self._steps = {}  # symbol -> replay position or walk generator
+        self._previous = {}  # symbol -> price returned by the previous fetch
+        self._replay = path is not None
+        if path is not None:
+            self._load(path)
+
+    def _load(self, path):
+        if path.endswith(".csv"):
+            with open(path, newline="") as file:
+                rows = [(row["symbol"], row["price"]) for row in csv.DictReader(file)]
+        else:
+            connection = sqlite3.connect(path)
+            try:
+                rows = connection.execute(
+                    "SELECT symbol, price FROM prices ORDER BY rowid"
+                ).fetchall()
+            finally:
+                connection.close()
+
+        for symbol, price in rows:
+            self._prices.setdefault(symbol.upper(), []).append(float(price))
+
+    def fetch(self, symbol):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        return self._quote(symbol)
+
+    async def afetch(self, symbol):
+        # Simulated latency doesn't hold a thread
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        return self._quote(symbol)
+
+    def _quote(self, symbol):
+        symbol = symbol.upper()
+        with self._lock:
+            previous_close = self._previous.get(symbol)
+            if self._replay:
+                price = self._next_replayed(symbol)
+            else:
+                price = self._next_walked(symbol)
+            self._previous[symbol] = price
+
+        if price is None:
+            return None
+        return {
+            "name": symbol,
+            "price": round(price, 2),
+            "previous_close": round(previous_close, 2) if previous_close else None,
+            "symbol": symbol,
+        }
+
+    def _next_replayed(self, symbol):
+        prices = self._prices.get(symbol)
+        if not prices:
+            return None
+        position = self._steps.get(symbol, 0)
+        self._steps[symbol] = (position + 1) % len(prices)
+        return prices[position]
+
+    def _next_walked(self, symbol):
+        if not symbol.isalpha():
+            return None
+        rng = self._steps.get(symbol)
+        if rng is None:
+            # Stable per-symbol stream, independent of lookup order
+            rng = self._steps[symbol] = random.Random(self.seed ^ zlib.crc32(symbol.encode()))
+            self._prices[symbol] = rng.uniform(10, 500)
+        else:
+            self._prices[symbol] *= math.exp(rng.gauss(0, self.volatility))
+        return self._prices[symbol]
+
+
+def create_provider(spec, session=None, timeout=None, latency=0.0):
+    """
+    Build a provider from a config string.
+
+    "yahoo" selects YahooProvider. "local" selects a random-walk
+    LocalProvider, and "local:<path>" replays prices from a CSV or SQLite
+    file.
+    """
+    name, _, path = spec.partition(":")
+    if name == "yahoo":
+        return YahooProvider(session=session, timeout=timeout)
+    if name == "local":
+        return LocalProvider(path=path or None, latency=latency)
+    raise ValueError(f"unknown quote provider: {spec}")
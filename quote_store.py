@@ -0,0 +1,191 @@
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+from quote_providers import UpstreamError
+
+
+logger = logging.getLogger(__name__)
+
+# Lease owner left behind by a fetch that found the symbol unknown
+NOT_FOUND = "not-found"
+
+
+def add_previous_close_to_quotes(connection):
+    """Keep the previous close with each stored quote, for daily change."""
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(quotes)")]
+    if "previous_close" not in columns:
+        connection.execute("ALTER TABLE quotes ADD COLUMN previous_close NUMERIC")
+
+
+class QuoteStore:
+    """
+    Quotes shared between worker processes through the SQLite 'quotes' table.
+
+    Quotes older than `max_age` seconds are treated as missing, so requests
+    fall back to the quote provider if the refresher stops.
+    """
+
+    def __init__(self, db, max_age=120.0, clock=time.time):
+        self.db = db
+        self.max_age = max_age
+        self.clock = clock
+        # Lookups answered by another process's fetch
+        self.coalesced = 0
+
+    def get(self, symbol):
+        query = "SELECT price, previous_close, updated_at FROM quotes WHERE symbol = ?"
+        row = self.db.fetch_one(query, symbol)
+        if row is None or self.clock() - row["updated_at"] > self.max_age:
+            return None
+        return {
+            "name": symbol,
+            "price": row["price"],
+            "previous_close": row["previous_close"],
+            "symbol": symbol,
+        }
+
+    def put(self, quote):
+        query = (
+            "INSERT INTO quotes (symbol, price, previous_close, updated_at) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(symbol) DO UPDATE SET "
+            "price = excluded.price, previous_close = excluded.previous_close, "
+            "updated_at = excluded.updated_at"
+        )
+        self.db.execute_query(
+            query, quote["symbol"], quote["price"], quote.get("previous_close"), self.clock()
+        )
+
+    def wait(self, symbol, lease, timeout, poll=0.05):
+        """
+        Wait up to `timeout` seconds for the process holding `lease` to
+        publish symbol. Return the quote, or None if it found the symbol
+        unknown; raise TimeoutError if nothing is published in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            quote = self.get(symbol)
+            if quote is not None:
+                self.coalesced += 1
+                return quote
+            if self._not_found(lease):
+                self.coalesced += 1
+                return None
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"no quote published for {symbol}")
+            time.sleep(poll)
+
+    def _not_found(self, lease):
+        query = "SELECT 1 FROM leases WHERE name = ? AND owner = ? AND expires_at > ?"
+        return self.db.fetch_one(query, lease, NOT_FOUND, self.clock()) is not None
+
+    def acquire_lease(self, name, owner, ttl):
+        """Take or renew lease `name` for `ttl` seconds; return True if held."""
+        now = self.clock()
+        # A single upsert, which only overwrites our own or an expired lease
+        query = (
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET "
+            "owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?"
+        )
+        with self.db.transaction() as connection:
+            return connection.execute(query, (name, owner, now + ttl, now)).rowcount > 0
+
+    def release_lease(self, name, owner):
+        """Give up lease `name` if `owner` still holds it."""
+        self.db.execute_query("DELETE FROM leases WHERE name = ? AND owner = ?", name, owner)
+
+    def publish(self, lease, owner, quote, missing_ttl):
+        """
+        Store the quote fetched under `lease` and release it, in one
+        transaction. If the symbol was unknown (quote is None), the lease
+        passes to NOT_FOUND for `missing_ttl` seconds instead, so waiting
+        processes and later ones return None without fetching.
+        """
+        with self.db.transaction():
+            if quote is not None:
+                self.put(quote)
+                self.release_lease(lease, owner)
+            else:
+                query = (
+                    "UPDATE leases SET owner = ?, expires_at = ? WHERE name = ? AND owner = ?"
+                )
+                self.db.execute_query(
+                    query, NOT_FOUND, self.clock() + missing_ttl, lease, owner
+                )
+
+
+class PriceRefresher:
+    """
+    Background thread that keeps quotes for every held symbol in a QuoteStore.
+
+    Every `interval` seconds (randomly stretched or shrunk by up to `jitter`)
+    the lease holder fetches each held symbol, at most `rate` fetches per
+    second, and writes the results to the store.
+    """
+
+    LEASE = "price-refresher"
+
+    def __init__(self, db, store, fetch, interval=60.0, jitter=0.1, rate=5.0):
+        self.db = db
+        self.store = store
+        self.fetch = fetch
+        self.interval = interval
+        self.jitter = jitter
+        self.rate = rate
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def held_symbols(self):
+        # Symbols with open orders too, so their orders see price updates
+        query = (
+            "SELECT symbol FROM holdings WHERE shares > 0 "
+            "UNION SELECT symbol FROM orders WHERE status = 'open'"
+        )
+        return [row["symbol"] for row in self.db.fetch_all(query)]
+
+    def refresh_once(self):
+        """Refresh every held symbol if this process holds the lease."""
+        if not self.store.acquire_lease(self.LEASE, self.owner, self.interval * 2):
+            return 0
+
+        refreshed = 0
+        for i, symbol in enumerate(self.held_symbols()):
+            # Space out upstream calls to respect the rate limit
+            if i and self._stop.wait(1 / self.rate):
+                break
+            try:
+                quote = self.fetch(symbol)
+            except UpstreamError:
+                # Leave the rest for the next round rather than pile on
+                logger.warning("quote upstream unavailable, refresh cut short")
+                break
+            if quote is not None:
+                self.store.put(quote)
+                refreshed += 1
+        return refreshed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except Exception:
+                logger.exception("price refresh failed")
+            delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            self._stop.wait(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="price-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,229 @@
+import datetime
+import logging
+
+from price_history import PriceHistory, utc_today
+
+
+logger = logging.getLogger(__name__)
+
+
+CREATE_SNAPSHOTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS snapshots (
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        cash NUMERIC NOT NULL,
+        market_value NUMERIC NOT NULL,
+        PRIMARY KEY(user_id, date),
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    ) WITHOUT ROWID;
+"""
+
+# Earliest day whose snapshot is out of date, per user
+CREATE_SNAPSHOT_DIRTY_TABLE = """
+    CREATE TABLE IF NOT EXISTS snapshot_dirty (
+        user_id INTEGER PRIMARY KEY NOT NULL,
+        since TEXT NOT NULL
+    ) WITHOUT ROWID;
+"""
+
+# A trade invalidates its user's snapshots from the trade date on
+TRANSACTIONS_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS transactions_mark_snapshots
+    AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO snapshot_dirty (user_id, since)
+        VALUES (NEW.user_id, date(NEW.timestamp))
+        ON CONFLICT(user_id) DO UPDATE SET since = MIN(since, excluded.since);
+    END;
+"""
+
+# A new or changed close invalidates the snapshots of everyone who has held
+# the symbol from that date on
+PRICE_HISTORY_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS price_history_{event.lower()}_mark_snapshots
+    AFTER {event} ON price_history
+    BEGIN
+        INSERT INTO snapshot_dirty (user_id, since)
+        SELECT user_id, NEW.date FROM holdings WHERE symbol = NEW.symbol
+        ON CONFLICT(user_id) DO UPDATE SET since = MIN(since, excluded.since);
+    END;
+    """
+    for event in ("INSERT", "UPDATE")
+]
+
+
+def create_snapshots(connection):
+    """Create the snapshot tables and mark every existing history as dirty."""
+    for statement in (
+        CREATE_SNAPSHOTS_TABLE,
+        CREATE_SNAPSHOT_DIRTY_TABLE,
+        TRANSACTIONS_TRIGGER,
+        *PRICE_HISTORY_TRIGGERS,
+    ):
+        connection.execute(statement)
+    connection.execute(
+        "INSERT OR IGNORE INTO snapshot_dirty (user_id, since) "
+        "SELECT user_id, MIN(date(timestamp)) FROM transactions GROUP BY user_id"
+    )
+
+
+def pending_users(db, today, user_id=None):
+    """
+    Return {user_id: first day to recompute} for users with stale snapshots.
+
+    A user is pending if a trade or close changed past days, or if their
+    series stops before `today`.
+    """
+    today = str(today)
+    where = "WHERE user_id = ?" if user_id is not None else ""
+    user_args = [user_id] if user_id is not None else []
+    query = (
+        f"SELECT user_id, since FROM snapshot_dirty {where} "
+        "UNION ALL "
+        "SELECT user_id, date(MAX(date), '+1 day') AS since FROM snapshots "
+        f"{where} GROUP BY user_id HAVING MAX(date) < ?"
+    )
+
+    pending = {}
+    for row in db.fetch_all(query, *user_args, *user_args, today):
+        since = min(row["since"], today)
+        pending[row["user_id"]] = min(pending.get(row["user_id"], since), since)
+    return pending
+
+
+def update_user(db, history, user_id, since, today):
+    """Recompute one user's daily snapshots from `since` through `today`."""
+    since, today = str(since), str(today)
+
+    with db.transaction():
+        user = db.fetch_one("SELECT cash FROM users WHERE id = ?", user_id)
+        if user is None:
+            db.execute_query("DELETE FROM snapshot_dirty WHERE user_id = ?", user_id)
+            return 0
+
+        # Positions and last trade price per symbol before `since`; the bare
+        # price column comes from the row holding MAX(id)
+        positions, trade_prices = {}, {}
+        query = (
+            "SELECT symbol, SUM(shares) AS shares, price, MAX(id) FROM transactions "
+            "WHERE user_id = ? AND timestamp < ? GROUP BY symbol"
+        )
+        for row in db.fetch_all(query, user_id, since):
+            positions[row["symbol"]] = row["shares"]
+            trade_prices[row["symbol"]] = row["price"]
+
+        # Trades from `since` on, also used to wind cash back to that day
+        query = (
+            "SELECT symbol, price, shares, date(timestamp) AS date FROM transactions "
+            "WHERE user_id = ? AND timestamp >= ? ORDER BY timestamp, id"
+        )
+        trades = db.fetch_all(query, user_id, since)
+        cash = user["cash"] + sum(round(row["price"] * row["shares"], 2) for row in trades)
+
+        # Closes per symbol, seeded with the last close before `since`
+        symbols = set(positions) | {row["symbol"] for row in trades}
+        closes, prices = {}, {}
+        for symbol in symbols:
+            for date, close in history.closes(symbol, since, today):
+                if date <= since:
+                    prices[symbol] = close
+                else:
+                    closes.setdefault(date, []).append((symbol, close))
+
+        rows = []
+        next_trade = 0
+        day = datetime.date.fromisoformat(since)
+        end = datetime.date.fromisoformat(today)
+        while day <= end:
+            date = day.isoformat()
+            while next_trade < len(trades) and trades[next_trade]["date"] == date:
+                trade = trades[next_trade]
+                cash -= round(trade["price"] * trade["shares"], 2)
+                positions[trade["symbol"]] = positions.get(trade["symbol"], 0) + trade["shares"]
+                trade_prices[trade["symbol"]] = trade["price"]
+                next_trade += 1
+            for symbol, close in closes.get(date, ()):
+                prices[symbol] = close
+
+            # Symbols without a known close are carried at the last trade price
+            market_value = sum(
+                shares * prices.get(symbol, trade_prices[symbol])
+                for symbol, shares in positions.items()
+                if shares
+            )
+            rows.append((user_id, date, round(cash, 2), round(market_value, 2)))
+            day += datetime.timedelta(days=1)
+
+        with db.connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO snapshots (user_id, date, cash, market_value) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        db.execute_query("DELETE FROM snapshot_dirty WHERE user_id = ?", user_id)
+        return len(rows)
+
+
+def valued_symbols(db, user_id, since):
+    """Return the symbols a user held on or traded after `since`."""
+    query = (
+        "SELECT symbol FROM transactions WHERE user_id = ? GROUP BY symbol "
+        "HAVING SUM(shares) != 0 OR MAX(timestamp) >= ?"
+    )
+    return [row["symbol"] for row in db.fetch_all(query, user_id, str(since))]
+
+
+def update_snapshots(db, today=None, user_id=None, history=None, fetch_history=None):
+    """
+    Bring daily snapshots up to date through `today`.
+
+    Only pending users are touched, and only from their first stale day.
+    Pass `user_id` to update a single user. With `fetch_history` (e.g. a
+    quote provider's `history`), the closes of every symbol about to be
+    valued are first filled into the price history, once per symbol and
+    outside the snapshot transactions. Returns the number of snapshot rows
+    written.
+    """
+    today = today or utc_today()
+    history = history or PriceHistory(db)
+    pending = pending_users(db, today, user_id)
+
+    if fetch_history is not None:
+        starts = {}
+        for pending_user, since in pending.items():
+            for symbol in valued_symbols(db, pending_user, since):
+                starts[symbol] = min(starts.get(symbol, since), since)
+        for symbol, start in sorted(starts.items()):
+            try:
+                history.fill(symbol, start, today, fetch_history)
+            except Exception:
+                # Value the symbol at the closes already stored
+                logger.exception("failed to fill closes for %s", symbol)
+
+    return sum(
+        update_user(db, history, pending_user, since, today)
+        for pending_user, since in pending.items()
+    )
+
+
+def performance(db, user_id, start=None, end=None):
+    """Return a user's daily (date, cash, market value, total) series."""
+    query = "SELECT date, cash, market_value FROM snapshots WHERE user_id = ?"
+    args = [user_id]
+    if start:
+        query += " AND date >= ?"
+        args.append(str(start))
+    if end:
+        query += " AND date <= ?"
+        args.append(str(end))
+    query += " ORDER BY date"
+    return [
+        {
+            "date": row["date"],
+            "cash": row["cash"],
+            "market_value": row["market_value"],
+            "total": round(row["cash"] + row["market_value"], 2),
+        }
+        for row in db.fetch_all(query, *args)
+    ]
@@ -0,0 +1,124 @@
+"""
+Throughput of the async quote path against the threaded one.
+
+Run with `python -m tests.bench_async`. Serves quotes from the local
+provider with simulated upstream latency (500 ms by default) and the quote
+cache disabled, so every request waits on the upstream. Then drives
+/, /quote and /buy concurrently against a real threaded server, once with
+ASYNC_QUOTES off (lookups block on the shared lookup thread pool) and once
+with it on (lookups are awaited on the request's event loop), and reports
+requests per second for each.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from tests.bench_routes import login_data, seed, summarize
+
+
+# (name, method, path, form data)
+ROUTES = [
+    ("GET /", "GET", "/", None),
+    ("POST /quote", "POST", "/quote", {"symbol": "AAPL"}),
+    ("POST /buy", "POST", "/buy", {"symbol": "AAPL", "shares": "1"}),
+]
+
+
+def run(app, users, count, concurrency):
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    sessions = {}
+    for user in range(1, users + 1):
+        sessions[user] = requests.Session()
+        sessions[user].post(base + "/login", data=login_data(user), allow_redirects=False)
+
+    def call(i, method, path, data):
+        t0 = time.perf_counter()
+        response = sessions[i % users + 1].request(
+            method, base + path, data=data, allow_redirects=False
+        )
+        elapsed = time.perf_counter() - t0
+        assert response.status_code < 400, (path, response.status_code)
+        return elapsed
+
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for name, method, path, data in ROUTES:
+                started = time.perf_counter()
+                latencies = list(
+                    executor.map(lambda i: call(i, method, path, data), range(count))
+                )
+                results[name] = summarize(latencies, time.perf_counter() - started)
+    finally:
+        server.shutdown()
+        for session in sessions.values():
+            session.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=64, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated quote latency (s)")
+    args = parser.parse_args(argv)
+
+    db_fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(db_fd)
+    # The app reads its database and quote provider from the environment
+    os.environ["DATABASE_PATH"] = db_path
+    os.environ["QUOTE_PROVIDER"] = "local"
+    os.environ["QUOTE_PROVIDER_LATENCY"] = str(args.latency)
+    os.environ["DATABASE_POOL_SIZE"] = str(args.concurrency)
+
+    import helpers
+    from app import app, db
+
+    # Every lookup goes upstream. With the cache off, recording each fetch
+    # as a daily close would turn every lookup into a write, so skip it.
+    helpers.quote_cache.ttl = helpers.quote_cache.stale_ttl = 0
+    helpers.quote_cache.negative_ttl = 0
+    helpers.set_price_history(None)
+
+    try:
+        seed(db, args.users, 0, random.Random(0))
+        app.config["TESTING"] = True
+
+        results = {}
+        for mode, enabled in (("threaded", False), ("async", True)):
+            helpers.set_async_quotes(enabled)
+            results[mode] = run(app, args.users, args.requests, args.concurrency)
+    finally:
+        db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    print(f"upstream latency {args.latency * 1000:.0f} ms, concurrency {args.concurrency}")
+    for name, *_ in ROUTES:
+        threaded, asynchronous = results["threaded"][name], results["async"][name]
+        print(
+            f"  {name:<12} threaded {threaded['rps']:7.1f} req/s (p95 {threaded['p95']:8.1f} ms)  "
+            f"async {asynchronous['rps']:7.1f} req/s (p95 {asynchronous['p95']:8.1f} ms)  "
+            f"x{asynchronous['rps'] / threaded['rps']:.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
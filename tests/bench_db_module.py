@@ -0,0 +1,62 @@
+"""
+Microbenchmark for Database read paths.
+
+Run with `python -m tests.bench_db_module`. Compares the original
+execute_query (commit after every statement, dicts built by zipping
+columns) against the current execute_query and the fetch_* variants.
+"""
+import os
+import tempfile
+import timeit
+
+from db_module import Database
+
+
+QUERY = "SELECT symbol, price, shares FROM transactions WHERE user_id = ?"
+
+
+def legacy_execute_query(db, query, *args):
+    """The execute_query implementation before reads stopped committing."""
+    with db.connection() as connection:
+        cursor = connection.cursor()
+        cursor.row_factory = None
+        cursor.execute(query, args)
+        connection.commit()
+        columns = (
+            [column[0] for column in cursor.description]
+            if cursor.description
+            else []
+        )
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def main(rows=50, number=5000):
+    db_fd, db_path = tempfile.mkstemp()
+    db = Database(db_path)
+    try:
+        with db.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (?, ?, ?, ?)",
+                ((1, "AAPL", 100.0, 1) for _ in range(rows)),
+            )
+
+        cases = {
+            "legacy execute_query": lambda: legacy_execute_query(db, QUERY, 1),
+            "execute_query": lambda: db.execute_query(QUERY, 1),
+            "fetch_all": lambda: db.fetch_all(QUERY, 1),
+            "fetch_one": lambda: db.fetch_one(QUERY, 1),
+            "fetch_iter": lambda: sum(1 for _ in db.fetch_iter(QUERY, 1)),
+        }
+
+        print(f"{rows} rows per query, {number} queries")
+        for name, case in cases.items():
+            elapsed = min(timeit.repeat(case, number=number, repeat=3))
+            print(f"{name:<22} {elapsed / number * 1e6:8.1f} us/query")
+    finally:
+        db.close()
+        os.close(db_fd)
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
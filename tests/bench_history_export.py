@@ -0,0 +1,64 @@
+"""
+Memory benchmark for /history/export.
+
+Run with `python -m tests.bench_history_export [rows]`. Seeds a temporary
+database with one user's trades and streams the CSV and JSON lines exports
+through the test client, reporting time and the peak traced memory. Peak
+memory should stay flat as the row count grows.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import tests.support  # noqa: F401, must come before app
+from app import app
+from db_module import Database
+
+
+def seed(db, rows):
+    with db.transaction() as connection:
+        connection.execute(
+            "INSERT INTO users (username, hash) VALUES (?, ?)", ("bench", "hash")
+        )
+        connection.executemany(
+            "INSERT INTO transactions (user_id, symbol, price, shares, timestamp) "
+            "VALUES (1, ?, ?, 1, datetime('2020-01-01', ? || ' seconds'))",
+            (("AAPL", 100.0 + i % 50, i) for i in range(rows)),
+        )
+
+
+def main(rows=1_000_000):
+    db_fd, db_path = tempfile.mkstemp()
+    db = Database(db_path)
+    try:
+        seed(db, rows)
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        with patch("app.db", db):
+            for export_format in ("csv", "jsonl"):
+                tracemalloc.start()
+                started = time.perf_counter()
+                response = client.get(f"/history/export?format={export_format}")
+                size = sum(len(chunk) for chunk in response.response)
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                response.close()
+
+                print(
+                    f"{export_format:<6} {rows} rows  {size / 1e6:8.1f} MB  "
+                    f"{elapsed:6.2f} s  peak {peak / 1e6:6.2f} MB"
+                )
+    finally:
+        db.close()
+        os.close(db_fd)
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,59 @@
+"""
+Benchmark for quote payload parsing.
+
+Run with `python -m tests.bench_quote_parser`. Compares the original
+DictReader-based parsing in lookup against parse_latest_close on the
+recorded 7-day payload and on a synthetic one-year payload, reporting time
+per parse and peak allocations.
+"""
+import csv
+import os
+import timeit
+import tracemalloc
+
+from quote_providers import parse_latest_close
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def legacy_parse(content):
+    """The parsing done by lookup before parse_latest_close."""
+    quotes = list(csv.DictReader(content.decode("utf-8").splitlines()))
+    quotes.reverse()
+    return float(quotes[0]["Adj Close"])
+
+
+def year_payload():
+    lines = [b"Date,Open,High,Low,Close,Adj Close,Volume"]
+    for day in range(252):
+        lines.append(
+            b"2023-%02d-%02d,187.149994,188.440002,183.889999,185.639999,%f,82488700"
+            % (day // 21 + 1, day % 21 + 1, 180 + day / 10)
+        )
+    return b"\n".join(lines) + b"\n"
+
+
+def peak_allocations(parse, content):
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main(number=20000):
+    with open(os.path.join(DATA_DIR, "yahoo_aapl_7d.csv"), "rb") as file:
+        payloads = {"7 days": file.read(), "1 year": year_payload()}
+
+    for name, content in payloads.items():
+        assert legacy_parse(content) == parse_latest_close(content)
+        print(f"{name} payload, {len(content)} bytes")
+        for label, parse in (("legacy", legacy_parse), ("parse_latest_close", parse_latest_close)):
+            elapsed = min(timeit.repeat(lambda: parse(content), number=number, repeat=3))
+            peak = peak_allocations(parse, content)
+            print(f"  {label:<20} {elapsed / number * 1e6:8.2f} us/parse  peak {peak:8d} B")
+
+
+if __name__ == "__main__":
+    main()
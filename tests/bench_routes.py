@@ -0,0 +1,224 @@
+"""
+Load benchmark for the Flask routes.
+
+Run with `python -m tests.bench_routes` (or `make bench`). Seeds a temporary
+database with N users and M transactions, serves quotes from the local
+provider and drives /, /buy, /sell, /history and /login, first through the
+Flask test client and then through a real threaded server. Reports p50,
+p95 and p99 latency and requests per second for each route.
+
+`--save FILE` writes the results as a baseline JSON and `--baseline FILE`
+compares against one, exiting non-zero if any p95 regressed by more than
+`--tolerance`.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+
+SYMBOLS = ["AAPL", "AMZN", "GOOGL", "META", "MSFT", "NFLX", "NVDA", "TSLA", "INTC", "ORCL"]
+PASSWORD = "password"
+
+# (name, method, path, form data)
+ROUTES = [
+    ("GET /", "GET", "/", None),
+    ("GET /history", "GET", "/history", None),
+    ("POST /buy", "POST", "/buy", {"symbol": "AAPL", "shares": "1"}),
+    ("POST /sell", "POST", "/sell", {"symbol": "AAPL", "shares": "1"}),
+    ("POST /login", "POST", "/login", None),
+]
+
+
+def seed(db, users, transactions, rng):
+    """Create users that each hold every symbol, then spread extra trades."""
+    password_hash = generate_password_hash(PASSWORD, method="pbkdf2")
+    with db.transaction() as connection:
+        connection.executemany(
+            "INSERT INTO users (username, hash, cash) VALUES (?, ?, ?)",
+            ((f"user{i}", password_hash, 1_000_000_000.0) for i in range(1, users + 1)),
+        )
+        connection.executemany(
+            "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (?, ?, ?, ?)",
+            (
+                (
+                    rng.randint(1, users) if i >= users * len(SYMBOLS) else i // len(SYMBOLS) + 1,
+                    SYMBOLS[i % len(SYMBOLS)],
+                    round(rng.uniform(10, 500), 2),
+                    rng.randint(100, 1000),
+                )
+                for i in range(max(transactions, users * len(SYMBOLS)))
+            ),
+        )
+
+
+def percentile(values, q):
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50": round(percentile(latencies, 50) * 1000, 3),
+        "p95": round(percentile(latencies, 95) * 1000, 3),
+        "p99": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def login_data(user):
+    return {"username": f"user{user}", "password": PASSWORD}
+
+
+def run_test_client(app, users, count):
+    """Drive every route sequentially through the Flask test client."""
+    results = {}
+    clients = {}
+    for user in range(1, users + 1):
+        clients[user] = app.test_client()
+        clients[user].post("/login", data=login_data(user))
+
+    for name, method, path, data in ROUTES:
+        latencies = []
+        started = time.perf_counter()
+        for i in range(count):
+            user = i % users + 1
+            client = app.test_client() if path == "/login" else clients[user]
+            form = login_data(user) if path == "/login" else data
+            t0 = time.perf_counter()
+            response = client.open(path, method=method, data=form)
+            latencies.append(time.perf_counter() - t0)
+            assert response.status_code < 400, (name, response.status_code)
+        results[name] = summarize(latencies, time.perf_counter() - started)
+    return results
+
+
+def run_server(app, users, count, concurrency):
+    """Drive every route concurrently against a real threaded server."""
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    sessions = {}
+    for user in range(1, users + 1):
+        sessions[user] = requests.Session()
+        sessions[user].post(base + "/login", data=login_data(user), allow_redirects=False)
+
+    def call(i, method, path, data):
+        user = i % users + 1
+        if path == "/login":
+            session, data = requests.Session(), login_data(user)
+        else:
+            session = sessions[user]
+        t0 = time.perf_counter()
+        response = session.request(method, base + path, data=data, allow_redirects=False)
+        elapsed = time.perf_counter() - t0
+        assert response.status_code < 400, (path, response.status_code)
+        return elapsed
+
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for name, method, path, data in ROUTES:
+                started = time.perf_counter()
+                latencies = list(
+                    executor.map(lambda i: call(i, method, path, data), range(count))
+                )
+                results[name] = summarize(latencies, time.perf_counter() - started)
+    finally:
+        server.shutdown()
+        for session in sessions.values():
+            session.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print p95/rps against the baseline; return the regressed entries."""
+    regressions = []
+    for mode, routes in results.items():
+        for name, summary in routes.items():
+            before = baseline.get(mode, {}).get(name)
+            if not before:
+                continue
+            change = (summary["p95"] - before["p95"]) / before["p95"] if before["p95"] else 0
+            print(
+                f"{mode:<12} {name:<14} p95 {before['p95']:8.2f} -> {summary['p95']:8.2f} ms "
+                f"({change:+.0%})  rps {before['rps']:8.1f} -> {summary['rps']:8.1f}"
+            )
+            if change > tolerance:
+                regressions.append((mode, name))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=100, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated quote latency (s)")
+    parser.add_argument("--save", help="write results to this baseline JSON")
+    parser.add_argument("--baseline", help="compare results against this baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 regression")
+    args = parser.parse_args(argv)
+
+    db_fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(db_fd)
+    # The app reads its database and quote provider from the environment
+    os.environ["DATABASE_PATH"] = db_path
+    os.environ["QUOTE_PROVIDER"] = "local"
+    os.environ["QUOTE_PROVIDER_LATENCY"] = str(args.latency)
+
+    from app import app, db
+
+    try:
+        seed(db, args.users, args.transactions, random.Random(0))
+        app.config["TESTING"] = True
+
+        results = {
+            "test_client": run_test_client(app, args.users, args.requests),
+            "server": run_server(app, args.users, args.requests, args.concurrency),
+        }
+    finally:
+        db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    for mode, routes in results.items():
+        print(mode)
+        for name, summary in routes.items():
+            print(
+                f"  {name:<14} p50 {summary['p50']:8.2f}  p95 {summary['p95']:8.2f}  "
+                f"p99 {summary['p99']:8.2f} ms  {summary['rps']:8.1f} req/s"
+            )
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"p95 regressed more than {args.tolerance:.0%}: {regressions}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
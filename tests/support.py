@@ -0,0 +1,32 @@
+"""
+Shared test setup and fakes.
+
+Import this before `app`: it points the app at a scratch database, so
+route tests never migrate or write the committed finance.db.
+"""
+import atexit
+import os
+import tempfile
+
+
+def _remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+if "DATABASE_PATH" not in os.environ:
+    db_fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(db_fd)
+    os.environ["DATABASE_PATH"] = db_path
+    atexit.register(_remove_database, db_path)
+
+
+class FakeClock:
+    """A clock that only moves when a test sets or advances `now`."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
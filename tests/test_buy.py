@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import patch
 from flask import Flask, session
+import tests.support  # noqa: F401, must come before app
 from app import app
 
 
@@ -10,7 +11,7 @@ class TestBuy(unittest.TestCase):
         app.config["SECRET_KEY"] = "test_secret_key"
         self.client = app.test_client()
 
-    @patch("app.lookup")
+    @patch("app.alookup")
     @patch("app.db.execute_query")
     # @patch("app.db.cursor")
     def test_buy_successful(self, mock_execute_query, mock_lookup):
@@ -38,7 +39,7 @@ class TestBuy(unittest.TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.headers["Location"], "/")
 
-    @patch("app.lookup")
+    @patch("app.alookup")
     @patch("app.db.execute_query")
     def test_buy_insufficient_funds(self, mock_execute_query, mock_lookup):
         # Mocking lookup function
@@ -61,7 +62,7 @@ class TestBuy(unittest.TestCase):
 
         self.assertEqual(response.status_code, 400)
 
-    @patch("app.lookup")
+    @patch("app.alookup")
     def test_buy_invalid_symbol(self, mock_lookup):
         # Mocking lookup function for an invalid symbol
         mock_lookup.return_value = None
@@ -78,6 +79,23 @@ class TestBuy(unittest.TestCase):
 
         self.assertEqual(response.status_code, 400)
 
+    @patch("app.alookup")
+    def test_buy_stale_quote(self, mock_lookup):
+        # A last-known price served while the upstream is down
+        mock_lookup.return_value = {
+            "name": "AAPL", "price": 150.0, "symbol": "AAPL", "stale": True
+        }
+
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        response = self.client.post(
+            "/buy",
+            data={"symbol": "AAPL", "shares": "2"},
+        )
+
+        self.assertEqual(response.status_code, 503)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+from circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    GuardedProvider,
+    RateLimitedError,
+    TokenBucket,
+)
+from quote_providers import QuoteProvider, UpstreamError
+from tests.support import FakeClock
+
+
+class FlakyProvider(QuoteProvider):
+    def __init__(self):
+        self.error = None
+        self.calls = 0
+
+    def history(self, symbol, start, end):
+        self.calls += 1
+        return None if self.error is not None else []
+
+    def fetch(self, symbol):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return {"name": symbol, "price": 1.0, "symbol": symbol}
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            failure_rate=0.5, min_calls=4, window=10, reset_timeout=30, clock=self.clock
+        )
+
+    def test_opens_on_error_rate(self):
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.assertTrue(self.breaker.allow())
+
+        # 2 of 4 calls failed
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats(), {"open": 1, "opened": 1, "rejected": 1})
+
+    def test_old_outcomes_leave_the_window(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 11
+
+        self.breaker.record_success()
+        self.breaker.record_success()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe(self):
+        for _ in range(4):
+            self.breaker.record_failure()
+
+        # One probe after the cool-down; a failed probe reopens
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        # A successful probe closes
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_lost_probe_is_replaced(self):
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+
+        # The probe never reports back
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate_and_burst(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=3, clock=clock)
+
+        self.assertEqual([bucket.try_acquire() for _ in range(4)], [True, True, True, False])
+        clock.now += 0.5
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+
+class TestGuardedProvider(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.upstream = FlakyProvider()
+        self.breaker = CircuitBreaker(min_calls=2, reset_timeout=30, clock=self.clock)
+        self.bucket = TokenBucket(rate=8, burst=100, clock=self.clock)
+        self.provider = GuardedProvider(self.upstream, self.breaker, self.bucket)
+
+    def test_open_circuit_skips_upstream(self):
+        self.upstream.error = UpstreamError("timeout")
+        for _ in range(2):
+            with self.assertRaises(UpstreamError):
+                self.provider.fetch("AAPL")
+
+        with self.assertRaises(CircuitOpenError):
+            self.provider.fetch("AAPL")
+        self.assertEqual(self.upstream.calls, 2)
+
+        # The probe succeeds once the upstream is back
+        self.upstream.error = None
+        self.clock.now += 30
+        self.assertEqual(self.provider.fetch("AAPL")["price"], 1.0)
+
+    def test_throttling_halves_the_rate(self):
+        self.upstream.error = UpstreamError("429", throttled=True)
+        with self.assertRaises(UpstreamError):
+            self.provider.fetch("AAPL")
+        self.assertEqual(self.bucket.rate, 4)
+
+        # Successes grow it back, up to the configured rate
+        self.upstream.error = None
+        self.provider.fetch("AAPL")
+        self.assertAlmostEqual(self.bucket.rate, 4.1)
+        self.bucket.rate = 8
+        self.provider.fetch("AAPL")
+        self.assertEqual(self.bucket.rate, 8)
+
+    def test_history_reports_to_the_breaker(self):
+        self.upstream.error = UpstreamError("timeout")
+        self.provider.history("AAPL", None, None)
+        self.provider.history("AAPL", None, None)
+        self.assertIsNone(self.provider.history("AAPL", None, None))
+        self.assertEqual(self.upstream.calls, 2)
+
+        # A successful probe closes the circuit
+        self.upstream.error = None
+        self.clock.now += 30
+        self.assertEqual(self.provider.history("AAPL", None, None), [])
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rate_limit(self):
+        provider = GuardedProvider(self.upstream, self.breaker, TokenBucket(1, clock=self.clock))
+        provider.fetch("AAPL")
+
+        with self.assertRaises(RateLimitedError):
+            provider.fetch("AAPL")
+        self.assertEqual(self.upstream.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
 import tempfile
 import os
-from db_module import Database
+import sqlite3
+import threading
+from db_module import MIGRATIONS, Database
 
 
 class TestDatabase(unittest.TestCase):
@@ -12,7 +14,8 @@ class TestDatabase(unittest.TestCase):
 
     def tearDown(self):
         # Close and remove the temporary database file
-        self.db.connection.close()
+        self.db.close()
+        os.close(self.db_fd)
         os.remove(self.db_path)
 
     def test_create_tables(self):
@@ -62,6 +65,178 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(result[0]["hash"], "hashed_password")
         self.assertEqual(result[0]["cash"], 5000.0)
 
+    def test_wal_mode(self):
+        # Check that the database runs in write-ahead logging mode
+        result = self.db.execute_query("PRAGMA journal_mode;")
+
+        self.assertEqual(result[0]["journal_mode"], "wal")
+
+    def test_concurrent_queries(self):
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(20):
+                    username = f"user_{n}_{i}"
+                    self.db.execute_query(
+                        "INSERT INTO users (username, hash) VALUES (?, ?)",
+                        username,
+                        "hashed_password",
+                    )
+                    rows = self.db.execute_query(
+                        "SELECT username FROM users WHERE username = ?", username
+                    )
+                    # Each thread must only ever see its own result set
+                    if rows != [{"username": username}]:
+                        errors.append(rows)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Check that every insert landed and no results were mixed up
+        self.assertEqual(errors, [])
+        result = self.db.execute_query("SELECT COUNT(*) AS n FROM users")
+        self.assertEqual(result[0]["n"], 160)
+
+    def test_connection_reused_within_thread(self):
+        # Nested checkouts on one thread must share the same connection
+        with self.db.connection() as outer:
+            with self.db.connection() as inner:
+                self.assertIs(outer, inner)
+
+    def insert_transaction(self, symbol, price, shares):
+        query = "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (?, ?, ?, ?)"
+        self.db.execute_query(query, 1, symbol, price, shares)
+
+    def test_holdings_maintained(self):
+        self.insert_transaction("AAPL", 100.0, 4)
+        self.insert_transaction("AAPL", 200.0, 4)
+        self.insert_transaction("AAPL", 300.0, -2)
+        self.insert_transaction("GOOGL", 50.0, 1)
+        self.insert_transaction("GOOGL", 60.0, -1)
+
+        query = "SELECT symbol, shares, cost_basis, realized FROM holdings WHERE user_id = ?"
+        result = self.db.execute_query(query, 1)
+
+        # Sells reduce cost basis at average cost and book the difference as
+        # realized P&L; closed positions keep their row
+        self.assertEqual(
+            result,
+            [
+                {"symbol": "AAPL", "shares": 6, "cost_basis": 900.0, "realized": 300.0},
+                {"symbol": "GOOGL", "shares": 0, "cost_basis": 0, "realized": 10.0},
+            ],
+        )
+
+    def test_holdings_whole_dollar_prices(self):
+        # Whole numbers are stored as INTEGER; averages must not truncate
+        self.insert_transaction("AAPL", 10, 1)
+        self.insert_transaction("AAPL", 11, 2)
+        self.insert_transaction("AAPL", 20, -1)
+        query = "SELECT shares, cost_basis, realized FROM holdings WHERE user_id = ?"
+        live = self.db.execute_query(query, 1)
+
+        self.db.backfill_holdings()
+
+        self.assertEqual(live, self.db.execute_query(query, 1))
+        self.assertAlmostEqual(live[0]["cost_basis"], 64 / 3)
+        self.assertAlmostEqual(live[0]["realized"], 20 - 32 / 3)
+
+    def test_backfill_holdings(self):
+        self.insert_transaction("AAPL", 100.0, 4)
+        self.insert_transaction("AAPL", 200.0, 4)
+        self.insert_transaction("AAPL", 300.0, -2)
+        expected = self.db.execute_query("SELECT * FROM holdings")
+
+        # Simulate a database created before 'holdings' existed
+        self.db.execute_query("DROP TABLE holdings")
+        self.db.execute_query("DROP TRIGGER transactions_update_holdings")
+        self.db.create_tables()
+
+        self.assertEqual(self.db.execute_query("SELECT * FROM holdings"), expected)
+
+    def test_migrate_adds_realized(self):
+        self.insert_transaction("AAPL", 100.0, 4)
+        self.insert_transaction("AAPL", 300.0, -4)
+        expected = self.db.execute_query("SELECT * FROM holdings")
+
+        # Simulate a database at schema version 2, before realized P&L
+        self.db.execute_query("DROP TRIGGER transactions_update_holdings")
+        self.db.execute_query("ALTER TABLE holdings DROP COLUMN realized")
+        self.db.execute_query("PRAGMA user_version = 2")
+        self.db.migrate()
+
+        self.assertEqual(self.db.execute_query("SELECT * FROM holdings"), expected)
+
+    def test_fetch_variants(self):
+        for i in range(3):
+            self.insert_transaction("AAPL", 100.0 + i, 1)
+
+        query = "SELECT price FROM transactions WHERE user_id = ? ORDER BY id"
+
+        # Rows support access by column name
+        self.assertEqual(self.db.fetch_one(query, 1)["price"], 100.0)
+        self.assertIsNone(self.db.fetch_one(query, 2))
+        self.assertEqual([row["price"] for row in self.db.fetch_all(query, 1)], [100.0, 101.0, 102.0])
+        self.assertEqual(
+            [row["price"] for row in self.db.fetch_iter(query, 1, size=2)],
+            [100.0, 101.0, 102.0],
+        )
+
+    def test_failed_write_releases_lock(self):
+        db = Database(self.db_path, pool_size=2, timeout=0.5)
+        try:
+            query = "INSERT INTO users (username, hash) VALUES (?, ?)"
+            db.execute_query(query, "taken", "hash")
+            with self.assertRaises(sqlite3.IntegrityError):
+                db.execute_query(query, "taken", "hash")
+
+            # The failed connection (next out of the pool) holds no write
+            # lock, so the other pooled connection can still write
+            errors = []
+
+            def write():
+                try:
+                    db.execute_query(query, "free", "hash")
+                except sqlite3.Error as e:
+                    errors.append(e)
+
+            with db.connection() as connection:
+                self.assertFalse(connection.in_transaction)
+                thread = threading.Thread(target=write)
+                thread.start()
+                thread.join()
+            self.assertEqual(errors, [])
+        finally:
+            db.close()
+
+    def test_writes_visible_to_other_connections(self):
+        self.insert_transaction("AAPL", 100.0, 1)
+
+        # Writes are committed even though reads no longer commit
+        other = sqlite3.connect(self.db_path)
+        try:
+            count = other.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        finally:
+            other.close()
+        self.assertEqual(count, 1)
+
+    def test_migrate(self):
+        # Check that every migration ran and re-running is a no-op
+        self.assertEqual(self.db.migrate(), len(MIGRATIONS))
+        result = self.db.execute_query("PRAGMA user_version;")
+        self.assertEqual(result[0]["user_version"], len(MIGRATIONS))
+
+        query = "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='transactions';"
+        names = {row["name"] for row in self.db.execute_query(query)}
+        self.assertIn("transactions_user_timestamp", names)
+        self.assertIn("transactions_user_symbol", names)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,321 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+import requests
+import helpers
+from unittest.mock import MagicMock, patch
+from flask import Flask
+from db_module import Database
+from quote_providers import LocalProvider, UpstreamError
+from quote_store import QuoteStore
+from helpers import (
+    HTTP_TIMEOUT,
+    alookup_many,
+    fetch_quote,
+    load_quote,
+    lookup_latency,
+    lookup,
+    lookup_many,
+    quote_cache,
+    quote_view,
+    set_async_quotes,
+    set_coalesce_processes,
+    set_price_history,
+    set_record_prices,
+    set_quote_provider,
+    set_quote_store,
+)
+
+
+CSV_PAYLOAD = (
+    b"Date,Open,High,Low,Close,Adj Close,Volume\n"
+    b"2024-01-02,185.0,186.0,184.0,185.5,185.2,1000\n"
+    b"2024-01-03,184.0,185.0,183.0,184.3,184.25,1000\n"
+)
+
+
+class TestFetchQuote(unittest.TestCase):
+    def setUp(self):
+        lookup_latency.reset()
+
+    @patch("helpers.http_session.get")
+    def test_fetch_quote(self, mock_get):
+        # Mock the upstream response
+        mock_get.return_value = MagicMock(content=CSV_PAYLOAD)
+
+        quote = fetch_quote("aapl")
+
+        # The latest adjusted close is returned
+        self.assertEqual(
+            quote,
+            {"name": "AAPL", "price": 184.25, "previous_close": 185.2, "symbol": "AAPL"},
+        )
+        # Every request carries explicit connect/read timeouts
+        self.assertEqual(mock_get.call_args.kwargs["timeout"], HTTP_TIMEOUT)
+        self.assertEqual(lookup_latency.snapshot()["calls"], 1)
+        self.assertEqual(lookup_latency.snapshot()["errors"], 0)
+
+    @patch("helpers.http_session.get")
+    def test_fetch_quote_records_close(self, mock_get):
+        mock_get.return_value = MagicMock(content=CSV_PAYLOAD)
+        history = MagicMock()
+        previous = helpers.price_history
+        set_price_history(history)
+        set_record_prices(True)
+        try:
+            quote = fetch_quote("AAPL")
+        finally:
+            set_record_prices(False)
+            set_price_history(previous)
+
+        # Only the close is recorded; full bars come from provider.history
+        history.record_quote.assert_called_once_with(quote)
+        history.record_bars.assert_not_called()
+
+    @patch("helpers.http_session.get")
+    def test_fetch_quote_timeout(self, mock_get):
+        # Mock an upstream timeout
+        mock_get.side_effect = requests.Timeout()
+
+        with self.assertRaises(UpstreamError):
+            fetch_quote("AAPL")
+        self.assertEqual(lookup_latency.snapshot()["errors"], 1)
+
+    @patch("helpers.http_session.get")
+    def test_fetch_quote_unknown_symbol(self, mock_get):
+        # A 404 means the symbol doesn't exist, not that the upstream is down
+        response = MagicMock(status_code=404)
+        mock_get.return_value.raise_for_status.side_effect = requests.HTTPError(response=response)
+
+        self.assertIsNone(fetch_quote("NOPE"))
+
+    @patch("helpers.quote_provider")
+    def test_fetch_quote_provider_bug(self, mock_provider):
+        # Anything else a provider raises is treated as an upstream failure
+        mock_provider.fetch.side_effect = KeyError("price")
+
+        with self.assertRaises(UpstreamError):
+            fetch_quote("AAPL")
+        self.assertEqual(lookup_latency.snapshot()["errors"], 1)
+
+
+class TestLoadQuote(unittest.TestCase):
+    def tearDown(self):
+        set_quote_store(None)
+
+    @patch("helpers.fetch_quote")
+    def test_lookup_falls_back_to_last_known(self, mock_fetch_quote):
+        mock_fetch_quote.side_effect = UpstreamError("throttled", throttled=True)
+        clock = quote_cache.clock
+        quote_cache._store("AAPL", {"name": "AAPL", "price": 1.5, "symbol": "AAPL"})
+        quote_cache.clock = lambda: clock() + 3600
+        previous = helpers.price_history
+        set_price_history(None)
+        try:
+            self.assertEqual(
+                lookup("AAPL"),
+                {"name": "AAPL", "price": 1.5, "symbol": "AAPL", "stale": True},
+            )
+            # Nothing known about the symbol at all
+            with self.assertRaises(UpstreamError):
+                lookup("GOOGL")
+
+            # Neither answer is cached: once the upstream is back, both are fresh
+            mock_fetch_quote.side_effect = lambda symbol: {
+                "name": symbol, "price": 2.0, "symbol": symbol
+            }
+            self.assertEqual(lookup("AAPL"), {"name": "AAPL", "price": 2.0, "symbol": "AAPL"})
+            self.assertEqual(lookup("GOOGL")["price"], 2.0)
+        finally:
+            quote_cache.clock = clock
+            set_price_history(previous)
+            quote_cache.clear()
+
+    @patch("helpers.fetch_quote")
+    def test_load_quote_from_store(self, mock_fetch_quote):
+        # Mock a shared store that only knows AAPL
+        store = MagicMock()
+        store.get.side_effect = lambda symbol: (
+            {"name": symbol, "price": 1.0, "symbol": symbol} if symbol == "AAPL" else None
+        )
+        set_quote_store(store)
+        mock_fetch_quote.return_value = {"name": "GOOGL", "price": 2.0, "symbol": "GOOGL"}
+
+        # Stored quotes skip the provider, others fall through to it
+        self.assertEqual(load_quote("AAPL")["price"], 1.0)
+        self.assertEqual(load_quote("GOOGL")["price"], 2.0)
+        mock_fetch_quote.assert_called_once_with("GOOGL")
+
+
+class TestCoalesceProcesses(unittest.TestCase):
+    def setUp(self):
+        # A real store, so leases behave as they would between processes
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.store = QuoteStore(self.db, max_age=60)
+        set_quote_store(self.store)
+        set_coalesce_processes(True)
+
+    def tearDown(self):
+        set_coalesce_processes(False)
+        set_quote_store(None)
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    @patch("helpers.fetch_quote")
+    def test_waits_for_lease_holder(self, mock_fetch_quote):
+        # Another process is already fetching AAPL
+        self.assertTrue(self.store.acquire_lease("quote:AAPL", "other-process", ttl=5))
+        publish = threading.Timer(
+            0.1, self.store.put, [{"name": "AAPL", "price": 1.0, "symbol": "AAPL"}]
+        )
+        publish.start()
+
+        quote = load_quote("AAPL")
+
+        publish.join()
+        self.assertEqual(quote["price"], 1.0)
+        mock_fetch_quote.assert_not_called()
+        self.assertEqual(self.store.coalesced, 1)
+
+    @patch("helpers.fetch_quote")
+    def test_lease_holder_publishes(self, mock_fetch_quote):
+        mock_fetch_quote.return_value = {"name": "AAPL", "price": 2.0, "symbol": "AAPL"}
+
+        self.assertEqual(load_quote("AAPL")["price"], 2.0)
+
+        # The quote is shared and the lease is free again
+        self.assertEqual(self.store.get("AAPL")["price"], 2.0)
+        self.assertTrue(self.store.acquire_lease("quote:AAPL", "other-process", ttl=5))
+
+    @patch("helpers.fetch_quote")
+    def test_unknown_symbol_is_published(self, mock_fetch_quote):
+        mock_fetch_quote.return_value = None
+
+        self.assertIsNone(load_quote("XYZ"))
+
+        # Other processes learn the symbol is unknown without waiting it out
+        self.assertFalse(self.store.acquire_lease("quote:XYZ", "other-process", ttl=5))
+        started = time.monotonic()
+        self.assertIsNone(self.store.wait("XYZ", "quote:XYZ", timeout=5))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.store.coalesced, 1)
+
+    def test_needs_a_quote_store(self):
+        set_quote_store(None)
+        with self.assertRaises(ValueError):
+            set_coalesce_processes(True)
+
+
+class TestLookupMany(unittest.TestCase):
+    @patch("helpers.lookup")
+    def test_lookup_many(self, mock_lookup):
+        # Mock the lookup function to return a quote per symbol
+        mock_lookup.side_effect = lambda symbol: {"symbol": symbol, "price": 1.0}
+
+        quotes = lookup_many(["AAPL", "GOOGL", "AAPL"])
+
+        # Each unique symbol is looked up once
+        self.assertEqual(set(quotes), {"AAPL", "GOOGL"})
+        self.assertEqual(quotes["GOOGL"]["symbol"], "GOOGL")
+        self.assertEqual(mock_lookup.call_count, 2)
+
+    @patch("helpers.lookup")
+    def test_lookup_many_slow_symbol(self, mock_lookup):
+        release = threading.Event()
+
+        def lookup(symbol):
+            # SLOW never answers within the deadline
+            if symbol == "SLOW":
+                release.wait(5)
+            return {"symbol": symbol, "price": 1.0}
+
+        mock_lookup.side_effect = lookup
+
+        try:
+            quotes = lookup_many(["AAPL", "SLOW"], deadline=0.1)
+        finally:
+            release.set()
+
+        self.assertEqual(quotes["AAPL"]["price"], 1.0)
+        self.assertIsNone(quotes["SLOW"])
+
+    @patch("helpers.lookup")
+    def test_lookup_many_error(self, mock_lookup):
+        # A failing symbol maps to None
+        mock_lookup.side_effect = RuntimeError("boom")
+
+        self.assertEqual(lookup_many(["AAPL"]), {"AAPL": None})
+
+
+class TestAsyncLookupMany(unittest.TestCase):
+    def setUp(self):
+        self.previous_provider = helpers.quote_provider
+        set_quote_provider(LocalProvider(latency=0.2))
+        set_async_quotes(True)
+
+    def tearDown(self):
+        set_async_quotes(False)
+        set_quote_provider(self.previous_provider)
+
+    def test_fetches_concurrently_on_the_event_loop(self):
+        symbols = [f"SYM{chr(65 + i)}" for i in range(20)]
+
+        started = time.perf_counter()
+        quotes = asyncio.run(alookup_many(symbols))
+        elapsed = time.perf_counter() - started
+
+        # All 20 waits overlap, well past the lookup pool's 8 workers
+        self.assertEqual(len(quotes), 20)
+        self.assertTrue(all(quote is not None for quote in quotes.values()))
+        self.assertLess(elapsed, 0.4)
+
+    def test_deadline(self):
+        quotes = asyncio.run(alookup_many(["AAPL", "A1"], deadline=0.05))
+
+        self.assertEqual(quotes, {"AAPL": None, "A1": None})
+
+    @patch("helpers.lookup_many")
+    def test_threaded_when_disabled(self, mock_lookup_many):
+        set_async_quotes(False)
+        mock_lookup_many.return_value = {"AAPL": {"price": 1.0}}
+
+        self.assertEqual(asyncio.run(alookup_many(["AAPL"])), {"AAPL": {"price": 1.0}})
+        mock_lookup_many.assert_called_once_with(["AAPL"], None)
+
+
+class TestQuoteView(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+        @quote_view
+        async def view():
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return "no loop"
+            return "loop"
+        self.view = view
+
+    def tearDown(self):
+        set_async_quotes(False)
+
+    def test_runs_inline_when_disabled(self):
+        set_async_quotes(False)
+
+        self.assertFalse(asyncio.iscoroutinefunction(self.view))
+        self.assertEqual(self.view(), "no loop")
+
+    def test_runs_on_a_loop_when_enabled(self):
+        set_async_quotes(True)
+
+        with self.app.app_context():
+            self.assertEqual(self.view(), "loop")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import patch
 from flask import Flask, session
+import tests.support  # noqa: F401, must come before app
 from app import app
 
 
@@ -10,21 +11,23 @@ class TestHistory(unittest.TestCase):
         app.config["SECRET_KEY"] = "test_secret_key"
         self.client = app.test_client()
 
-    @patch("app.db.execute_query")
-    def test_history(self, mock_execute_query):
+    @patch("app.db.fetch_all")
+    def test_history(self, mock_fetch_all):
         # Assume that the user is logged in with user_id 1
         with self.client.session_transaction() as sess:
             sess["user_id"] = 1
 
         # Mock the database responses
-        mock_execute_query.return_value = [
+        mock_fetch_all.return_value = [
             {
+                "id": 1,
                 "symbol": "AAPL",
                 "price": 150.0,
                 "shares": 1,
                 "timestamp": "2023-01-01 12:00:00",
             },
             {
+                "id": 2,
                 "symbol": "GOOGL",
                 "price": 2000.0,
                 "shares": -2,
@@ -41,6 +44,97 @@ class TestHistory(unittest.TestCase):
         self.assertIn(b"GOOGL", response.data)
         self.assertIn(b"2023-01-01 12:00:00", response.data)
         self.assertIn(b"2023-01-02 10:30:00", response.data)
+        self.assertNotIn(b"Next", response.data)
+
+    @patch("app.db.fetch_all")
+    def test_history_next_page(self, mock_fetch_all):
+        # Assume that the user is logged in with user_id 1
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        # One row more than the page size means there is a next page
+        mock_fetch_all.return_value = [
+            {
+                "id": i,
+                "symbol": "AAPL",
+                "price": 150.0,
+                "shares": 1,
+                "timestamp": f"2023-01-0{i} 12:00:00",
+            }
+            for i in range(1, 4)
+        ]
+
+        response = self.client.get("/history?limit=2")
+
+        # Check that the page is cut at the limit and links to the next page
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_fetch_all.call_args.args[-1], 3)
+        self.assertNotIn(b"2023-01-03", response.data)
+        self.assertIn(b"after=2023-01-02+12:00:00,2", response.data)
+        self.assertNotIn(b"Previous", response.data)
+
+    @patch("app.db.fetch_all")
+    def test_history_previous_page(self, mock_fetch_all):
+        # Assume that the user is logged in with user_id 1
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        # Rows come back newest first when paging backwards
+        mock_fetch_all.return_value = [
+            {
+                "id": i,
+                "symbol": "AAPL",
+                "price": 150.0,
+                "shares": 1,
+                "timestamp": f"2023-01-0{i} 12:00:00",
+            }
+            for i in range(3, 0, -1)
+        ]
+
+        response = self.client.get("/history?limit=2&before=2023-01-04 12:00:00,4")
+
+        # Check that rows are shown oldest first with both links present
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_fetch_all.call_args.args[2:], ("2023-01-04 12:00:00", 4, 3))
+        self.assertNotIn(b"2023-01-01", response.data)
+        self.assertLess(response.data.index(b"2023-01-02"), response.data.index(b"2023-01-03"))
+        self.assertIn(b"Previous", response.data)
+        self.assertIn(b"Next", response.data)
+
+    def test_history_invalid_cursor(self):
+        # Assume that the user is logged in with user_id 1
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        response = self.client.get("/history?after=garbage")
+
+        self.assertEqual(response.status_code, 400)
+
+    @patch("app.db.fetch_iter")
+    def test_history_stream(self, mock_fetch_iter):
+        # Assume that the user is logged in with user_id 1
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        # Mock the database cursor as a generator
+        mock_fetch_iter.return_value = (
+            {
+                "id": i,
+                "symbol": "AAPL",
+                "price": 150.0,
+                "shares": 1,
+                "timestamp": f"row-{i}",
+            }
+            for i in range(1000)
+        )
+
+        response = self.client.get("/history?stream=1")
+
+        # Check that every row was streamed
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertIn(b"row-0<", response.data)
+        self.assertIn(b"row-999<", response.data)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+import inspect
+import json
+import unittest
+from unittest.mock import patch
+import tests.support  # noqa: F401, must come before app
+from app import app
+
+
+ROWS = [
+    {"id": 1, "symbol": "AAPL", "price": 150.0, "shares": 1, "timestamp": "2023-01-01 12:00:00"},
+    {"id": 2, "symbol": "GOOGL", "price": 2000.0, "shares": -2, "timestamp": "2023-01-02 10:30:00"},
+]
+
+
+class TestHistoryExport(unittest.TestCase):
+    def setUp(self):
+        app.config["TESTING"] = True
+        app.config["SECRET_KEY"] = "test_secret_key"
+        self.client = app.test_client()
+
+        # Assume that the user is logged in with user_id 1
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+    @patch("app.db.fetch_iter")
+    def test_export_csv(self, mock_fetch_iter):
+        # Mock the database cursor
+        mock_fetch_iter.return_value = (row for row in ROWS)
+
+        response = self.client.get("/history/export?format=csv")
+
+        # Check the streamed CSV
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, "text/csv")
+        self.assertEqual(
+            response.get_data(as_text=True).splitlines(),
+            [
+                "id,symbol,price,shares,timestamp",
+                "1,AAPL,150.0,1,2023-01-01 12:00:00",
+                "2,GOOGL,2000.0,-2,2023-01-02 10:30:00",
+            ],
+        )
+
+    @patch("app.db.fetch_iter")
+    def test_export_jsonl(self, mock_fetch_iter):
+        # Mock the database cursor
+        mock_fetch_iter.return_value = (row for row in ROWS)
+
+        response = self.client.get("/history/export?format=jsonl")
+
+        # Check the streamed JSON lines
+        self.assertEqual(response.status_code, 200)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], ROWS)
+
+    @patch("app.db.fetch_iter")
+    def test_export_closes_cursor(self, mock_fetch_iter):
+        # More rows than one chunk, so the first chunk leaves some unread
+        rows = (ROWS[0] for _ in range(1000))
+        mock_fetch_iter.return_value = rows
+
+        # The client goes away after the first chunk
+        self.client.get("/history/export?format=csv").close()
+
+        self.assertEqual(inspect.getgeneratorstate(rows), inspect.GEN_CLOSED)
+
+    @patch("app.db.fetch_iter")
+    def test_export_filters(self, mock_fetch_iter):
+        mock_fetch_iter.return_value = (row for row in [])
+
+        response = self.client.get(
+            "/history/export?start=2023-01-01&end=2023-01-31&symbol=aapl"
+        )
+        response.get_data()
+
+        # Check that filters are passed as query parameters
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            mock_fetch_iter.call_args.args[1:], (1, "2023-01-01", "2023-01-31", "AAPL")
+        )
+
+    def test_export_invalid_arguments(self):
+        self.assertEqual(self.client.get("/history/export?format=xml").status_code, 400)
+        self.assertEqual(self.client.get("/history/export?start=yesterday").status_code, 400)
+        self.assertEqual(self.client.get("/history/export?symbol=A1").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
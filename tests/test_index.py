@@ -1,37 +1,49 @@
 import unittest
 from unittest.mock import patch
 from flask import Flask, session
+import tests.support  # noqa: F401, must come before app
 from app import app
 
 
+def holding(symbol, shares, cost_basis, realized=0.0):
+    return {
+        "symbol": symbol,
+        "shares": shares,
+        "cost_basis": cost_basis,
+        "realized": realized,
+    }
+
+
 class TestIndex(unittest.TestCase):
     def setUp(self):
         app.config["TESTING"] = True
         app.config["SECRET_KEY"] = "test_secret_key"
         self.client = app.test_client()
 
-    @patch("app.db.execute_query")
-    @patch("app.lookup")
-    def test_index_with_transactions(self, mock_lookup, mock_execute_query):
+        # The user's cached record
+        patcher = patch("app.user_cache.get")
+        self.mock_user = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_user.return_value = {"id": 1, "username": "test_user", "cash": 10000.0}
+
+    @patch("app.db.fetch_all")
+    @patch("app.alookup_many")
+    def test_index_with_transactions(self, mock_lookup_many, mock_fetch_all):
         # Assume that the user is logged in with user_id 1
         with self.client.session_transaction() as sess:
             sess["user_id"] = 1
 
-        # Mock the database responses
-        mock_execute_query.side_effect = [
-            [{"cash": 10000.0}],  # Response for the SELECT cash query
-            [
-                {"symbol": "AAPL", "price": 150.0, "shares": 1},
-                {"symbol": "GOOGL", "price": 2000.0, "shares": 2},
-                {"symbol": "AAPL", "price": 300.0, "shares": 1},
-            ],  # Response for the SELECT transactions query
+        # Mock the database response for the holdings query
+        mock_fetch_all.return_value = [
+            holding("AAPL", 2, 450.0),
+            holding("GOOGL", 2, 4000.0),
         ]
 
-        # Mock the lookup function responses
-        mock_lookup.side_effect = [
-            {"price": 150.0},  # Response for AAPL lookup
-            {"price": 2000.0},  # Response for GOOGL lookup
-        ]
+        # Mock the lookup_many function response
+        mock_lookup_many.return_value = {
+            "AAPL": {"price": 150.0},
+            "GOOGL": {"price": 2000.0},
+        }
 
         # Make a request to the index route
         response = self.client.get("/")
@@ -42,19 +54,47 @@ class TestIndex(unittest.TestCase):
         self.assertIn(b"GOOGL", response.data)
         self.assertIn(b"$450.00", response.data)
         self.assertIn(b"$4000.00", response.data)
+        # Market value and unrealized gain at current prices
+        self.assertIn(b"$300.00", response.data)
+        self.assertIn(b"-150.00", response.data)
+        self.assertIn(b"$14300.00", response.data)
 
-    @patch("app.db.execute_query")
-    def test_index_no_transactions(self, mock_execute_query):
+    @patch("app.db.fetch_all")
+    @patch("app.alookup_many")
+    def test_index_quote_unavailable(self, mock_lookup_many, mock_fetch_all):
         # Assume that the user is logged in with user_id 1
         with self.client.session_transaction() as sess:
             sess["user_id"] = 1
 
-        # Mock the database responses
-        mock_execute_query.side_effect = [
-            [{"cash": 1000.0}],  # Response for the SELECT cash query
-            [],  # Response for the SELECT transactions query
+        # Mock the database response for the holdings query
+        mock_fetch_all.return_value = [
+            holding("AAPL", 1, 150.0),
+            holding("GOOGL", 2, 4000.0),
         ]
 
+        # GOOGL timed out
+        mock_lookup_many.return_value = {"AAPL": {"price": 150.0}, "GOOGL": None}
+
+        # Make a request to the index route
+        response = self.client.get("/")
+
+        # The page still renders with the missing price marked
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"$150.00", response.data)
+        self.assertIn(b"N/A", response.data)
+
+    @patch("app.db.fetch_all")
+    @patch("app.alookup_many")
+    def test_index_no_transactions(self, mock_lookup_many, mock_fetch_all):
+        # Assume that the user is logged in with user_id 1
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        # Mock the database response: the user has no holdings
+        self.mock_user.return_value["cash"] = 1000.0
+        mock_fetch_all.return_value = []
+        mock_lookup_many.return_value = {}
+
         # Make a request to the index route
         response = self.client.get("/")
 
@@ -62,6 +102,41 @@ class TestIndex(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"$1000.00", response.data)
 
+    @patch("app.db.fetch_all")
+    @patch("app.alookup_many")
+    def test_api_portfolio(self, mock_lookup_many, mock_fetch_all):
+        # Assume that the user is logged in with user_id 1
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        # Mock the database response, including a closed position
+        mock_fetch_all.return_value = [
+            holding("AAPL", 2, 200.0, realized=50.0),
+            holding("GOOGL", 0, 0.0, realized=-20.0),
+        ]
+        mock_lookup_many.return_value = {"AAPL": {"price": 150.0, "previous_close": 140.0}}
+
+        response = self.client.get("/api/portfolio")
+
+        # Check the JSON valuation
+        self.assertEqual(response.status_code, 200)
+        portfolio = response.get_json()
+        self.assertEqual(len(portfolio["positions"]), 1)
+        self.assertEqual(portfolio["positions"][0]["market_value"], 300.0)
+        self.assertEqual(portfolio["positions"][0]["weight"], 1.0)
+        self.assertEqual(portfolio["unrealized"], 100.0)
+        self.assertEqual(portfolio["realized"], 30.0)
+        self.assertEqual(portfolio["daily_change"], 20.0)
+        self.assertEqual(portfolio["total"], 10300.0)
+
+    def test_api_portfolio_unknown_user(self):
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        self.mock_user.return_value = None
+
+        self.assertEqual(self.client.get("/api/portfolio").status_code, 500)
+
 
 if __name__ == "__main__":
     unittest.main()
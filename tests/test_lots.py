@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from db_module import MIGRATIONS, Database
+from lots import open_lots, realized_gains, realized_lots, rebuild_lots
+
+
+class TestLots(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary database with one user
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash) VALUES (?, ?)", "test_user", "hashed_password"
+        )
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def trade(self, symbol, price, shares):
+        self.db.execute_query(
+            "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (1, ?, ?, ?)",
+            symbol,
+            price,
+            shares,
+        )
+
+    def snapshot(self):
+        lots = self.db.fetch_all("SELECT * FROM lots ORDER BY transaction_id")
+        sales = self.db.fetch_all("SELECT * FROM lot_sales ORDER BY sale_id, lot_id")
+        return [tuple(row) for row in lots], [tuple(row) for row in sales]
+
+    def test_sell_consumes_oldest_lots_first(self):
+        self.trade("AAPL", 10.0, 5)
+        self.trade("AAPL", 20.0, 5)
+        self.trade("AAPL", 30.0, 5)
+        self.trade("AAPL", 40.0, -7)
+
+        lots = open_lots(self.db, 1, "AAPL")
+        self.assertEqual([(row["price"], row["remaining"]) for row in lots], [(20.0, 3), (30.0, 5)])
+
+        sales = list(realized_lots(self.db, 1))
+        self.assertEqual(
+            [(row["shares"], row["cost"], row["proceeds"]) for row in sales],
+            [(5, 50.0, 200.0), (2, 40.0, 80.0)],
+        )
+
+    def test_realized_gains_by_method(self):
+        self.trade("AAPL", 10.0, 10)
+        self.trade("AAPL", 30.0, 10)
+        self.trade("AAPL", 25.0, -10)
+
+        # FIFO sells the $10 lot; average cost sells at $20
+        self.assertEqual(realized_gains(self.db, 1, "fifo"), {"AAPL": 150.0})
+        self.assertEqual(realized_gains(self.db, 1, "average"), {"AAPL": 50.0})
+        with self.assertRaises(ValueError):
+            realized_gains(self.db, 1, "lifo")
+
+    def test_rebuild_matches_incremental_index(self):
+        trades = [
+            ("AAPL", 10.0, 3), ("GOOGL", 50.0, 2), ("AAPL", 12.0, 4),
+            ("AAPL", 15.0, -5), ("GOOGL", 55.0, -2), ("AAPL", 11.0, 1),
+            ("AAPL", 14.0, -3), ("GOOGL", 60.0, 1),
+        ]
+        for trade in trades:
+            self.trade(*trade)
+        incremental = self.snapshot()
+
+        # Small batches exercise flushing mid-stream
+        with self.db.transaction() as connection:
+            rebuild_lots(connection, batch_size=2)
+
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_migration_backfills_existing_history(self):
+        # A database from before the lot index (schema version 3) with trades
+        self.db.close()
+        os.remove(self.db_path)
+        with patch("db_module.MIGRATIONS", MIGRATIONS[:3]):
+            self.db = Database(self.db_path)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash) VALUES (?, ?)", "test_user", "hashed_password"
+        )
+        self.trade("AAPL", 10.0, 2)
+        self.trade("AAPL", 5.0, 1)
+        self.trade("AAPL", 20.0, -2)
+        self.db.close()
+
+        # Reopening migrates it and fills the lot index from the history
+        self.db = Database(self.db_path)
+
+        self.assertEqual(self.db.fetch_one("PRAGMA user_version")[0], len(MIGRATIONS))
+        self.assertEqual(
+            [(row["price"], row["remaining"]) for row in open_lots(self.db, 1, "AAPL")],
+            [(5.0, 1)],
+        )
+        self.assertEqual(realized_gains(self.db, 1, "fifo"), {"AAPL": 20.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from flask import Flask, render_template_string
+import metrics
+from db_module import Database
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary database file for testing
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+
+        # Build a small instrumented app
+        self.app = Flask(__name__)
+        self.registry = metrics.init_app(self.app, gauges=lambda: {"finance_test_gauge": 7})
+
+        @self.app.route("/page")
+        def page():
+            self.db.execute_query("SELECT 1")
+            self.db.fetch_one("SELECT 1")
+            # Streamed in several batches, but still one query
+            for _ in self.db.fetch_iter("SELECT 1 UNION ALL SELECT 2", size=1):
+                pass
+            with metrics.timed("quote"):
+                pass
+            return render_template_string("{{ value }}", value="ok")
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def test_server_timing_header(self):
+        response = self.client.get("/page")
+
+        # Check that every component is reported
+        header = response.headers["Server-Timing"]
+        self.assertIn('db;dur=', header)
+        self.assertIn('desc="3 queries"', header)
+        self.assertIn("quote;dur=", header)
+        self.assertIn("render;dur=", header)
+        self.assertIn("total;dur=", header)
+
+    def test_metrics_endpoint(self):
+        self.client.get("/page")
+        self.client.get("/page")
+
+        response = self.client.get("/metrics")
+        body = response.get_data(as_text=True)
+
+        # Check the Prometheus text output
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.mimetype.startswith("text/plain"))
+        self.assertIn('finance_requests_total{route="/page"} 2', body)
+        self.assertIn('finance_db_queries_total{route="/page"} 6', body)
+        self.assertIn(
+            'finance_request_duration_seconds_count{route="/page",component="render"} 2', body
+        )
+        self.assertIn(
+            'finance_request_duration_seconds_bucket{route="/page",component="total",le="+Inf"} 2',
+            body,
+        )
+        self.assertIn("finance_test_gauge 7", body)
+
+    def test_timed_outside_request(self):
+        # Timing is a no-op without an active request
+        with metrics.timed("db"):
+            pass
+        self.assertIsNone(metrics._current.get())
+
+
+class TestHistogram(unittest.TestCase):
+    def test_cumulative_buckets(self):
+        histogram = metrics.Histogram(buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5.0)
+
+        self.assertEqual(histogram.counts, [1, 2])
+        self.assertEqual(histogram.count, 3)
+        self.assertAlmostEqual(histogram.sum, 5.55)
+
+
+if __name__ == "__main__":
+    unittest.main()
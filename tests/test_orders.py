@@ -0,0 +1,264 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+from tests.support import FakeClock  # must come before app
+import app as app_module
+from app import app
+from db_module import Database
+from helpers import record_history
+from orders import OrderBook, OrderEngine
+from users import UserCache
+
+
+def order(order_id, side, order_type, trigger_price, symbol="AAPL"):
+    return {
+        "id": order_id,
+        "user_id": 1,
+        "symbol": symbol,
+        "side": side,
+        "type": order_type,
+        "shares": 1,
+        "trigger_price": trigger_price,
+    }
+
+
+class TestOrderBook(unittest.TestCase):
+    def setUp(self):
+        self.book = OrderBook()
+        self.book.add(order(1, "buy", "limit", 90.0))
+        self.book.add(order(2, "buy", "limit", 95.0))
+        self.book.add(order(3, "sell", "stop", 80.0))
+        self.book.add(order(4, "sell", "limit", 110.0))
+        self.book.add(order(5, "buy", "stop", 105.0))
+        self.book.add(order(6, "buy", "limit", 200.0, symbol="GOOGL"))
+
+    def crossed(self, price, symbol="AAPL"):
+        return [order["id"] for order in self.book.cross(symbol, price)]
+
+    def test_cross_falling(self):
+        self.assertEqual(self.crossed(100.0), [])
+        self.assertEqual(self.crossed(92.0), [2])
+        self.assertEqual(self.crossed(80.0), [1, 3])
+        self.assertEqual(self.crossed(80.0), [])
+        self.assertEqual(len(self.book), 3)
+
+    def test_cross_rising(self):
+        self.assertEqual(self.crossed(105.0), [5])
+        self.assertEqual(self.crossed(120.0), [4])
+        # Other symbols are untouched
+        self.assertEqual(self.crossed(1.0, "GOOGL"), [6])
+
+    def test_remove(self):
+        self.assertEqual(self.book.remove(2)["id"], 2)
+        self.assertIsNone(self.book.remove(2))
+
+        self.assertEqual(self.crossed(50.0), [1, 3])
+
+    def test_rebuild_drops_removed_orders(self):
+        book = OrderBook()
+        for i in range(3000):
+            book.add(order(i, "buy", "limit", float(i)))
+        for i in range(2000):
+            book.remove(i)
+
+        self.assertEqual(len(book), 1000)
+        self.assertLess(len(book._falling["AAPL"]), 3000)
+        self.assertEqual(len(book.cross("AAPL", 2500.0)), 500)
+
+
+class TestOrderEngine(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash, cash) VALUES ('test_user', 'hash', 1000.0)"
+        )
+        self.engine = OrderEngine(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def cash(self):
+        return self.db.fetch_one("SELECT cash FROM users WHERE id = 1")["cash"]
+
+    def status(self, order_id):
+        return self.db.fetch_one(
+            "SELECT status, fill_price, error FROM orders WHERE id = ?", order_id
+        )
+
+    def test_limit_buy_fills_at_tick_price(self):
+        order_id = self.engine.place(1, "AAPL", "buy", "limit", 5, 100.0)
+
+        self.assertEqual(self.engine.on_price("AAPL", 101.0), [])
+        self.assertEqual([order["id"] for order in self.engine.on_price("AAPL", 99.0)], [order_id])
+
+        self.assertEqual(tuple(self.status(order_id))[:2], ("filled", 99.0))
+        self.assertEqual(self.cash(), 505.0)
+
+    def test_stop_sell_rejected_without_shares(self):
+        order_id = self.engine.place(1, "AAPL", "sell", "stop", 5, 90.0)
+
+        self.assertEqual(self.engine.on_price("AAPL", 85.0), [])
+
+        row = self.status(order_id)
+        self.assertEqual((row["status"], row["error"]), ("rejected", "too many shares"))
+        self.assertEqual(self.cash(), 1000.0)
+
+    def test_cancel(self):
+        order_id = self.engine.place(1, "AAPL", "buy", "limit", 1, 100.0)
+
+        self.assertFalse(self.engine.cancel(2, order_id))
+        self.assertTrue(self.engine.cancel(1, order_id))
+        self.assertFalse(self.engine.cancel(1, order_id))
+
+        self.assertEqual(self.engine.on_price("AAPL", 50.0), [])
+        self.assertEqual(self.status(order_id)["status"], "cancelled")
+
+    def test_other_processes(self):
+        # Another engine (process) on the same database
+        clock = FakeClock()
+        other = OrderEngine(self.db, sync_interval=1, clock=clock)
+        other.sync()
+        order_id = self.engine.place(1, "AAPL", "buy", "limit", 1, 100.0)
+
+        # Unseen by the other engine until its next sync
+        self.assertEqual(other.on_price("AAPL", 99.0), [])
+        clock.now += 1
+
+        # Loaded by the other engine, filled once between the two
+        self.assertEqual(len(other.on_price("AAPL", 99.0)), 1)
+        self.assertEqual(self.engine.on_price("AAPL", 99.0), [])
+        self.assertEqual(self.cash(), 901.0)
+        self.assertEqual(self.status(order_id)["status"], "filled")
+
+    def test_failed_fill_stays_in_book(self):
+        first = self.engine.place(1, "AAPL", "buy", "limit", 1, 100.0)
+        second = self.engine.place(1, "AAPL", "buy", "limit", 1, 100.0)
+
+        locked = sqlite3.OperationalError("database is locked")
+        with patch("orders.execute_trade", side_effect=locked):
+            self.assertEqual(self.engine.on_price("AAPL", 99.0), [])
+
+        self.assertIn(first, self.engine.book)
+        self.assertIn(second, self.engine.book)
+        self.assertEqual(len(self.engine.on_price("AAPL", 99.0)), 2)
+        self.assertEqual(self.cash(), 802.0)
+
+    def test_poll(self):
+        prices = {"AAPL": {"price": 99.0}, "MSFT": {"price": 1.0, "stale": True}}
+        engine = OrderEngine(self.db, lookup=prices.get)
+        aapl = engine.place(1, "AAPL", "buy", "limit", 1, 100.0)
+        msft = engine.place(1, "MSFT", "buy", "limit", 1, 100.0)
+
+        engine.poll()
+
+        self.assertEqual(self.status(aapl)["status"], "filled")
+        # Never at a stale price
+        self.assertEqual(self.status(msft)["status"], "open")
+
+
+class TestOrderRoutes(unittest.TestCase):
+    def setUp(self):
+        app.config["TESTING"] = True
+        app.config["SECRET_KEY"] = "test_secret_key"
+        self.client = app.test_client()
+
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash, cash) VALUES ('test_user', 'hash', 1000.0)"
+        )
+        self.engine = OrderEngine(self.db, on_fill=app_module.order_filled)
+        patches = {
+            "app.db": self.db,
+            "app.order_engine": self.engine,
+            "app.user_cache": UserCache(self.db),
+        }
+        for target, value in patches.items():
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    @patch("app.alookup")
+    def test_place_fill_and_list(self, mock_lookup):
+        mock_lookup.return_value = {"name": "AAPL", "price": 100.0, "symbol": "AAPL"}
+
+        response = self.client.post(
+            "/orders",
+            data={"symbol": "aapl", "side": "buy", "type": "limit", "shares": "2", "price": "95"},
+        )
+
+        self.assertEqual(response.status_code, 201)
+        placed = response.get_json()
+        self.assertEqual(
+            (placed["symbol"], placed["trigger_price"], placed["status"]), ("AAPL", 95.0, "open")
+        )
+
+        # A quote fetched below the limit is queued for the matching thread
+        with patch("helpers.price_history", None):
+            record_history("AAPL", {"name": "AAPL", "price": 94.0, "symbol": "AAPL"})
+        self.assertEqual(self.client.get("/orders").get_json()[0]["status"], "open")
+        self.assertEqual(len(self.engine.run_pending()), 1)
+
+        orders = self.client.get("/orders").get_json()
+        self.assertEqual([(o["id"], o["status"]) for o in orders], [(placed["id"], "filled")])
+        self.assertEqual(self.client.get("/api/portfolio").get_json()["cash"], 812.0)
+        self.assertEqual(self.client.get("/orders?status=open").get_json(), [])
+
+    @patch("app.alookup")
+    def test_marketable_limit_fills_on_next_match(self, mock_lookup):
+        mock_lookup.return_value = {"name": "AAPL", "price": 100.0, "symbol": "AAPL"}
+
+        order = {"symbol": "AAPL", "side": "buy", "type": "limit", "shares": 1, "price": 105}
+        response = self.client.post("/orders", json=order)
+        order_id = response.get_json()["id"]
+
+        # The quote fetched when placing it is already below the limit
+        self.assertEqual(len(self.engine.run_pending()), 1)
+        orders = self.client.get("/orders").get_json()
+        self.assertEqual([(o["id"], o["status"]) for o in orders], [(order_id, "filled")])
+
+    @patch("app.alookup")
+    def test_stale_quote_does_not_fill(self, mock_lookup):
+        mock_lookup.return_value = {"name": "AAPL", "price": 100.0, "symbol": "AAPL", "stale": True}
+
+        order = {"symbol": "AAPL", "side": "buy", "type": "limit", "shares": 1, "price": 105}
+        self.client.post("/orders", json=order)
+
+        self.assertEqual(self.engine.run_pending(), [])
+
+    @patch("app.alookup")
+    def test_place_invalid(self, mock_lookup):
+        mock_lookup.return_value = None
+        order = {"symbol": "AAPL", "side": "buy", "type": "limit", "shares": 1, "price": 95}
+
+        for field, value in (("side", "hold"), ("type", "market"), ("shares", 0), ("price", -1)):
+            response = self.client.post("/orders", json={**order, field: value})
+            self.assertEqual(response.status_code, 400, field)
+
+        # Unknown symbol
+        self.assertEqual(self.client.post("/orders", json=order).status_code, 400)
+
+    def test_cancel(self):
+        order_id = self.engine.place(1, "AAPL", "buy", "limit", 1, 100.0)
+
+        response = self.client.post(f"/orders/{order_id}/cancel")
+
+        self.assertEqual(response.get_json(), {"id": order_id, "status": "cancelled"})
+        self.assertEqual(self.client.post(f"/orders/{order_id}/cancel").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import tests.support  # noqa: F401, must come before app
+from app import app
+from db_module import Database
+from users import UserCache
+
+
+PRICES = {"AAPL": 100.0, "GOOGL": 200.0, "MSFT": 10.0}
+
+
+async def fake_lookup_many(symbols, deadline=None):
+    return {
+        symbol: {"symbol": symbol, "price": PRICES[symbol]} if symbol in PRICES else None
+        for symbol in symbols
+    }
+
+
+class TestOrdersBatch(unittest.TestCase):
+    def setUp(self):
+        app.config["TESTING"] = True
+        app.config["SECRET_KEY"] = "test_secret_key"
+        self.client = app.test_client()
+
+        # Temporary database with one user holding $1000 and 5 AAPL
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash, cash) VALUES ('test_user', 'hash', 1000.0)"
+        )
+        self.db.execute_query(
+            "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (1, 'AAPL', 100.0, 5)"
+        )
+
+        patches = {
+            "app.db": self.db,
+            "app.user_cache": UserCache(self.db),
+            "app.alookup_many": fake_lookup_many,
+        }
+        for target, value in patches.items():
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def cash(self):
+        return self.db.fetch_one("SELECT cash FROM users WHERE id = 1")["cash"]
+
+    def post(self, orders, mode=None):
+        body = {"orders": orders}
+        if mode:
+            body["mode"] = mode
+        return self.client.post("/orders/batch", json=body)
+
+    def test_atomic(self):
+        response = self.post([
+            {"symbol": "googl", "side": "buy", "shares": 5},
+            {"symbol": "AAPL", "side": "sell", "shares": "5"},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.get_json()["results"],
+            [
+                {"symbol": "GOOGL", "side": "buy", "shares": 5, "price": 200.0, "status": "filled"},
+                {"symbol": "AAPL", "side": "sell", "shares": 5, "price": 100.0, "status": "filled"},
+            ],
+        )
+        self.assertEqual(self.cash(), 500.0)
+
+        # The portfolio shows the new cash right away
+        self.assertEqual(self.client.get("/api/portfolio").get_json()["cash"], 500.0)
+
+    def test_atomic_rejects_whole_basket(self):
+        response = self.post([
+            {"symbol": "MSFT", "side": "buy", "shares": 1},
+            {"symbol": "NOPE", "side": "buy", "shares": 1},
+            {"symbol": "GOOGL", "side": "buy", "shares": 0},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        results = response.get_json()["results"]
+        self.assertEqual([result["status"] for result in results], ["cancelled", "rejected", "rejected"])
+        self.assertEqual(results[1]["error"], "invalid symbol")
+        self.assertEqual(self.cash(), 1000.0)
+
+    def test_best_effort(self):
+        response = self.post(
+            [
+                {"symbol": "MSFT", "side": "buy", "shares": 10},
+                {"symbol": "GOOGL", "side": "buy", "shares": 5},
+                {"symbol": "AAPL", "side": "hold", "shares": 1},
+            ],
+            mode="best_effort",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()["results"]
+        self.assertEqual([result["status"] for result in results], ["filled", "rejected", "rejected"])
+        self.assertEqual(results[1]["error"], "can't afford")
+        self.assertEqual(results[2]["error"], "side must be buy or sell")
+        self.assertEqual(self.cash(), 900.0)
+
+    def test_csv_upload(self):
+        csv_file = io.BytesIO(b"symbol,side,shares\nMSFT,buy,10\nAAPL,sell,1\n")
+
+        response = self.client.post(
+            "/orders/batch",
+            data={"file": (csv_file, "orders.csv"), "mode": "best_effort"},
+            content_type="multipart/form-data",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["status"] for result in response.get_json()["results"]], ["filled", "filled"]
+        )
+        self.assertEqual(self.cash(), 1000.0)
+
+    def test_stale_quote_rejected(self):
+        async def stale_lookup_many(symbols, deadline=None):
+            return {symbol: {"symbol": symbol, "price": 1.0, "stale": True} for symbol in symbols}
+
+        with patch("app.alookup_many", stale_lookup_many):
+            response = self.post([{"symbol": "MSFT", "side": "buy", "shares": 1}], "best_effort")
+
+        self.assertEqual(response.get_json()["results"][0]["status"], "rejected")
+        self.assertEqual(self.cash(), 1000.0)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post([], "atomic").status_code, 400)
+        self.assertEqual(self.post([{"symbol": "MSFT"}], "all").status_code, 400)
+        self.assertEqual(self.client.post("/orders/batch", json=["MSFT"]).status_code, 400)
+        self.assertEqual(self.client.post("/orders/batch", data={}).status_code, 400)
+
+        too_many = [{"symbol": "MSFT", "side": "buy", "shares": 1}] * 101
+        self.assertEqual(self.post(too_many).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch
+import tests.support  # noqa: F401, must come before app
+from app import app
+
+
+class TestPerformance(unittest.TestCase):
+    def setUp(self):
+        app.config["TESTING"] = True
+        app.config["SECRET_KEY"] = "test_secret_key"
+        self.client = app.test_client()
+
+    @patch("app.db.fetch_all")
+    @patch("app.update_snapshots")
+    def test_performance(self, mock_update_snapshots, mock_fetch_all):
+        # Assume that the user is logged in with user_id 1
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        # Mock the database response for the snapshot query
+        mock_fetch_all.return_value = [
+            {"date": "2024-01-01", "cash": 900.0, "market_value": 100.0},
+            {"date": "2024-01-02", "cash": 900.0, "market_value": 120.0},
+        ]
+
+        response = self.client.get("/performance?start=2024-01-01")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.get_json()["series"],
+            [
+                {"date": "2024-01-01", "cash": 900.0, "market_value": 100.0, "total": 1000.0},
+                {"date": "2024-01-02", "cash": 900.0, "market_value": 120.0, "total": 1020.0},
+            ],
+        )
+        # Snapshots are updated by the CLI job, not on the request path
+        mock_update_snapshots.assert_not_called()
+        self.assertEqual(mock_fetch_all.call_args.args[1:], (1, "2024-01-01"))
+
+    def test_performance_invalid_date(self):
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        response = self.client.get("/performance?end=yesterday")
+
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
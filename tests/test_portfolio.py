@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from db_module import Database
+from portfolio import load_positions, value_portfolio
+
+
+class TestPortfolio(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary database with one user
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash, cash) VALUES (?, ?, ?)",
+            "test_user",
+            "hashed_password",
+            1000.0,
+        )
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def test_load_positions_many_lots(self):
+        # Tens of thousands of lots collapse into one row per symbol
+        with self.db.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (1, ?, ?, ?)",
+                ((("AAPL", "GOOGL")[i % 2], 10.0, 1) for i in range(20000)),
+            )
+            connection.execute(
+                "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (1, 'GOOGL', 20.0, -10000)"
+            )
+
+        holdings = load_positions(self.db, 1)
+
+        self.assertEqual(
+            [(row["symbol"], row["shares"], row["cost_basis"], row["realized"]) for row in holdings],
+            [("AAPL", 10000, 100000.0, 0), ("GOOGL", 0, 0, 100000.0)],
+        )
+
+    def test_load_positions_unknown_user(self):
+        self.assertEqual(load_positions(self.db, 2), [])
+
+    def test_value_portfolio(self):
+        holdings = [
+            {"symbol": "AAPL", "shares": 10, "cost_basis": 1000.0, "realized": 5.0},
+            {"symbol": "GOOGL", "shares": 5, "cost_basis": 500.0, "realized": 0.0},
+            {"symbol": "MSFT", "shares": 1, "cost_basis": 300.0, "realized": 0.0},
+        ]
+        quotes = {
+            "AAPL": {"price": 120.0, "previous_close": 110.0},
+            "GOOGL": {"price": 80.0},
+            "MSFT": None,
+        }
+
+        portfolio = value_portfolio(200.0, holdings, quotes)
+        aapl, googl, msft = portfolio["positions"]
+
+        self.assertEqual(aapl["market_value"], 1200.0)
+        self.assertEqual(aapl["unrealized"], 200.0)
+        self.assertEqual(aapl["daily_change"], 100.0)
+        self.assertIsNone(googl["daily_change"])
+        # Unpriced positions are carried at cost
+        self.assertIsNone(msft["unrealized"])
+        self.assertEqual(msft["market_value"], 300.0)
+        self.assertAlmostEqual(sum(p["weight"] for p in portfolio["positions"]), 1.0)
+        self.assertEqual(portfolio["market_value"], 1900.0)
+        self.assertEqual(portfolio["unrealized"], 100.0)
+        self.assertEqual(portfolio["realized"], 5.0)
+        self.assertEqual(portfolio["total"], 2100.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
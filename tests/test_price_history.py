@@ -0,0 +1,87 @@
+import datetime
+import math
+import os
+import tempfile
+import unittest
+from db_module import Database
+from price_history import PriceHistory
+
+
+def bar(date, close):
+    return (date, close - 1, close + 1, close - 2, close, 1000.0)
+
+
+class FakeHistory:
+    """Provider history that records which ranges were requested."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, symbol, start, end):
+        self.calls.append((start.isoformat(), end.isoformat()))
+        if self.fail:
+            return None
+        days = (end - start).days + 1
+        dates = (start + datetime.timedelta(days=i) for i in range(days))
+        return [bar(date.isoformat(), 100.0 + date.day) for date in dates]
+
+
+class TestPriceHistory(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary database file for testing
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.history = PriceHistory(self.db, today=lambda: datetime.date(2024, 1, 31))
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def test_fill_only_downloads_gaps(self):
+        fetch = FakeHistory()
+
+        self.history.fill("AAPL", "2024-01-10", "2024-01-12", fetch)
+        self.history.fill("AAPL", "2024-01-11", "2024-01-12", fetch)
+        self.history.fill("AAPL", "2024-01-08", "2024-01-15", fetch)
+
+        self.assertEqual(
+            fetch.calls,
+            [
+                ("2024-01-10", "2024-01-12"),
+                ("2024-01-08", "2024-01-09"),
+                ("2024-01-13", "2024-01-15"),
+            ],
+        )
+        self.assertEqual(len(self.history.bars("AAPL", "2024-01-01", "2024-01-31")["date"]), 8)
+
+    def test_fill_refetches_today_and_failures(self):
+        failing = FakeHistory(fail=True)
+        self.history.fill("AAPL", "2024-01-29", "2024-01-31", failing)
+        self.history.fill("AAPL", "2024-01-29", "2024-01-31", failing)
+        self.assertEqual(len(failing.calls), 2)
+
+        # Today's bar is still moving, so it is fetched again
+        fetch = FakeHistory()
+        self.history.fill("AAPL", "2024-01-29", "2024-01-31", fetch)
+        self.history.fill("AAPL", "2024-01-29", "2024-01-31", fetch)
+        self.assertEqual(fetch.calls, [("2024-01-29", "2024-01-31"), ("2024-01-31", "2024-01-31")])
+
+    def test_bars_are_columns(self):
+        self.history.record_bars("AAPL", [bar("2024-01-02", 10.0), bar("2024-01-03", 11.0)])
+        self.history.record_quote({"symbol": "AAPL", "price": 12.0})
+
+        bars = self.history.bars("AAPL", "2024-01-01", "2024-01-31")
+
+        self.assertEqual(bars["date"], ["2024-01-02", "2024-01-03", "2024-01-31"])
+        self.assertEqual(list(bars["close"]), [10.0, 11.0, 12.0])
+        self.assertEqual(list(bars["high"][:2]), [11.0, 12.0])
+        # Quote-only days have no open, high, low or volume
+        self.assertTrue(math.isnan(bars["open"][2]))
+        # Columns expose a flat buffer of doubles
+        self.assertEqual(memoryview(bars["close"]).format, "d")
+
+
+if __name__ == "__main__":
+    unittest.main()
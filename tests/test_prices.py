@@ -0,0 +1,44 @@
+import unittest
+from array import array
+from unittest.mock import patch
+import tests.support  # noqa: F401, must come before app
+from app import app
+
+
+class TestPrices(unittest.TestCase):
+    def setUp(self):
+        app.config["TESTING"] = True
+        app.config["SECRET_KEY"] = "test_secret_key"
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+    @patch("app.price_bars")
+    def test_prices(self, mock_price_bars):
+        mock_price_bars.return_value = {
+            "date": ["2024-01-02", "2024-01-03"],
+            "open": array("d", [10.0, float("nan")]),
+            "close": array("d", [11.0, 12.0]),
+        }
+
+        response = self.client.get("/api/prices/aapl?start=2024-01-01&end=2024-01-31")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.get_json(),
+            {
+                "date": ["2024-01-02", "2024-01-03"],
+                "open": [10.0, None],
+                "close": [11.0, 12.0],
+            },
+        )
+        symbol, start, end = mock_price_bars.call_args.args
+        self.assertEqual((symbol, str(start), str(end)), ("aapl", "2024-01-01", "2024-01-31"))
+
+    def test_prices_invalid(self):
+        self.assertEqual(self.client.get("/api/prices/A1").status_code, 400)
+        self.assertEqual(self.client.get("/api/prices/AAPL?start=soon").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import tests.support  # noqa: F401, must come before app
+from app import app
+from db_module import Database
+from orders import OrderEngine
+
+
+class TracingDatabase(Database):
+    """Database that records every statement run by its connections."""
+
+    def __init__(self, *args, **kwargs):
+        self.statements = []
+        super().__init__(*args, **kwargs)
+
+    def _connect(self):
+        connection = super()._connect()
+        connection.set_trace_callback(self.statements.append)
+        return connection
+
+
+class TestQueryPlans(unittest.TestCase):
+    def setUp(self):
+        app.config["TESTING"] = True
+        app.config["SECRET_KEY"] = "test_secret_key"
+        self.client = app.test_client()
+
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = TracingDatabase(self.db_path)
+        for target in ("app.db", "app.user_cache.db"):
+            patcher = patch(target, self.db)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch("app.order_engine", OrderEngine(self.db))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    @patch("app.alookup_many")
+    @patch("app.alookup")
+    @patch("app.lookup")
+    def test_no_full_table_scans(self, mock_lookup, mock_alookup, mock_alookup_many):
+        mock_lookup.return_value = {"name": "AAPL", "price": 100.0, "symbol": "AAPL"}
+        mock_alookup.return_value = mock_lookup.return_value
+        mock_alookup_many.return_value = {"AAPL": mock_lookup.return_value}
+
+        # Only record statements issued by the routes
+        del self.db.statements[:]
+
+        # Drive every route that touches the database
+        credentials = {"username": "test_user", "password": "password"}
+        self.client.post("/register", data={**credentials, "confirmation": "password"})
+        self.client.get("/logout")
+        self.client.post("/login", data=credentials)
+        self.client.post("/buy", data={"symbol": "AAPL", "shares": "3"})
+        self.client.post("/sell", data={"symbol": "AAPL", "shares": "1"})
+        self.client.post(
+            "/orders/batch", json={"orders": [{"symbol": "AAPL", "side": "buy", "shares": 1}]}
+        )
+        self.client.get("/sell")
+        self.client.get("/history")
+        self.client.get("/history?limit=1&after=2000-01-01 00:00:00,1")
+        self.client.get("/history?limit=1&before=2100-01-01 00:00:00,1")
+        self.client.get("/")
+        self.client.get("/performance")
+        order = {"symbol": "AAPL", "side": "buy", "type": "limit", "shares": 1, "price": 1}
+        order_id = self.client.post("/orders", json=order).get_json()["id"]
+        self.client.get("/orders?status=open")
+        self.client.post(f"/orders/{order_id}/cancel")
+
+        statements = {
+            statement
+            for statement in self.db.statements
+            if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE"))
+        }
+        self.assertTrue(statements)
+
+        # Check that no query falls back to scanning a whole table
+        with self.db.connection() as connection:
+            for statement in statements:
+                plan = connection.execute("EXPLAIN QUERY PLAN " + statement).fetchall()
+                for row in plan:
+                    self.assertFalse(
+                        row["detail"].startswith("SCAN"),
+                        f"{statement!r} scans: {row['detail']}",
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
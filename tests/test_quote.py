@@ -1,7 +1,9 @@
 import unittest
+import tests.support  # noqa: F401, must come before app
 from app import app
 from flask import session
 from unittest.mock import patch
+from quote_providers import UpstreamError
 
 
 class TestQuote(unittest.TestCase):
@@ -9,7 +11,7 @@ class TestQuote(unittest.TestCase):
         # Set up a test client
         self.client = app.test_client()
 
-    @patch("app.lookup")
+    @patch("app.alookup")
     def test_quote(self, mock_lookup):
         # Mock the lookup function to simulate a valid quote
         mock_lookup.return_value = {"name": "AAPL", "price": 150.0, "symbol": "AAPL"}
@@ -29,6 +31,18 @@ class TestQuote(unittest.TestCase):
         self.assertIn(b"AAPL", response.data)
         self.assertIn(b"$150.00", response.data)
 
+    @patch("app.alookup")
+    def test_quote_upstream_unavailable(self, mock_lookup):
+        # No price known while the upstream is down
+        mock_lookup.side_effect = UpstreamError("timeout")
+
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = 1
+
+        response = self.client.post("/quote", data={"symbol": "AAPL"})
+
+        self.assertEqual(response.status_code, 503)
+
 
 if __name__ == "__main__":
     unittest.main()
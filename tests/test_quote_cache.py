@@ -0,0 +1,262 @@
+import asyncio
+import threading
+import time
+import unittest
+from quote_cache import QuoteCache
+from tests.support import FakeClock
+
+
+class TestQuoteCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(0.0)
+        self.calls = []
+        self.prices = {"AAPL": 150.0}
+
+        def fetch(symbol):
+            self.calls.append(symbol)
+            if symbol not in self.prices:
+                return None
+            return {"name": symbol, "price": self.prices[symbol], "symbol": symbol}
+
+        self.cache = QuoteCache(
+            fetch, ttl=60, stale_ttl=300, negative_ttl=30, maxsize=2, clock=self.clock
+        )
+
+    def test_hit_within_ttl(self):
+        self.assertEqual(self.cache.get("AAPL")["price"], 150.0)
+        self.assertEqual(self.cache.get("AAPL")["price"], 150.0)
+
+        # Only the first call reaches the upstream
+        self.assertEqual(self.calls, ["AAPL"])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_aget_shares_entries_with_get(self):
+        async def afetch(symbol):
+            self.calls.append(("async", symbol))
+            return {"name": symbol, "price": 151.0, "symbol": symbol}
+
+        self.cache.afetch = afetch
+
+        self.assertEqual(asyncio.run(self.cache.aget("AAPL"))["price"], 151.0)
+        self.assertEqual(self.cache.get("AAPL")["price"], 151.0)
+        self.assertEqual(self.calls, [("async", "AAPL")])
+
+    def test_concurrent_misses_share_one_fetch(self):
+        release = threading.Event()
+
+        def fetch(symbol):
+            self.calls.append(symbol)
+            release.wait(1)
+            return {"name": symbol, "price": 150.0, "symbol": symbol}
+
+        self.cache.fetch = fetch
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get("AAPL")))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        # Let every thread join the flight before the fetch answers
+        while self.cache.stats()["coalesced"] < 9:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, ["AAPL"])
+        self.assertEqual([quote["price"] for quote in results], [150.0] * 10)
+        # Each caller gets its own copy
+        self.assertEqual(len({id(quote) for quote in results}), 10)
+
+    def test_waiters_see_leader_error(self):
+        def fetch(symbol):
+            time.sleep(0.05)
+            raise RuntimeError("upstream down")
+
+        self.cache.fetch = fetch
+        errors = []
+
+        def get():
+            try:
+                self.cache.get("AAPL")
+            except RuntimeError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=get) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 3)
+        # Nothing stays in flight after a failure
+        self.assertEqual(self.cache._inflight, {})
+
+    def test_aget_coalesces_across_event_loops(self):
+        calls = []
+
+        async def afetch(symbol):
+            calls.append(symbol)
+            await asyncio.sleep(0.1)
+            return {"name": symbol, "price": 151.0, "symbol": symbol}
+
+        self.cache.afetch = afetch
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(asyncio.run(self.cache.aget("AAPL"))))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, ["AAPL"])
+        self.assertEqual([quote["price"] for quote in results], [151.0] * 5)
+        self.assertEqual(self.cache.stats()["coalesced"], 4)
+
+    def test_cancelled_waiter_leaves_fetch_alone(self):
+        release = None
+
+        async def afetch(symbol):
+            await release.wait()
+            return {"name": symbol, "price": 151.0, "symbol": symbol}
+
+        async def main():
+            nonlocal release
+            release = asyncio.Event()
+            leader = asyncio.ensure_future(self.cache.aget("AAPL"))
+            await asyncio.sleep(0)
+            # A waiter that gives up, as on an alookup_many deadline
+            waiter = asyncio.ensure_future(self.cache.aget("AAPL"))
+            _, pending = await asyncio.wait([waiter], timeout=0.01)
+            for task in pending:
+                task.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            return await leader
+
+        self.cache.afetch = afetch
+        self.assertEqual(asyncio.run(main())["price"], 151.0)
+        self.assertEqual(self.cache.get("AAPL")["price"], 151.0)
+
+    def waiter_thread(self, results):
+        """Start a threaded get of AAPL, as /sell or the order engine would."""
+        thread = threading.Thread(target=lambda: results.append(self.cache.get("AAPL")))
+        thread.start()
+        return thread
+
+    async def until_coalesced(self):
+        while not self.cache.coalesced:
+            await asyncio.sleep(0.001)
+
+    def test_cancelled_leader_leaves_fetch_alone(self):
+        release = None
+        results = []
+
+        async def afetch(symbol):
+            await release.wait()
+            return {"name": symbol, "price": 151.0, "symbol": symbol}
+
+        async def main():
+            nonlocal release
+            release = asyncio.Event()
+            # The leader gives up, as on an alookup_many deadline
+            leader = asyncio.ensure_future(self.cache.aget("AAPL"))
+            await asyncio.sleep(0)
+            thread = self.waiter_thread(results)
+            await self.until_coalesced()
+            leader.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            await asyncio.to_thread(thread.join)
+
+        self.cache.afetch = afetch
+        asyncio.run(main())
+
+        # The waiter got the leader's quote, not its cancellation
+        self.assertEqual(results[0]["price"], 151.0)
+        self.assertEqual(self.calls, [])
+
+    def test_abandoned_fetch_is_retried(self):
+        results = []
+        thread = None
+
+        async def afetch(symbol):
+            await asyncio.Event().wait()
+
+        async def main():
+            nonlocal thread
+            asyncio.ensure_future(self.cache.aget("AAPL"))
+            await asyncio.sleep(0)
+            thread = self.waiter_thread(results)
+            await self.until_coalesced()
+            # Returning shuts the loop down, cancelling the fetch
+
+        self.cache.afetch = afetch
+        asyncio.run(main())
+        thread.join()
+
+        # The waiter fetched the quote itself
+        self.assertEqual(results[0]["price"], 150.0)
+        self.assertEqual(self.calls, ["AAPL"])
+
+    def test_returns_copy(self):
+        # Callers mutating the quote must not poison the cache
+        quote = self.cache.get("AAPL")
+        quote["price"] = "150.00"
+
+        self.assertEqual(self.cache.get("AAPL")["price"], 150.0)
+
+    def test_stale_while_revalidate(self):
+        self.cache.get("AAPL")
+        self.prices["AAPL"] = 160.0
+        self.clock.now = 120
+
+        # The stale price is served while a refresh runs in the background
+        self.assertEqual(self.cache.get("AAPL")["price"], 150.0)
+        for thread in threading.enumerate():
+            if thread.name == "quote-refresh-AAPL":
+                thread.join(timeout=1)
+
+        self.assertEqual(self.cache.get("AAPL")["price"], 160.0)
+        self.assertEqual(self.cache.stats()["stale_hits"], 1)
+
+    def test_expired_entry_refetched(self):
+        self.cache.get("AAPL")
+        self.clock.now = 1000
+
+        self.cache.get("AAPL")
+
+        self.assertEqual(self.calls, ["AAPL", "AAPL"])
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_negative_cache(self):
+        self.assertIsNone(self.cache.get("INVALID"))
+        self.assertIsNone(self.cache.get("INVALID"))
+        self.assertEqual(self.calls, ["INVALID"])
+        self.assertEqual(self.cache.stats()["negative_hits"], 1)
+
+        # Invalid symbols are retried once the negative TTL expires
+        self.clock.now = 31
+        self.cache.get("INVALID")
+        self.assertEqual(self.calls, ["INVALID", "INVALID"])
+
+    def test_lru_bound(self):
+        self.prices.update({"GOOGL": 2000.0, "MSFT": 300.0})
+        self.cache.get("AAPL")
+        self.cache.get("GOOGL")
+        self.cache.get("AAPL")
+        self.cache.get("MSFT")
+
+        # GOOGL was the least recently used entry and got evicted
+        self.assertEqual(self.cache.stats()["size"], 2)
+        self.cache.get("GOOGL")
+        self.assertEqual(self.calls.count("GOOGL"), 2)
+        self.assertEqual(self.calls.count("AAPL"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from quote_providers import (
+    LocalProvider,
+    YahooProvider,
+    create_provider,
+    parse_bars,
+    parse_latest_close,
+)
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+class TestParsers(unittest.TestCase):
+    def test_parse_latest_close(self):
+        with open(os.path.join(DATA_DIR, "yahoo_aapl_7d.csv"), "rb") as file:
+            content = file.read()
+
+        self.assertEqual(parse_latest_close(content), 185.072494)
+        self.assertEqual(parse_latest_close(content, column=b"Open"), 182.089996)
+        self.assertEqual(parse_latest_close(content, skip=1), 180.703995)
+        self.assertEqual(parse_latest_close(content, skip=4), 185.152283)
+        with self.assertRaises(IndexError):
+            parse_latest_close(content, skip=5)
+        # Windows line endings and no trailing newline
+        windows = content.replace(b"\n", b"\r\n").rstrip()
+        self.assertEqual(parse_latest_close(windows), 185.072494)
+        self.assertEqual(parse_latest_close(windows, skip=1), 180.703995)
+
+    def test_parse_bars(self):
+        with open(os.path.join(DATA_DIR, "yahoo_aapl_7d.csv"), "rb") as file:
+            content = file.read()
+        content += b"2024-01-09,null,null,null,null,null,null\n"
+
+        bars = parse_bars(content)
+
+        # Every complete row, with the adjusted close
+        self.assertEqual(len(bars), 5)
+        self.assertEqual(
+            bars[0], ("2024-01-02", 187.149994, 188.440002, 183.889999, 185.152283, 82488700.0)
+        )
+        self.assertEqual(bars[-1][4], 185.072494)
+
+    def test_parse_latest_close_invalid(self):
+        header = b"Date,Open,High,Low,Close,Adj Close,Volume\n"
+        with self.assertRaises(IndexError):
+            parse_latest_close(header)
+        with self.assertRaises(IndexError):
+            parse_latest_close(b"")
+        with self.assertRaises(ValueError):
+            parse_latest_close(header + b"2024-01-08,null,null,null,null,null,null\n")
+        with self.assertRaises(ValueError):
+            parse_latest_close(b"Date,Close\n2024-01-08,1.0\n")
+
+
+class TestLocalProvider(unittest.TestCase):
+    def test_random_walk_deterministic(self):
+        first = LocalProvider(seed=1)
+        second = LocalProvider(seed=1)
+
+        # Each symbol follows the same walk regardless of lookup order
+        first_prices = [first.fetch("AAPL")["price"] for _ in range(5)]
+        second.fetch("GOOGL")
+        second_prices = [second.fetch("aapl")["price"] for _ in range(5)]
+
+        self.assertEqual(first_prices, second_prices)
+        self.assertGreater(len(set(first_prices)), 1)
+        self.assertEqual(first.fetch("AAPL")["symbol"], "AAPL")
+
+    def test_random_walk_invalid_symbol(self):
+        self.assertIsNone(LocalProvider().fetch("A1"))
+
+    def test_replay_csv(self):
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as file:
+            file.write("symbol,price\nAAPL,150\nAAPL,151.5\nGOOGL,2000\n")
+        self.addCleanup(os.remove, path)
+
+        provider = LocalProvider(path=path)
+
+        # Prices replay in order and wrap around
+        prices = [provider.fetch("AAPL")["price"] for _ in range(3)]
+        self.assertEqual(prices, [150.0, 151.5, 150.0])
+        self.assertEqual(provider.fetch("GOOGL")["price"], 2000.0)
+        self.assertIsNone(provider.fetch("MSFT"))
+
+    def test_replay_sqlite(self):
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE prices (symbol TEXT, price NUMERIC)")
+        connection.executemany("INSERT INTO prices VALUES (?, ?)", [("AAPL", 10), ("AAPL", 11)])
+        connection.commit()
+        connection.close()
+
+        provider = LocalProvider(path=path)
+
+        self.assertEqual(provider.fetch("AAPL")["price"], 10.0)
+        self.assertEqual(provider.fetch("AAPL")["price"], 11.0)
+
+    def test_latency(self):
+        provider = LocalProvider(latency=0.05)
+
+        started = time.perf_counter()
+        provider.fetch("AAPL")
+
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
+
+
+class TestCreateProvider(unittest.TestCase):
+    def test_create_provider(self):
+        self.assertIsInstance(create_provider("yahoo"), YahooProvider)
+        self.assertIsInstance(create_provider("local"), LocalProvider)
+        self.assertEqual(create_provider("local", latency=0.2).latency, 0.2)
+        with self.assertRaises(ValueError):
+            create_provider("bloomberg")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import time
+import unittest
+from db_module import Database
+from quote_store import PriceRefresher, QuoteStore
+from tests.support import FakeClock
+
+
+class TestQuoteStore(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary database file for testing
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.clock = FakeClock()
+        self.store = QuoteStore(self.db, max_age=60, clock=self.clock)
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def test_put_and_get(self):
+        self.store.put({"name": "AAPL", "price": 150.0, "symbol": "AAPL"})
+        self.store.put({"name": "AAPL", "price": 151.0, "symbol": "AAPL"})
+
+        self.assertEqual(
+            self.store.get("AAPL"),
+            {"name": "AAPL", "price": 151.0, "previous_close": None, "symbol": "AAPL"},
+        )
+        self.assertIsNone(self.store.get("GOOGL"))
+
+        # Quotes past max_age are treated as missing
+        self.clock.now += 61
+        self.assertIsNone(self.store.get("AAPL"))
+
+    def test_previous_close(self):
+        # Daily change needs the previous close from quotes served by the store
+        self.store.put(
+            {"name": "AAPL", "price": 151.0, "previous_close": 149.5, "symbol": "AAPL"}
+        )
+
+        self.assertEqual(self.store.get("AAPL")["previous_close"], 149.5)
+
+    def test_lease(self):
+        self.assertTrue(self.store.acquire_lease("refresh", "a", ttl=10))
+        self.assertTrue(self.store.acquire_lease("refresh", "a", ttl=10))
+        self.assertFalse(self.store.acquire_lease("refresh", "b", ttl=10))
+
+        # Another owner takes over once the lease expires
+        self.clock.now += 11
+        self.assertTrue(self.store.acquire_lease("refresh", "b", ttl=10))
+        self.assertFalse(self.store.acquire_lease("refresh", "a", ttl=10))
+
+    def test_wait_times_out(self):
+        with self.assertRaises(TimeoutError):
+            self.store.wait("AAPL", "quote:AAPL", timeout=0.05, poll=0.01)
+        self.assertEqual(self.store.coalesced, 0)
+
+
+class TestPriceRefresher(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary database with two users holding stock
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        query = "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (?, ?, ?, ?)"
+        self.db.execute_query(query, 1, "AAPL", 100.0, 1)
+        self.db.execute_query(query, 2, "AAPL", 100.0, 1)
+        self.db.execute_query(query, 2, "GOOGL", 100.0, 1)
+        self.db.execute_query(query, 2, "MSFT", 100.0, 1)
+        self.db.execute_query(query, 2, "MSFT", 100.0, -1)
+        self.store = QuoteStore(self.db)
+
+        self.calls = []
+
+        def fetch(symbol):
+            self.calls.append(symbol)
+            return {"name": symbol, "price": 42.0, "symbol": symbol}
+
+        self.fetch = fetch
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def test_refresh_once(self):
+        refresher = PriceRefresher(self.db, self.store, self.fetch, rate=1000)
+
+        self.assertEqual(refresher.refresh_once(), 2)
+
+        # Only symbols still held are refreshed, once each
+        self.assertEqual(sorted(self.calls), ["AAPL", "GOOGL"])
+        self.assertEqual(self.store.get("GOOGL")["price"], 42.0)
+        self.assertIsNone(self.store.get("MSFT"))
+
+    def test_only_lease_holder_refreshes(self):
+        first = PriceRefresher(self.db, self.store, self.fetch, rate=1000)
+        second = PriceRefresher(self.db, self.store, self.fetch, rate=1000)
+
+        first.refresh_once()
+        self.assertEqual(second.refresh_once(), 0)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_start_and_stop(self):
+        refresher = PriceRefresher(self.db, self.store, self.fetch, interval=60, rate=1000)
+
+        refresher.start()
+        # Wait for the first round to finish
+        deadline = time.monotonic() + 5
+        while self.store.get("GOOGL") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        refresher.stop()
+
+        self.assertEqual(sorted(self.calls), ["AAPL", "GOOGL"])
+        self.assertFalse(refresher._thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import tests.support  # noqa: F401, must come before app
 from app import app
 
 from flask import session
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import patch
 from flask import Flask, session
+import tests.support  # noqa: F401, must come before app
 from app import app
 
 
@@ -19,7 +20,7 @@ class TestSell(unittest.TestCase):
 
         # Mock the database responses
         mock_execute_query.side_effect = [
-            [{"shares": 2}, {"shares": 3}],  # Response for the SELECT shares query
+            [{"shares": 5}],  # Response for the SELECT shares query
             [],  # Update user's cash
             [],  # Update transaction record
         ]
@@ -54,14 +55,14 @@ class TestSell(unittest.TestCase):
         # Check the response
         self.assertEqual(response.status_code, 400)  # Expecting a bad request response
 
-    @patch("app.db.execute_query")
-    def test_sell_get_request(self, mock_execute_query):
+    @patch("app.db.fetch_all")
+    def test_sell_get_request(self, mock_fetch_all):
         # Assume that the user is logged in with user_id 1
         with self.client.session_transaction() as sess:
             sess["user_id"] = 1
 
         # Mock the database response
-        mock_execute_query.return_value = [
+        mock_fetch_all.return_value = [
             {"symbol": "AAPL"},
             {"symbol": "GOOGL"},
         ]  # Response for the SELECT symbol query
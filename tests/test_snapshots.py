@@ -0,0 +1,141 @@
+import datetime
+import os
+import tempfile
+import unittest
+from db_module import Database
+from price_history import PriceHistory
+from snapshots import pending_users, performance, update_snapshots
+
+
+class TestSnapshots(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary database with one user
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash, cash) VALUES (?, ?, ?)",
+            "test_user",
+            "hashed_password",
+            1000.0,
+        )
+        self.history = PriceHistory(self.db, today=lambda: datetime.date(2024, 1, 3))
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def trade(self, symbol, price, shares, timestamp):
+        # Mirror execute_trade: record the trade and move the cash
+        with self.db.transaction():
+            self.db.execute_query(
+                "INSERT INTO transactions (user_id, symbol, price, shares, timestamp) "
+                "VALUES (1, ?, ?, ?, ?)",
+                symbol,
+                price,
+                shares,
+                timestamp,
+            )
+            self.db.execute_query(
+                "UPDATE users SET cash = cash - ? WHERE id = 1", round(price * shares, 2)
+            )
+
+    def series(self, **kwargs):
+        return [
+            (row["date"], row["cash"], row["market_value"])
+            for row in performance(self.db, 1, **kwargs)
+        ]
+
+    def test_daily_series(self):
+        self.trade("AAPL", 10.0, 10, "2024-01-01 15:00:00")
+        self.history.record("AAPL", "2024-01-02", 12.0)
+        self.trade("AAPL", 12.0, -5, "2024-01-03 15:00:00")
+
+        written = update_snapshots(self.db, today="2024-01-04", history=self.history)
+
+        # No close on the first day: carried at the trade price, then the
+        # last close carries forward
+        self.assertEqual(written, 4)
+        self.assertEqual(
+            self.series(),
+            [
+                ("2024-01-01", 900.0, 100.0),
+                ("2024-01-02", 900.0, 120.0),
+                ("2024-01-03", 960.0, 60.0),
+                ("2024-01-04", 960.0, 60.0),
+            ],
+        )
+        self.assertEqual(
+            self.series(start="2024-01-02", end="2024-01-03"),
+            [("2024-01-02", 900.0, 120.0), ("2024-01-03", 960.0, 60.0)],
+        )
+
+    def test_closes_filled_from_provider(self):
+        self.trade("AAPL", 10.0, 10, "2024-01-01 15:00:00")
+        self.trade("GOOGL", 50.0, 1, "2023-12-01 15:00:00")
+        self.trade("GOOGL", 50.0, -1, "2023-12-02 15:00:00")
+        requests = []
+
+        def fetch_history(symbol, start, end):
+            requests.append((symbol, str(start), str(end)))
+            return [("2024-01-02", 11.0, 12.0, 10.0, 12.0, 1000.0)]
+
+        update_snapshots(
+            self.db, today="2024-01-02", history=self.history, fetch_history=fetch_history
+        )
+
+        # Every symbol valued from the first stale day is downloaded once
+        self.assertEqual(
+            requests,
+            [("AAPL", "2023-12-01", "2024-01-02"), ("GOOGL", "2023-12-01", "2024-01-02")],
+        )
+        self.assertEqual(self.series()[-1], ("2024-01-02", 900.0, 120.0))
+
+        # Later runs skip symbols no longer held
+        requests.clear()
+        update_snapshots(
+            self.db, today="2024-01-03", history=self.history, fetch_history=fetch_history
+        )
+        self.assertEqual(requests, [("AAPL", "2024-01-03", "2024-01-03")])
+
+    def test_only_changed_days_are_recomputed(self):
+        self.trade("AAPL", 10.0, 10, "2024-01-01 15:00:00")
+        update_snapshots(self.db, today="2024-01-04", history=self.history)
+        self.assertEqual(pending_users(self.db, "2024-01-04"), {})
+
+        # A new day only adds that day
+        self.assertEqual(pending_users(self.db, "2024-01-05"), {1: "2024-01-05"})
+        self.assertEqual(update_snapshots(self.db, today="2024-01-05", history=self.history), 1)
+
+        # A late close recomputes from its date on
+        self.history.record_quote({"symbol": "AAPL", "price": 11.0})
+        self.assertEqual(pending_users(self.db, "2024-01-05"), {1: "2024-01-03"})
+        self.assertEqual(update_snapshots(self.db, today="2024-01-05", history=self.history), 3)
+        self.assertEqual(self.series()[-1], ("2024-01-05", 900.0, 110.0))
+
+        # Recording an unchanged close doesn't invalidate anything
+        self.history.record_quote({"symbol": "AAPL", "price": 11.0})
+        self.assertEqual(pending_users(self.db, "2024-01-05"), {})
+
+    def test_migration_marks_existing_history(self):
+        self.trade("AAPL", 10.0, 1, "2024-01-02 15:00:00")
+        self.db.execute_query("DELETE FROM snapshot_dirty")
+        with self.db.transaction() as connection:
+            connection.execute("PRAGMA user_version = 4")
+        self.db.migrate()
+
+        self.assertEqual(pending_users(self.db, "2024-01-04"), {1: "2024-01-02"})
+
+    def test_closes_carry_forward(self):
+        self.history.record("AAPL", "2024-01-01", 10.0)
+        self.history.record("AAPL", "2024-01-03", 12.0)
+        self.history.record("AAPL", "2024-01-06", 13.0)
+
+        self.assertEqual(
+            self.history.closes("AAPL", "2024-01-02", "2024-01-05"),
+            [("2024-01-01", 10.0), ("2024-01-03", 12.0)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
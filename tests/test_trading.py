@@ -0,0 +1,137 @@
+import os
+import tempfile
+import threading
+import unittest
+from db_module import Database
+from trading import TradeError, execute_batch, execute_trade
+
+
+class TestTrading(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary database with one user holding $1000
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path, pool_size=8)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash, cash) VALUES (?, ?, ?)",
+            "test_user",
+            "hashed_password",
+            1000.0,
+        )
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def cash(self):
+        return self.db.execute_query("SELECT cash FROM users WHERE id = 1")[0]["cash"]
+
+    def test_buy_and_sell(self):
+        execute_trade(self.db, 1, "AAPL", 100.0, 5)
+        execute_trade(self.db, 1, "AAPL", 120.0, -2)
+
+        self.assertEqual(self.cash(), 740.0)
+        rows = self.db.execute_query("SELECT shares FROM holdings WHERE user_id = 1")
+        self.assertEqual(rows, [{"shares": 3}])
+
+    def test_rejected_trade_rolls_back(self):
+        with self.assertRaises(TradeError):
+            execute_trade(self.db, 1, "AAPL", 100.0, 11)
+        with self.assertRaises(TradeError):
+            execute_trade(self.db, 1, "AAPL", 100.0, -1)
+
+        # Nothing was written
+        self.assertEqual(self.cash(), 1000.0)
+        self.assertEqual(self.db.execute_query("SELECT * FROM transactions"), [])
+
+    def test_concurrent_buys_never_overdraw(self):
+        results = []
+        barrier = threading.Barrier(20)
+
+        def worker():
+            barrier.wait()
+            try:
+                execute_trade(self.db, 1, "AAPL", 100.0, 1)
+                results.append("ok")
+            except TradeError as e:
+                results.append(e.message)
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Exactly the affordable number of buys went through
+        self.assertEqual(results.count("ok"), 10)
+        self.assertEqual(results.count("can't afford"), 10)
+        self.assertEqual(self.cash(), 0.0)
+        rows = self.db.execute_query("SELECT shares FROM holdings WHERE user_id = 1")
+        self.assertEqual(rows, [{"shares": 10}])
+
+    def test_concurrent_sells_never_oversell(self):
+        execute_trade(self.db, 1, "AAPL", 100.0, 5)
+        results = []
+        barrier = threading.Barrier(10)
+
+        def worker():
+            barrier.wait()
+            try:
+                execute_trade(self.db, 1, "AAPL", 100.0, -1)
+                results.append("ok")
+            except TradeError as e:
+                results.append(e.message)
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count("ok"), 5)
+        self.assertEqual(self.cash(), 1000.0)
+        rows = self.db.execute_query("SELECT shares FROM holdings WHERE user_id = 1")
+        self.assertEqual(rows, [{"shares": 0}])
+
+    def holdings(self):
+        query = "SELECT symbol, shares FROM holdings WHERE user_id = 1 ORDER BY symbol"
+        return [(row["symbol"], row["shares"]) for row in self.db.execute_query(query)]
+
+    def test_batch_sells_fund_buys(self):
+        execute_trade(self.db, 1, "AAPL", 100.0, 5)
+
+        # The GOOGL buy only fits once the AAPL sale is in
+        errors = execute_batch(self.db, 1, [("GOOGL", 200.0, 4), ("AAPL", 100.0, -5)])
+
+        self.assertEqual(errors, [None, None])
+        self.assertEqual(self.cash(), 200.0)
+        self.assertEqual(self.holdings(), [("AAPL", 0), ("GOOGL", 4)])
+
+    def test_batch_atomic(self):
+        orders = [("AAPL", 100.0, 5), ("GOOGL", 200.0, 3), ("MSFT", 10.0, -1)]
+
+        errors = execute_batch(self.db, 1, orders)
+
+        # The GOOGL buy is over budget after AAPL, and there's no MSFT to sell
+        self.assertEqual(
+            [error and error.message for error in errors], [None, "can't afford", "too many shares"]
+        )
+        self.assertEqual(self.cash(), 1000.0)
+        self.assertEqual(self.db.execute_query("SELECT * FROM transactions"), [])
+
+    def test_batch_best_effort(self):
+        orders = [("AAPL", 100.0, 5), ("GOOGL", 200.0, 3), ("MSFT", 10.0, 10)]
+
+        errors = execute_batch(self.db, 1, orders, atomic=False)
+
+        self.assertEqual([error is None for error in errors], [True, False, True])
+        self.assertEqual(self.cash(), 400.0)
+        self.assertEqual(self.holdings(), [("AAPL", 5), ("MSFT", 10)])
+
+    def test_batch_unknown_user(self):
+        with self.assertRaises(TradeError):
+            execute_batch(self.db, 2, [("AAPL", 100.0, 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from werkzeug.security import generate_password_hash
+from tests.support import FakeClock  # must come before app
+from app import app
+from db_module import Database
+from users import PasswordHasher, PasswordHasherBusy, UserCache
+
+
+class TestUserCache(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash, cash) VALUES ('test_user', 'hash', 1000.0)"
+        )
+        self.clock = FakeClock()
+        self.cache = UserCache(self.db, ttl=60, clock=self.clock)
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def set_cash(self, cash):
+        self.db.execute_query("UPDATE users SET cash = ? WHERE id = 1", cash)
+
+    def test_cached_until_invalidated(self):
+        self.assertEqual(self.cache.get(1), {"id": 1, "username": "test_user", "cash": 1000.0})
+
+        self.set_cash(500.0)
+        self.assertEqual(self.cache.get(1)["cash"], 1000.0)
+
+        version = self.cache.invalidate(1)
+        self.assertEqual(self.cache.get(1, version)["cash"], 500.0)
+        self.assertEqual(self.cache.stats(), {"size": 1, "hits": 1, "misses": 2})
+
+    def test_new_version_reloads(self):
+        # Another process updated the cash and gave the session a new version
+        self.cache.get(1)
+        self.set_cash(500.0)
+
+        self.assertEqual(self.cache.get(1, "v2")["cash"], 500.0)
+        self.assertEqual(self.cache.get(1, "v2")["cash"], 500.0)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_expires(self):
+        self.cache.get(1)
+        self.set_cash(500.0)
+        self.clock.now += 60
+
+        self.assertEqual(self.cache.get(1)["cash"], 500.0)
+
+    def test_unknown_user(self):
+        self.assertIsNone(self.cache.get(2))
+
+    def test_copies(self):
+        self.cache.get(1)["cash"] = 0
+        self.assertEqual(self.cache.get(1)["cash"], 1000.0)
+
+
+class TestPasswordHasher(unittest.TestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher("pbkdf2:sha256:1000", workers=2)
+
+    def test_verify(self):
+        password_hash = self.hasher.hash("secret")
+
+        self.assertTrue(password_hash.startswith("pbkdf2:sha256:1000$"))
+        self.assertEqual(self.hasher.verify(password_hash, "secret"), (True, None))
+        self.assertEqual(self.hasher.verify(password_hash, "wrong"), (False, None))
+
+    def test_rehash_on_new_parameters(self):
+        old_hash = generate_password_hash("secret", "pbkdf2:sha256:500")
+
+        matched, new_hash = self.hasher.verify(old_hash, "secret")
+
+        self.assertTrue(matched)
+        self.assertTrue(new_hash.startswith("pbkdf2:sha256:1000$"))
+        self.assertEqual(self.hasher.verify(new_hash, "secret"), (True, None))
+        # No upgrade for a wrong password
+        self.assertEqual(self.hasher.verify(old_hash, "wrong"), (False, None))
+
+    def test_busy(self):
+        hasher = PasswordHasher("pbkdf2:sha256:1000", workers=1, max_pending=1)
+        started, release = threading.Event(), threading.Event()
+
+        def slow(password):
+            started.set()
+            release.wait()
+            return password
+
+        thread = threading.Thread(target=hasher._run, args=(slow, "secret"))
+        thread.start()
+        started.wait()
+        try:
+            with self.assertRaises(PasswordHasherBusy):
+                hasher.hash("secret")
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(hasher.pending(), 0)
+
+
+class TestLogin(unittest.TestCase):
+    def setUp(self):
+        app.config["TESTING"] = True
+        app.config["SECRET_KEY"] = "test_secret_key"
+        self.client = app.test_client()
+
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db = Database(self.db_path)
+        self.db.execute_query(
+            "INSERT INTO users (username, hash) VALUES (?, ?)",
+            "test_user",
+            generate_password_hash("secret", "pbkdf2:sha256:500"),
+        )
+        patches = {
+            "app.db": self.db,
+            "app.user_cache": UserCache(self.db),
+            "app.password_hasher": PasswordHasher("pbkdf2:sha256:1000", workers=1),
+        }
+        for target, value in patches.items():
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.db.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def stored_hash(self):
+        return self.db.fetch_one("SELECT hash FROM users WHERE id = 1")["hash"]
+
+    def test_login_rehashes(self):
+        response = self.client.post("/login", data={"username": "test_user", "password": "secret"})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(self.stored_hash().startswith("pbkdf2:sha256:1000$"))
+
+        # The new hash works, and isn't replaced again
+        new_hash = self.stored_hash()
+        response = self.client.post("/login", data={"username": "test_user", "password": "secret"})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stored_hash(), new_hash)
+
+    def test_login_wrong_password(self):
+        old_hash = self.stored_hash()
+        response = self.client.post("/login", data={"username": "test_user", "password": "wrong"})
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.stored_hash(), old_hash)
+
+    def test_login_busy(self):
+        with patch("app.password_hasher.verify", side_effect=PasswordHasherBusy):
+            response = self.client.post(
+                "/login", data={"username": "test_user", "password": "secret"}
+            )
+
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+class TradeError(Exception):
+    """Raised when a trade is rejected."""
+
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def execute_trade(db, user_id, symbol, price, shares):
+    """
+    Buy (shares > 0) or sell (shares < 0) stock in a single transaction.
+
+    The balance or holding check, the transaction record and the cash update
+    commit together, so concurrent trades by one user can't overdraw.
+    """
+    amount = round(price * shares, 2)
+
+    with db.transaction():
+        if shares > 0:
+            # Check if the user can afford the stock
+            rows = db.execute_query("SELECT cash FROM users WHERE id = ?", user_id)
+            if not rows:
+                raise TradeError("Failed to retrieve user ID", 500)
+            if amount > rows[0]["cash"]:
+                raise TradeError("can't afford")
+        else:
+            # Check if the user owns enough shares of stock
+            query = "SELECT shares FROM holdings WHERE user_id = ? AND symbol = ?"
+            rows = db.execute_query(query, user_id, symbol)
+            shares_hold = rows[0]["shares"] if rows else 0
+            if shares_hold < -shares:
+                raise TradeError("too many shares")
+
+        # Update transaction record
+        query = "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (?, ?, ?, ?)"
+        db.execute_query(query, user_id, symbol, price, shares)
+
+        # Update user cash
+        query = "UPDATE users SET cash = cash - ? WHERE id = ?"
+        db.execute_query(query, amount, user_id)
+
+
+def execute_batch(db, user_id, orders, atomic=True):
+    """
+    Apply a basket of (symbol, price, shares) orders in one transaction.
+
+    Sells run before buys, so a basket's sales can fund its purchases, and
+    each order is checked against the cash and holdings left by those
+    before it. All accepted orders are inserted with one executemany and
+    cash is updated once. Returns a list, in input order, holding None for
+    each applied order and a TradeError for each rejected one. With
+    `atomic`, nothing is applied unless every order passes.
+    """
+    errors = [None] * len(orders)
+    # Stable sort: sells (negative shares) first, otherwise in input order
+    sequence = sorted(range(len(orders)), key=lambda i: orders[i][2] > 0)
+
+    with db.transaction() as connection:
+        row = connection.execute("SELECT cash FROM users WHERE id = ?", (user_id,)).fetchone()
+        if row is None:
+            raise TradeError("Failed to retrieve user ID", 500)
+        cash = row["cash"]
+        query = "SELECT symbol, shares FROM holdings WHERE user_id = ?"
+        held = {row["symbol"]: row["shares"] for row in connection.execute(query, (user_id,))}
+
+        accepted = []
+        total = 0.0
+        for i in sequence:
+            symbol, price, shares = orders[i]
+            amount = round(price * shares, 2)
+            if shares > 0 and amount > cash - total:
+                errors[i] = TradeError("can't afford")
+            elif shares < 0 and held.get(symbol, 0) < -shares:
+                errors[i] = TradeError("too many shares")
+            else:
+                held[symbol] = held.get(symbol, 0) + shares
+                total += amount
+                accepted.append(orders[i])
+
+        if not accepted or (atomic and any(errors)):
+            return errors
+
+        # Update transaction records
+        query = "INSERT INTO transactions (user_id, symbol, price, shares) VALUES (?, ?, ?, ?)"
+        connection.executemany(query, ((user_id, *order) for order in accepted))
+
+        # Update user cash
+        query = "UPDATE users SET cash = cash - ? WHERE id = ?"
+        connection.execute(query, (round(total, 2), user_id))
+
+    return errors
@@ -0,0 +1,144 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class UserCache:
+    """
+    In-process cache of user records (id, username, cash) keyed by user_id.
+
+    Each entry remembers the version it was loaded under. Callers pass the
+    version they last saw (kept in the user's session), so after a cash
+    update the new version from `invalidate` forces a reload in every
+    worker process that serves that session. Entries also expire after
+    `ttl` seconds, which bounds staleness for other sessions of the user.
+    """
+
+    def __init__(self, db, ttl=60.0, maxsize=10000, clock=time.monotonic):
+        self.db = db
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+
+        self._entries = OrderedDict()  # user_id -> (record, version, loaded_at)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, version=None):
+        """Return a copy of the user's record, or None if there's no such user."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if (
+                entry is not None
+                and entry[1] == version
+                and self.clock() - entry[2] < self.ttl
+            ):
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return dict(entry[0])
+            self.misses += 1
+
+        row = self.db.fetch_one("SELECT id, username, cash FROM users WHERE id = ?", user_id)
+        if row is None:
+            return None
+        record = {"id": row["id"], "username": row["username"], "cash": row["cash"]}
+        self.put(record, version)
+        return dict(record)
+
+    def put(self, record, version=None):
+        with self._lock:
+            self._entries[record["id"]] = (dict(record), version, self.clock())
+            self._entries.move_to_end(record["id"])
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Drop the user's record and return a new version for their session."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+        return secrets.token_hex(8)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hashes are already queued."""
+
+
+class PasswordHasher:
+    """
+    Hash and verify passwords on a bounded worker pool.
+
+    At most `workers` hashes run at once (hashlib releases the GIL while
+    hashing, so they use that many cores and leave the rest to request
+    threads). Once `max_pending` are queued or running, new calls raise
+    PasswordHasherBusy instead of queueing behind a login storm.
+
+    `method` is any werkzeug hash method, e.g. "pbkdf2:sha256:600000" or
+    "scrypt:32768:8:1". Hashes made with other parameters still verify and
+    `verify` returns a replacement made with the current ones.
+    """
+
+    def __init__(self, method="pbkdf2", workers=None, max_pending=64):
+        self.method = method
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1, thread_name_prefix="password"
+        )
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Hashes start with their method and parameters, defaults filled in
+        self._prefix = generate_password_hash("", method).split("$", 1)[0]
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split("$", 1)[0] != self._prefix
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PasswordHasherBusy("too many password checks in progress")
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future.result()
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """
+        Check password against password_hash.
+
+        Returns (matched, new_hash), where new_hash is the password hashed
+        with the current method when the stored hash uses other parameters,
+        else None.
+        """
+        return self._run(self._verify, password_hash, password)
+
+    def _verify(self, password_hash, password):
+        if not check_password_hash(password_hash, password):
+            return False, None
+        if self.needs_rehash(password_hash):
+            return True, generate_password_hash(password, self.method)
+        return True, None
+
+    def pending(self):
+        with self._lock:
+            return self._pending